@@ -4,6 +4,8 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
 from dotenv import load_dotenv
 
+from .utils import telemetry
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -34,6 +36,9 @@ Base = declarative_base()
 def get_db():
     db: Session = SessionLocal()
     try:
+        # check the connection out up front so pool contention shows up in telemetry
+        with telemetry.DB_POOL_WAIT_SECONDS.time():
+            db.connection()
         yield db
     finally:
         db.close()
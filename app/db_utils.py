@@ -1,11 +1,26 @@
 # app/db_utils.py
+from typing import Any, Dict, List
+
+from sqlalchemy import inspect, literal_column, select, text, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.exc import IntegrityError
 
+from .utils import telemetry
+
+# Bind-parameter budget per statement (Postgres allows 65535, SQLite >= 3.32 allows 32766)
+_MAX_PARAMS = {"postgresql": 60000, "sqlite": 30000}
+
+
 def upsert(session, model_instance):
     """
     Insert or update by primary key. Returns the instance.
     Works for single-column primary key (claim_id).
     """
+    with telemetry.DB_UPSERT_SECONDS.labels("upsert").time():
+        return _upsert(session, model_instance)
+
+
+def _upsert(session, model_instance):
     pk_cols = [c.name for c in model_instance.__table__.primary_key.columns]
     if len(pk_cols) != 1:
         # fallback, just try add
@@ -33,3 +48,100 @@ def upsert(session, model_instance):
         session.add(model_instance)
         session.flush()
         return model_instance
+
+
+def bulk_upsert(session, model, rows: List[Dict[str, Any]], batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Insert or update many rows by primary key with batched
+    INSERT ... ON CONFLICT (pk) DO UPDATE statements (Postgres and SQLite);
+    other dialects fall back to session.merge per row.
+    All rows must carry the same keys, including the primary key. Only the
+    given columns are updated on conflict. If a key repeats, the last row wins.
+    Does not commit. Returns {"inserted": n, "updated": m}.
+    """
+    with telemetry.DB_UPSERT_SECONDS.labels("bulk_upsert").time():
+        return _bulk_upsert(session, model, rows, batch_size)
+
+
+def _bulk_upsert(session, model, rows: List[Dict[str, Any]], batch_size: int) -> Dict[str, int]:
+    counts = {"inserted": 0, "updated": 0}
+    if not rows:
+        return counts
+    table = model.__table__
+    pk_cols = [c.name for c in table.primary_key.columns]
+    rows = list({tuple(r[k] for k in pk_cols): r for r in rows}.values())
+
+    dialect = session.get_bind().dialect.name
+    if dialect not in _MAX_PARAMS:
+        for row in rows:
+            existing = session.get(model, tuple(row[k] for k in pk_cols))
+            session.merge(model(**row))
+            counts["updated" if existing is not None else "inserted"] += 1
+        session.flush()
+        return counts
+
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    batch_size = max(1, min(batch_size, _MAX_PARAMS[dialect] // len(rows[0])))
+    update_cols = [k for k in rows[0] if k not in pk_cols]
+    pk_exprs = [table.c[k] for k in pk_cols]
+
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        stmt = insert(table).values(batch)
+        if update_cols:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=pk_cols,
+                set_={k: stmt.excluded[k] for k in update_cols}
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=pk_cols)
+
+        if dialect == "postgresql":
+            # xmax is 0 only for freshly inserted tuples -> one round trip per batch
+            flags = session.execute(stmt.returning(literal_column("(xmax = 0)"))).scalars().all()
+            inserted = sum(1 for f in flags if f)
+        else:
+            if len(pk_cols) == 1:
+                key_filter = pk_exprs[0].in_([r[pk_cols[0]] for r in batch])
+            else:
+                key_filter = tuple_(*pk_exprs).in_([tuple(r[k] for k in pk_cols) for r in batch])
+            existing = session.execute(select(*pk_exprs).where(key_filter)).all()
+            session.execute(stmt)
+            inserted = len(batch) - len(existing)
+        counts["inserted"] += inserted
+        counts["updated"] += len(batch) - inserted
+    return counts
+
+
+def _index_names(conn, table_name: str) -> set:
+    if conn.dialect.name == "sqlite":
+        # SQLite reflection skips expression indexes
+        return set(conn.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :t"), {"t": table_name}
+        ).scalars())
+    return {ix["name"] for ix in inspect(conn).get_indexes(table_name)}
+
+
+def ensure_schema(engine, metadata):
+    """
+    create_all plus the additive changes it skips on existing tables: missing
+    nullable columns are added with ALTER TABLE and missing indexes are created.
+    """
+    metadata.create_all(bind=engine)
+    existing_tables = set(inspect(engine).get_table_names())
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            have = {c["name"] for c in inspect(conn).get_columns(table.name)}
+            for col in table.columns:
+                if col.name in have or not col.nullable:
+                    continue
+                col_type = col.type.compile(dialect=conn.dialect)
+                print(f"[DB] Adding column {table.name}.{col.name}")
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}'))
+            indexes = _index_names(conn, table.name)
+            for index in table.indexes:
+                if index.name not in indexes:
+                    print(f"[DB] Creating index {index.name}")
+                    index.create(bind=conn)
@@ -1,6 +1,10 @@
 from fastapi import FastAPI
-from .db import engine, Base # Import engine and Base from your db.py
-from .routes import auth, admin, upload, claims, metrics
+from .db import engine, SessionLocal # Import engine from your db.py
+from .models import Base
+from .db_utils import ensure_schema
+from .pipeline.diagnoses import backfill_diagnoses
+from .routes import auth, admin, upload, claims, metrics, telemetry
+from .utils.telemetry import RequestTimer
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI(title="Mini RCM Validation Engine")
@@ -19,13 +23,20 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestTimer)
 
 # Add a startup event handler to create the database tables
 @app.on_event("startup")
 def create_database_tables():
-    # This will create all tables based on the Base and defined models.
-    # It will do nothing if the tables already exist.
-    Base.metadata.create_all(bind=engine)
+    # This will create all tables based on the Base and defined models,
+    # and add columns/indexes introduced since an existing table was created.
+    ensure_schema(engine, Base.metadata)
+    # claims stored before claim_diagnoses existed (those with codes but no rows)
+    db = SessionLocal()
+    try:
+        backfill_diagnoses(db)
+    finally:
+        db.close()
 
 # Routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Auth"])
@@ -33,6 +44,8 @@ app.include_router(upload.router, prefix="/api", tags=["Upload"])
 app.include_router(claims.router, prefix="/api", tags=["Claims"])
 app.include_router(metrics.router, prefix="/api", tags=["Metrics"])
 app.include_router(admin.router, prefix="/admin", tags=["Admin"])
+# Prometheus scrapes /metrics; /api/metrics stays the dashboard's claim metrics
+app.include_router(telemetry.router, tags=["Telemetry"])
 
 @app.get("/")
 def root():
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, Text, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, Text, JSON, ForeignKey, Index, func
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -20,6 +20,19 @@ class MasterClaim(Base):
     error_type = Column(String)
     error_explanation = Column(JSON, default=list)
     recommended_action = Column(Text)
+    tenant = Column(String, nullable=True)   # tenant of the upload that last wrote the claim
+    job_id = Column(String, nullable=True)   # validation job that owns the claim
+    content_hash = Column(String, nullable=True)   # hash of the submitted fields (ingest.claim_hash)
+
+    __table_args__ = (
+        Index("ix_master_claims_tenant_status", "tenant", "status"),
+        Index("ix_master_claims_job_id", "job_id"),
+        Index("ix_master_claims_facility_id", "facility_id"),
+        Index("ix_master_claims_service_code", "service_code"),
+        # codes as the rule evaluator compares them; used to find the claims a rule change affects
+        Index("ix_master_claims_service_code_norm", func.upper(func.trim(service_code))),
+        Index("ix_master_claims_facility_id_norm", func.upper(func.trim(facility_id))),
+    )
 
 class ClaimError(Base):
     __tablename__ = "claim_errors"
@@ -29,6 +42,23 @@ class ClaimError(Base):
     message = Column(Text)
     recommendation = Column(Text)
 
+    __table_args__ = (
+        # errors are replaced and read per chunk of claims
+        Index("ix_claim_errors_claim_id", "claim_id"),
+    )
+
+class ClaimDiagnosis(Base):
+    """Diagnosis codes of a claim, normalized at ingest (see pipeline/diagnoses.py)."""
+    __tablename__ = "claim_diagnoses"
+    claim_id = Column(String, ForeignKey("master_claims.claim_id"), primary_key=True)
+    code = Column(String, primary_key=True)   # uppercase, as the rule evaluator compares it
+    position = Column(Integer)                # order in the submitted list
+
+    __table_args__ = (
+        # "claims with code X" is an index-only scan
+        Index("ix_claim_diagnoses_code", "code", "claim_id"),
+    )
+
 class ClaimMetrics(Base):
     __tablename__ = "claim_metrics"
     id = Column(Integer, primary_key=True, autoincrement=True)
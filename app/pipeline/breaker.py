@@ -0,0 +1,97 @@
+# app/pipeline/breaker.py
+"""
+Circuit breaker for calls to a flaky dependency (the inference endpoint).
+
+Outcomes are kept in a rolling window in-process. When the window's error rate
+or mean latency crosses its threshold the breaker opens for `cooldown`
+seconds; while open, callers skip the dependency and use their fallback. The
+open-until time is also written to Redis (best effort), so every worker
+process backs off, not just the one that saw the failures.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+from .cache import redis_connection
+
+BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))            # outcomes considered
+BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))       # before the breaker may trip
+BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_LATENCY = float(os.getenv("LLM_BREAKER_LATENCY", "10"))        # mean seconds per call
+BREAKER_COOLDOWN = int(os.getenv("LLM_BREAKER_COOLDOWN", "60"))        # seconds open before retrying
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, window: int = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 error_rate: float = BREAKER_ERROR_RATE, latency: float = BREAKER_LATENCY,
+                 cooldown: int = BREAKER_COOLDOWN, use_redis: bool = True):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.latency = latency
+        self.cooldown = cooldown
+        self.use_redis = use_redis
+        self._outcomes: deque = deque(maxlen=window)   # (ok, seconds)
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+        self.trips = 0
+
+    def _redis_key(self) -> str:
+        return f"rcm:breaker:{self.name}:open_until"
+
+    def allow(self, shared: bool = True) -> bool:
+        """
+        False while the breaker is open. With shared=True the Redis key is also
+        consulted, so a breaker opened by another worker counts too.
+        """
+        now = time.time()
+        with self._lock:
+            if now < self._open_until:
+                return False
+        if shared and self.use_redis:
+            conn = redis_connection()
+            try:
+                raw = conn.get(self._redis_key()) if conn is not None else None
+            except Exception:
+                raw = None
+            if raw is not None and now < float(raw):
+                with self._lock:
+                    self._open_until = float(raw)
+                return False
+        return True
+
+    def record(self, ok: bool, seconds: float) -> None:
+        with self._lock:
+            self._outcomes.append((ok, seconds))
+            n = len(self._outcomes)
+            if n < self.min_calls:
+                return
+            failures = sum(1 for good, _ in self._outcomes if not good)
+            mean_latency = sum(s for _, s in self._outcomes) / n
+            if failures / n < self.error_rate and mean_latency < self.latency:
+                return
+            # trip: start a fresh window once the cooldown is over (half-open)
+            self._open_until = time.time() + self.cooldown
+            self._outcomes.clear()
+            self.trips += 1
+            open_until = self._open_until
+        print(f"[Breaker] {self.name} open for {self.cooldown}s "
+              f"(error rate {failures / n:.0%}, mean latency {mean_latency:.1f}s)")
+        if self.use_redis:
+            conn = redis_connection()
+            try:
+                if conn is not None:
+                    conn.set(self._redis_key(), str(open_until), ex=self.cooldown)
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "open": time.time() < self._open_until,
+                "trips": self.trips,
+                "window": len(self._outcomes),
+            }
@@ -0,0 +1,110 @@
+# app/pipeline/cache.py
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# The in-process tier does not outlive a job, so the shared Redis tier is on
+# whenever the queue's Redis is configured (REDIS_URL). CACHE_REDIS=0/1 overrides.
+_cache_redis = os.getenv("CACHE_REDIS")
+CACHE_REDIS = (_cache_redis.lower() in {"1", "true", "yes"}) if _cache_redis is not None \
+    else bool(os.getenv("REDIS_URL"))
+# after a Redis error the tier is skipped for this long instead of failing every lookup
+REDIS_RETRY_SECONDS = 60
+
+
+def redis_connection():
+    """Redis connection of the job queue, or None when Redis is unreachable/unconfigured."""
+    try:
+        from .queue import redis_conn
+        return redis_conn
+    except Exception:
+        return None
+
+
+class TieredCache:
+    """
+    Small two-tier cache: an in-process LRU in front of an optional Redis tier.
+    Values in the Redis tier must be JSON-serializable; Redis errors are
+    treated as misses so the cache never breaks the caller.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: Optional[int] = None, use_redis: Optional[bool] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.use_redis = CACHE_REDIS if use_redis is None else use_redis
+        self._local: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis_down_until = 0.0
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _redis_key(self, key: str) -> str:
+        return f"rcm:cache:{self.name}:{key}"
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key in self._local:
+                self._local.move_to_end(key)
+                self.hits += 1
+                return self._local[key]
+        conn = self._shared()
+        if conn is not None:
+            try:
+                raw = conn.get(self._redis_key(key))
+            except Exception as e:
+                self._redis_failed(e)
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self._store_local(key, value)
+                with self._lock:
+                    self.redis_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        self._store_local(key, value)
+        conn = self._shared()
+        if conn is not None:
+            try:
+                conn.set(self._redis_key(key), json.dumps(value), ex=self.ttl)
+            except Exception as e:
+                self._redis_failed(e)
+
+    def _shared(self):
+        """Redis connection for the shared tier, or None (disabled, unconfigured or recently failing)."""
+        if not self.use_redis or time.monotonic() < self._redis_down_until:
+            return None
+        return redis_connection()
+
+    def _redis_failed(self, e: Exception) -> None:
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+        print(f"[Cache] {self.name}: Redis tier unavailable (skipped for {REDIS_RETRY_SECONDS}s): {e}")
+
+    def _store_local(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._local[key] = value
+            self._local.move_to_end(key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._local.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "size": len(self._local),
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,82 @@
+# app/pipeline/diagnoses.py
+"""
+Normalized diagnosis codes.
+
+master_claims.diagnosis_codes keeps the submitted ';'-joined string (it is part
+of the claim's content hash and of the exports). Ingestion also writes one
+claim_diagnoses row per distinct code, parsed exactly as the rule evaluator
+parses them, so "claims with diagnosis X" is an index scan on
+ix_claim_diagnoses_code instead of a LIKE over every claim.
+
+Claims stored before the table existed are backfilled at startup: every claim
+with codes but no claim_diagnoses rows gets them, whether or not a worker has
+already ingested newer files into the table.
+"""
+import os
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import delete, exists, insert, select
+from sqlalchemy.orm import Session
+
+from .. import models
+from .static_eval import parse_diagnoses
+
+BACKFILL_BATCH_SIZE = int(os.getenv("DIAGNOSIS_BACKFILL_BATCH_SIZE", "5000"))
+
+
+def diagnosis_rows(claims: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """claim_diagnoses rows for claim dicts (claim_id, diagnosis_codes); a repeated claim_id keeps its last row."""
+    by_id = {c["claim_id"]: c.get("diagnosis_codes") for c in claims}
+    return [
+        {"claim_id": claim_id, "code": code, "position": pos}
+        for claim_id, raw in by_id.items()
+        for pos, code in enumerate(dict.fromkeys(parse_diagnoses(raw)))
+    ]
+
+
+def replace_diagnoses(db: Session, claims: List[Dict[str, Any]]):
+    """Rewrite the claim_diagnoses rows of the given claims. Does not commit."""
+    if not claims:
+        return
+    db.execute(delete(models.ClaimDiagnosis).where(
+        models.ClaimDiagnosis.claim_id.in_([c["claim_id"] for c in claims])))
+    rows = diagnosis_rows(claims)
+    if rows:
+        db.execute(insert(models.ClaimDiagnosis), rows)
+
+
+def with_diagnosis(codes: Iterable[str]):
+    """WHERE clause: master_claims having any of `codes` (uppercase)."""
+    return models.MasterClaim.claim_id.in_(
+        select(models.ClaimDiagnosis.claim_id).where(models.ClaimDiagnosis.code.in_(list(codes)))
+    )
+
+
+def backfill_diagnoses(db: Session, batch_size: int = None) -> int:
+    """
+    Write claim_diagnoses rows for the claims that have codes but no rows yet,
+    in committed keyset batches. Claims ingested since the table existed
+    already have rows and are skipped. Returns the number of claims read.
+    """
+    batch_size = batch_size or BACKFILL_BATCH_SIZE
+    claim = models.MasterClaim
+    has_rows = exists().where(models.ClaimDiagnosis.claim_id == claim.claim_id)
+    last_id, seen = None, 0
+    while True:
+        stmt = (select(claim.claim_id, claim.diagnosis_codes)
+                .where(claim.diagnosis_codes.isnot(None), claim.diagnosis_codes != "", ~has_rows)
+                .order_by(claim.claim_id).limit(batch_size))
+        if last_id is not None:
+            stmt = stmt.where(claim.claim_id > last_id)
+        batch = [dict(row._mapping) for row in db.execute(stmt)]
+        if not batch:
+            break
+        rows = diagnosis_rows(batch)
+        if rows:
+            db.execute(insert(models.ClaimDiagnosis), rows)
+        db.commit()
+        seen += len(batch)
+        last_id = batch[-1]["claim_id"]
+    if seen:
+        print(f"[DB] Backfilled claim_diagnoses for {seen} claims.")
+    return seen
@@ -0,0 +1,127 @@
+# app/pipeline/enrichment.py
+"""
+Second pipeline stage: LLM explanations for claims whose static results are
+already committed. The worker enqueues one enrichment job per committed chunk
+of failing claims on the low-priority "enrichment" queue; each job rewrites
+the stored error messages with the model's explanation merged in. When the
+LLM is unavailable (no key, breaker open) the static messages stay as they are.
+"""
+import os
+from typing import Any, Dict, List
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from ..db import SessionLocal
+from .. import models
+from .llm_client import explain_many, explanation_cache, llm_breaker, llm_enabled
+from .progress import JobProgress
+from ..utils import telemetry
+
+ENRICHMENT_JOB_TIMEOUT = int(os.getenv("ENRICHMENT_JOB_TIMEOUT", "1800"))
+
+LLM_MARKER = " | LLM says: "
+
+_CONTEXT_COLUMNS = [
+    models.MasterClaim.claim_id,
+    models.MasterClaim.service_code,
+    models.MasterClaim.diagnosis_codes,
+    models.MasterClaim.paid_amount_aed,
+    models.MasterClaim.approval_number,
+]
+
+
+def merge_explanation(message: str, bullet: str) -> str:
+    if not bullet or bullet == message or LLM_MARKER in message:
+        return message
+    return f"{message}{LLM_MARKER}{bullet}"
+
+
+def _load(db: Session, claim_ids: List[str]):
+    """(claim context dicts, claim_id -> ordered claim_errors rows) for the claims still failing."""
+    claims = {
+        row["claim_id"]: row
+        for row in db.execute(
+            select(*_CONTEXT_COLUMNS).where(
+                models.MasterClaim.claim_id.in_(claim_ids),
+                models.MasterClaim.status == "Not validated",
+            )
+        ).mappings()
+    }
+    errors: Dict[str, List[Dict[str, Any]]] = {}
+    rows = db.execute(
+        select(models.ClaimError.id, models.ClaimError.claim_id, models.ClaimError.rule_id,
+               models.ClaimError.message, models.ClaimError.recommendation)
+        .where(models.ClaimError.claim_id.in_(list(claims)))
+        .order_by(models.ClaimError.claim_id, models.ClaimError.id)
+    ).mappings()
+    for row in rows:
+        errors.setdefault(row["claim_id"], []).append(dict(row))
+    return claims, errors
+
+
+def run_enrichment(job_id: str, claim_ids: List[str]):
+    """Merge LLM explanations into the stored errors of `claim_ids` (one worker chunk)."""
+    if not llm_enabled() or not llm_breaker.allow():
+        print(f"[Enrichment] Skipping {len(claim_ids)} claims of job {job_id}: LLM unavailable.")
+        return {"job_id": job_id, "enriched": 0, "skipped": len(claim_ids)}
+
+    db: Session = SessionLocal()
+    progress = JobProgress(job_id)
+    try:
+        claims, errors = _load(db, claim_ids)
+        items, owners = [], []
+        for claim_id, errs in errors.items():
+            if all(LLM_MARKER in e["message"] for e in errs):
+                continue  # already enriched
+            claim = dict(claims[claim_id])
+            claim["diagnosis_codes"] = (claim["diagnosis_codes"] or "").split(";")
+            items.append((claim, errs))
+            owners.append(claim_id)
+
+        with progress.stage("llm_enrichment"):
+            explanations = explain_many(items)
+
+        error_updates, claim_updates = [], []
+        for claim_id, (_, errs), llm in zip(owners, items, explanations):
+            bullets = llm.get("bullets") or []
+            merged = [merge_explanation(e["message"], b) for e, b in zip(errs, bullets)]
+            merged += [e["message"] for e in errs[len(merged):]]
+            if merged == [e["message"] for e in errs]:
+                continue
+            error_updates += [{"id": e["id"], "message": m} for e, m in zip(errs, merged) if m != e["message"]]
+            claim_updates.append({"claim_id": claim_id, "error_explanation": merged})
+
+        if claim_updates:
+            with progress.stage("db_write"):
+                db.execute(update(models.ClaimError), error_updates)
+                db.execute(update(models.MasterClaim), claim_updates)
+                with telemetry.DB_COMMIT_SECONDS.labels("enrichment").time():
+                    db.commit()
+        progress.incr(enriched=len(claim_updates))
+        stats = explanation_cache.stats()
+        print(f"[Enrichment] Job {job_id}: enriched {len(claim_updates)} of {len(claim_ids)} claims "
+              f"(explanation cache: {stats['hits']} hits, {stats['redis_hits']} redis hits, {stats['misses']} misses).")
+        return {"job_id": job_id, "enriched": len(claim_updates), "skipped": len(claim_ids) - len(claim_updates)}
+    except Exception as e:
+        from .worker import _set_meta  # worker imports this module
+        db.rollback()
+        _set_meta(stage="failed", error=str(e))
+        print(f"[Enrichment] ERROR: {e}")
+        raise
+    finally:
+        progress.flush()
+        telemetry.push()
+        db.close()
+
+
+def enqueue_enrichment(job_id: str, claim_ids: List[str]):
+    """Queue LLM enrichment for a committed chunk; failures never affect validation."""
+    if not claim_ids or not llm_enabled():
+        return None
+    try:
+        from .queue import enrichment_queue
+        return enrichment_queue.enqueue(run_enrichment, job_id, claim_ids, job_timeout=ENRICHMENT_JOB_TIMEOUT)
+    except Exception as e:
+        print(f"[Enrichment] Could not enqueue enrichment for job {job_id}: {e}")
+        return None
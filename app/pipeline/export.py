@@ -0,0 +1,161 @@
+# app/pipeline/export.py
+"""
+Streaming export of validation results.
+
+master_claims is joined with claim_errors (one row per error, one row for a
+claim without errors) and read through a server-side cursor in chunks of
+EXPORT_CHUNK_SIZE rows. Each chunk is encoded and yielded straight away, so
+memory use is bounded by the chunk size and the first bytes go out before the
+query has finished.
+"""
+import csv
+import datetime
+import io
+import json
+import os
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .. import models
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+_claim = models.MasterClaim.__table__
+_error = models.ClaimError.__table__
+
+# error_explanation is left out: the per-error rows carry the same messages
+EXPORT_COLUMNS = [c.name for c in _claim.columns if c.name != "error_explanation"] + [
+    "rule_id", "error_message", "error_recommendation"
+]
+
+
+def _export_query(job_id: Optional[str], tenant: Optional[str]):
+    stmt = (
+        select(
+            *[c for c in _claim.columns if c.name != "error_explanation"],
+            _error.c.rule_id,
+            _error.c.message.label("error_message"),
+            _error.c.recommendation.label("error_recommendation"),
+        )
+        .select_from(_claim.outerjoin(_error, _error.c.claim_id == _claim.c.claim_id))
+        .order_by(_claim.c.claim_id, _error.c.id)
+    )
+    if job_id is not None:
+        stmt = stmt.where(_claim.c.job_id == job_id)
+    if tenant is not None:
+        stmt = stmt.where(_claim.c.tenant == tenant)
+    return stmt
+
+
+def iter_export_chunks(db: Session, job_id: Optional[str] = None, tenant: Optional[str] = None,
+                       chunk_size: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+    """Yield lists of export rows (dicts keyed by EXPORT_COLUMNS) from a server-side cursor."""
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    result = db.execute(
+        _export_query(job_id, tenant),
+        execution_options={"stream_results": True, "yield_per": chunk_size},
+    )
+    for partition in result.mappings().partitions():
+        yield [dict(row) for row in partition]
+
+
+def _json_default(v):
+    if isinstance(v, (datetime.date, datetime.datetime)):
+        return v.isoformat()
+    return str(v)
+
+
+def _csv_chunks(chunks: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    yield buf.getvalue().encode("utf-8")
+    for rows in chunks:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+
+
+def _ndjson_chunks(chunks: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(json.dumps(r, default=_json_default) + "\n" for r in rows).encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to the caller; tell() keeps the absolute offset."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._parts.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def take(self) -> bytes:
+        out, self._parts = b"".join(self._parts), []
+        return out
+
+
+def _parquet_chunks(chunks: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        (name, pa.date32() if name == "service_date" else pa.float64() if name == "paid_amount_aed" else pa.string())
+        for name in EXPORT_COLUMNS
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in chunks:
+            # one row group per chunk
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+_ENCODERS: Dict[str, Callable[[Iterator[List[Dict[str, Any]]]], Iterator[bytes]]] = {
+    "csv": _csv_chunks,
+    "ndjson": _ndjson_chunks,
+    "parquet": _parquet_chunks,
+}
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def stream_export(session_factory: Callable[[], Session], fmt: str, job_id: Optional[str] = None,
+                  tenant: Optional[str] = None) -> Iterator[bytes]:
+    """
+    Encoded export bytes for StreamingResponse. Opens its own session, since
+    the request's session is closed before a streamed body is sent.
+    """
+    db = session_factory()
+    try:
+        yield from _ENCODERS[fmt](iter_export_chunks(db, job_id, tenant))
+    finally:
+        db.close()
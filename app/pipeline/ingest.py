@@ -0,0 +1,262 @@
+# app/pipeline/ingest.py
+"""
+Streaming claims ingestion.
+
+Rows are read straight from the uploaded file (openpyxl read-only mode for
+workbooks, the csv module for CSV) and written to the database in fixed-size
+batches, so memory stays bounded by the batch size rather than the file size.
+The header row is validated before any claim is written.
+
+Each claim carries a hash of its submitted fields. Re-uploading a claim that
+was already validated with the same content (and tenant) leaves it untouched,
+status and errors included, so only new and modified claims go back to
+Pending and through validation.
+"""
+import csv
+import datetime
+import hashlib
+import io
+import os
+import uuid
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from openpyxl import load_workbook
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..db_utils import bulk_upsert
+from ..utils import telemetry
+from .diagnoses import replace_diagnoses
+from .metrics import apply_deltas, upsert_deltas
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+
+# Uploads are spooled here by the API and read back by the ingestion job;
+# API and workers must share this directory
+STAGING_DIR = os.getenv("STAGING_DIR", "app/staging")
+
+REQUIRED_COLUMNS = [
+    "claim_id", "encounter_type", "service_date", "national_id",
+    "member_id", "facility_id", "unique_id", "diagnosis_codes",
+    "service_code", "paid_amount_aed", "approval_number"
+]
+
+INSTRUCTION_SNIPPET = (
+    "Submission schema required: claim_id | encounter_type | service_date | national_id | "
+    "member_id | facility_id | unique_id | diagnosis_codes | service_code | paid_amount_aed | approval_number."
+)
+
+_STRING_COLUMNS = [
+    "encounter_type", "national_id", "member_id", "facility_id", "unique_id",
+    "diagnosis_codes", "service_code", "approval_number"
+]
+
+
+# claim_id prefix of the placeholder claim stored for a rejected upload
+SCHEMA_ERROR_PREFIX = "UPLOAD_SCHEMA_ERROR_"
+
+
+class ClaimsFileError(ValueError):
+    """The claims file could not be opened or read."""
+
+
+class SchemaError(ValueError):
+    """The header row is missing required columns."""
+
+    def __init__(self, missing_columns: List[str]):
+        super().__init__(f"Missing required columns: {', '.join(missing_columns)}")
+        self.missing_columns = missing_columns
+
+
+def _open_rows(fileobj: BinaryIO, filename: str) -> Iterator[tuple]:
+    """Iterate raw row tuples (header first) without loading the whole file."""
+    fileobj.seek(0)
+    if (filename or "").lower().endswith(".csv"):
+        text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+        try:
+            yield from (tuple(r) for r in csv.reader(text))
+        finally:
+            try:
+                text.detach()  # leave the upload's file object open for the caller
+            except ValueError:
+                pass
+        return
+    try:
+        wb = load_workbook(fileobj, read_only=True, data_only=True)
+    except Exception as e:
+        raise ClaimsFileError(str(e)) from e
+    try:
+        yield from wb.active.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _to_date(v) -> Optional[datetime.date]:
+    if v is None:
+        return None
+    if isinstance(v, datetime.datetime):
+        return v.date()
+    if isinstance(v, datetime.date):
+        return v
+    ts = pd.to_datetime(str(v), errors="coerce")
+    return None if pd.isna(ts) else ts.date()
+
+
+def _to_float(v) -> Optional[float]:
+    if v is None:
+        return None
+    try:
+        return float(str(v).replace(",", "")) if isinstance(v, str) else float(v)
+    except ValueError:
+        return None
+
+
+def _row_to_claim(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Map one raw row to MasterClaim column values (new claims start as Pending)."""
+    claim = {
+        "claim_id": str(row.get("claim_id") or f"auto_{uuid.uuid4()}"),
+        "service_date": _to_date(row.get("service_date")),
+        "paid_amount_aed": _to_float(row.get("paid_amount_aed")),
+        "status": "Pending",
+        "error_type": "",
+        "error_explanation": [],
+        "recommended_action": "",
+    }
+    for col in _STRING_COLUMNS:
+        v = row.get(col)
+        claim[col] = v if v is None or isinstance(v, str) else str(v)
+    return claim
+
+
+def claim_hash(claim: Dict[str, Any], tenant: Optional[str] = None) -> str:
+    """Hash of a claim's submitted fields (as stored) and its tenant."""
+    parts = ["" if claim.get(col) is None else str(claim[col]) for col in REQUIRED_COLUMNS]
+    parts.append(tenant or "")
+    return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _unchanged_ids(db: Session, batch: List[Dict[str, Any]]) -> set:
+    """Claims of the batch already validated with the same content hash."""
+    hashes = {c["claim_id"]: c["content_hash"] for c in batch}
+    rows = db.execute(
+        select(models.MasterClaim.claim_id, models.MasterClaim.content_hash)
+        .where(models.MasterClaim.claim_id.in_(list(hashes)),
+               models.MasterClaim.status.in_(("Validated", "Not validated")))
+    )
+    return {claim_id for claim_id, h in rows if h is not None and h == hashes[claim_id]}
+
+
+def iter_claim_batches(fileobj: BinaryIO, filename: str,
+                       batch_size: int = INGEST_BATCH_SIZE) -> Tuple[List[str], Iterator[List[Dict[str, Any]]]]:
+    """
+    Validate the header row and return (columns, batches) where batches yields
+    lists of at most `batch_size` MasterClaim column dicts.
+    Raises SchemaError if required columns are missing, ClaimsFileError if the
+    file cannot be read.
+    """
+    rows = _open_rows(fileobj, filename)
+    try:
+        header = next(rows)
+    except StopIteration:
+        header = ()
+    except ClaimsFileError:
+        raise
+    except Exception as e:
+        raise ClaimsFileError(str(e)) from e
+    columns = [str(c).strip().lower() if c is not None else "" for c in header]
+
+    auto_claim_id = "claim_id" not in columns
+    if auto_claim_id:
+        print("[Upload] claim_id missing -> auto-generated.")
+    missing_cols = [c for c in REQUIRED_COLUMNS if c not in columns and c != "claim_id"]
+    if missing_cols:
+        raise SchemaError(missing_cols)
+
+    def batches() -> Iterator[List[Dict[str, Any]]]:
+        batch = []
+        for i, values in enumerate(rows):
+            if values is None or all(v is None or v == "" for v in values):
+                continue
+            row = {c: (None if v == "" else v) for c, v in zip(columns, values) if c}
+            if auto_claim_id:
+                row["claim_id"] = f"AUTO_{i + 1}"
+            batch.append(_row_to_claim(row))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    return columns, batches()
+
+
+def ingest_claims(db: Session, fileobj: BinaryIO, filename: str,
+                  batch_size: int = INGEST_BATCH_SIZE, tenant: Optional[str] = None,
+                  job_id: Optional[str] = None,
+                  progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, int]:
+    """
+    Stream claims from the file into master_claims as Pending, one bulk upsert
+    and commit per batch; claim_diagnoses and claim_metrics are adjusted in the
+    same transaction.
+    Rows are stamped with `tenant` and `job_id` so the validation job only
+    picks up its own claims. Validated claims whose content hash is unchanged
+    are skipped and keep their status and errors. `progress` is called with
+    the running counts after every committed batch.
+    Returns {"inserted": n, "updated": m, "unchanged": k}.
+    """
+    _, batches = iter_claim_batches(fileobj, filename, batch_size)
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    for batch in batches:
+        for claim in batch:
+            claim["tenant"] = tenant
+            claim["job_id"] = job_id
+            claim["content_hash"] = claim_hash(claim, tenant)
+        unchanged = _unchanged_ids(db, batch)
+        if unchanged:
+            counts["unchanged"] += len(unchanged)
+            batch = [c for c in batch if c["claim_id"] not in unchanged]
+        if not batch:
+            if progress is not None:
+                progress(counts)
+            continue
+        deltas = upsert_deltas(db, batch)
+        for key, n in bulk_upsert(db, models.MasterClaim, batch, batch_size).items():
+            counts[key] += n
+        replace_diagnoses(db, batch)
+        apply_deltas(db, deltas)
+        with telemetry.DB_COMMIT_SECONDS.labels("ingest").time():
+            db.commit()
+        if progress is not None:
+            progress(counts)
+    return counts
+
+
+def record_schema_error(db: Session, missing_cols: List[str], tenant: Optional[str], job_id: str):
+    """Store a placeholder claim describing the missing columns, so the upload shows up in the results."""
+    placeholder_id = f"{SCHEMA_ERROR_PREFIX}{job_id}"
+    explanation = [f"Missing required columns: {', '.join(missing_cols)}", INSTRUCTION_SNIPPET]
+    placeholder = dict(
+        claim_id=placeholder_id,
+        encounter_type=None,
+        service_date=None,
+        national_id=None,
+        member_id=None,
+        facility_id=None,
+        unique_id=None,
+        diagnosis_codes=None,
+        service_code=None,
+        paid_amount_aed=None,
+        approval_number=None,
+        status="Not validated",
+        error_type="Technical error",
+        error_explanation=explanation,
+        recommended_action=f"Add missing columns: {', '.join(missing_cols)}. {INSTRUCTION_SNIPPET}",
+        tenant=tenant,
+        job_id=job_id
+    )
+    deltas = upsert_deltas(db, [placeholder])
+    bulk_upsert(db, models.MasterClaim, [placeholder])
+    apply_deltas(db, deltas)
+    db.commit()
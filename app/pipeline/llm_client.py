@@ -1,12 +1,69 @@
 # app/pipeline/llm_client.py
+import asyncio
+import hashlib
+import json
 import os
-import requests
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from .breaker import CircuitBreaker
+from .cache import TieredCache
+from ..utils import telemetry
 
 HF_API_KEY = os.getenv("HF_INFERENCE_API_KEY")
 HF_MODEL = os.getenv("HF_MODEL", "google/flan-t5-small")
 HF_URL = f"https://api-inference.huggingface.co/models/{HF_MODEL}"
 HEADERS = {"Authorization": f"Bearer {HF_API_KEY}"} if HF_API_KEY else {}
 
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))      # in-flight inference calls
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))           # seconds per attempt
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "30"))         # seconds per request, retries included
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_BACKOFF = float(os.getenv("LLM_BACKOFF", "0.5"))          # base of the jittered exponential backoff
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "1"))        # claims per prompt (1 = one prompt per claim)
+
+_RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Explanations keyed by error signature; repeats across enrichment jobs come from the Redis tier
+explanation_cache = TieredCache(
+    "llm_explanations",
+    maxsize=int(os.getenv("LLM_CACHE_SIZE", "4096")),
+    ttl=int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600))),
+)
+
+# Skips inference (callers get the deterministic fallback) while the endpoint is failing or slow
+llm_breaker = CircuitBreaker("llm")
+
+
+def llm_enabled() -> bool:
+    return bool(HF_API_KEY)
+
+
+def explanation_signature(claim, errors) -> str:
+    """
+    Cache key for an explanation: the triggered rule ids plus the claim context
+    _build_prompt shows the model, normalized so claims failing the same way
+    share one entry. Messages are left out (they embed amounts and IDs, so no
+    two claims would match); amounts and approval numbers only count as present
+    or absent.
+    """
+    diagnoses = claim.get("diagnosis_codes") or []
+    if isinstance(diagnoses, str):
+        diagnoses = diagnoses.split(";")
+    signature = {
+        "model": HF_MODEL,
+        "rules": sorted(str(e["rule_id"]) for e in errors),
+        "service": str(claim.get("service_code") or "").strip().upper(),
+        "diagnoses": sorted({str(d).strip().upper() for d in diagnoses if str(d).strip()}),
+        "paid": claim.get("paid_amount_aed") is not None,
+        "approval": bool(str(claim.get("approval_number") or "").strip()),
+    }
+    return hashlib.sha256(json.dumps(signature, sort_keys=True).encode("utf-8")).hexdigest()
+
 def _build_prompt(claim, errors):
     bullets = "\n".join([f"- {e['message']}" for e in errors])
     prompt = f"""
@@ -23,26 +80,220 @@ Return JSON: {{ "bullets": ["...","..."], "recommendation": "..." }}
 """
     return prompt
 
+def _build_batch_prompt(items):
+    parts = []
+    for n, (claim, errors) in enumerate(items, 1):
+        bullets = "\n".join([f"  - {e['message']}" for e in errors])
+        parts.append(
+            f"Claim {n}: service_code={claim.get('service_code')}, diagnosis_codes={claim.get('diagnosis_codes')}, "
+            f"paid_amount={claim.get('paid_amount_aed')}, approval_number={claim.get('approval_number')}\n"
+            f"  Triggered errors:\n{bullets}"
+        )
+    claims_text = "\n".join(parts)
+    prompt = f"""
+You are a claims adjudication assistant. For each claim below (sensitive IDs masked):
+1) For each triggered error, output one short bullet explaining why it happened (plain English).
+2) Provide one concise recommended action to fix the claim.
+
+{claims_text}
+
+Return a JSON list with one entry per claim, in order: [{{ "bullets": ["...","..."], "recommendation": "..." }}, ...]
+"""
+    return prompt
+
+def _fallback(errors):
+    # deterministic explanation built from the rule output itself
+    return {
+        "bullets": [e["message"] for e in errors],
+        "recommendation": "; ".join({e["recommendation"] for e in errors})
+    }
+
+def _parse_output(output, errors):
+    # HF sometimes returns [{"generated_text": "..."}]
+    if isinstance(output, list) and output and "generated_text" in output[0]:
+        text = output[0]["generated_text"]
+        # naive attempt: split into bullets by newline
+        bullets = [l.strip("- ").strip() for l in text.splitlines() if l.strip()]
+        return {"bullets": bullets or [e["message"] for e in errors],
+                "recommendation": bullets[-1] if bullets else "; ".join({e["recommendation"] for e in errors})}
+    return _fallback(errors)
+
+def _parse_batch_output(output, items):
+    """One explanation per item; items the model did not answer for get the fallback."""
+    entries = []
+    if isinstance(output, list) and output and "generated_text" in output[0]:
+        text = output[0]["generated_text"]
+        try:
+            start, end = text.index("["), text.rindex("]") + 1
+            entries = json.loads(text[start:end])
+        except ValueError:
+            entries = []
+    results = []
+    for n, (_, errors) in enumerate(items):
+        entry = entries[n] if n < len(entries) and isinstance(entries[n], dict) else None
+        bullets = [str(b) for b in (entry or {}).get("bullets") or []]
+        if bullets:
+            results.append({"bullets": bullets,
+                            "recommendation": str(entry.get("recommendation") or _fallback(errors)["recommendation"])})
+        else:
+            results.append(_fallback(errors))
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Async client: one pooled connection set and one semaphore, living on a
+# background event loop so synchronous callers (the RQ worker) can share them
+# across chunks.
+# ---------------------------------------------------------------------------
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_client: Optional[httpx.AsyncClient] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-client", daemon=True).start()
+        return _loop
+
+
+def _get_client() -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+    # called on the background loop only
+    global _client, _semaphore
+    if _client is None:
+        _client = httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=httpx.Timeout(LLM_TIMEOUT),
+            limits=httpx.Limits(max_connections=LLM_CONCURRENCY, max_keepalive_connections=LLM_CONCURRENCY),
+        )
+        _semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+    return _client, _semaphore
+
+
+async def _post(prompt: str, max_new_tokens: int) -> Optional[Any]:
+    """
+    POST one prompt with retries (exponential backoff, full jitter) inside a
+    per-request deadline. Returns the decoded JSON, or None on failure.
+    """
+    client, semaphore = _get_client()
+    payload = {"inputs": prompt, "parameters": {"max_new_tokens": max_new_tokens}}
+    deadline = time.monotonic() + LLM_DEADLINE
+    for attempt in range(LLM_RETRIES + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            telemetry.LLM_FAILURES.labels("deadline").inc()
+            return None
+        if not llm_breaker.allow(shared=False):
+            telemetry.LLM_FAILURES.labels("breaker_open").inc()
+            return None
+        started = time.monotonic()
+        try:
+            async with semaphore:
+                resp = await asyncio.wait_for(client.post(HF_URL, json=payload), timeout=min(LLM_TIMEOUT, remaining))
+            elapsed = time.monotonic() - started
+            llm_breaker.record(resp.status_code == 200, elapsed)
+            if resp.status_code == 200:
+                telemetry.LLM_REQUEST_SECONDS.labels("ok").observe(elapsed)
+                return resp.json()
+            telemetry.LLM_REQUEST_SECONDS.labels("error").observe(elapsed)
+            telemetry.LLM_FAILURES.labels(f"http_{resp.status_code}").inc()
+            if resp.status_code not in _RETRY_STATUS:
+                return None
+        except (httpx.HTTPError, asyncio.TimeoutError, ValueError) as e:
+            elapsed = time.monotonic() - started
+            llm_breaker.record(False, elapsed)
+            telemetry.LLM_REQUEST_SECONDS.labels("error").observe(elapsed)
+            telemetry.LLM_FAILURES.labels("timeout" if isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException)) else "error").inc()
+        if attempt < LLM_RETRIES:
+            delay = random.uniform(0, LLM_BACKOFF * (2 ** attempt))
+            await asyncio.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+    return None
+
+
+async def _aexplain_one(claim, errors) -> Tuple[Dict[str, Any], bool]:
+    """(explanation, answered by the model)"""
+    output = await _post(_build_prompt(claim, errors), 120)
+    if output is None:
+        return _fallback(errors), False
+    explanation = _parse_output(output, errors)
+    return explanation, explanation != _fallback(errors)
+
+
+async def _aexplain_batch(items) -> List[Tuple[Dict[str, Any], bool]]:
+    output = await _post(_build_batch_prompt(items), 120 * len(items))
+    if output is None:
+        return [(_fallback(errors), False) for _, errors in items]
+    fallbacks = [_fallback(errors) for _, errors in items]
+    return [(r, r != fb) for r, fb in zip(_parse_batch_output(output, items), fallbacks)]
+
+
+async def _ainfer(items, batch_size: int) -> List[Tuple[Dict[str, Any], bool]]:
+    if batch_size == 1:
+        return list(await asyncio.gather(*(_aexplain_one(c, e) for c, e in items)))
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    results = await asyncio.gather(*(_aexplain_batch(b) for b in batches))
+    return [r for batch in results for r in batch]
+
+
+async def aexplain_many(items: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]],
+                        batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Explain many (claim, errors) pairs concurrently; results are in input order.
+    Each distinct error signature is sent to the model at most once, and only
+    model answers are cached (fallbacks are not, so an outage is not remembered).
+    """
+    if not HF_API_KEY:
+        return [_fallback(errors) for _, errors in items]
+    batch_size = max(1, batch_size or LLM_BATCH_SIZE)
+    if not llm_breaker.allow():
+        telemetry.LLM_FAILURES.labels("breaker_open").inc(len(items))
+        print("[LLM] Circuit breaker open; using rule text for this batch.")
+        return [_fallback(errors) for _, errors in items]
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    waiting: Dict[str, List[int]] = {}
+    for i, (claim, errors) in enumerate(items):
+        key = explanation_signature(claim, errors)
+        if key in waiting:
+            waiting[key].append(i)
+            continue
+        cached = explanation_cache.get(key)
+        if cached is not None:
+            results[i] = cached
+        else:
+            waiting[key] = [i]
+
+    keys = list(waiting)
+    answers = await _ainfer([items[waiting[k][0]] for k in keys], batch_size) if keys else []
+    for key, (explanation, answered) in zip(keys, answers):
+        if answered:
+            explanation_cache.set(key, explanation)
+        for i in waiting[key]:
+            results[i] = explanation
+    return results
+
+
+async def aexplain_with_llm(claim, errors) -> Dict[str, Any]:
+    return (await aexplain_many([(claim, errors)], batch_size=1))[0]
+
+
+def explain_many(items: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]],
+                 batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Synchronous entry point for the worker: runs aexplain_many on the shared client."""
+    if not items:
+        return []
+    if not HF_API_KEY:
+        return [_fallback(errors) for _, errors in items]
+    future = asyncio.run_coroutine_threadsafe(aexplain_many(items, batch_size), _background_loop())
+    return future.result()
+
+
 def explain_with_llm(claim, errors):
     # If no HF key, deterministic fallback
     if not HF_API_KEY:
-        return {
-            "bullets": [e["message"] for e in errors],
-            "recommendation": "; ".join({e["recommendation"] for e in errors})
-        }
-    try:
-        payload = {"inputs": _build_prompt(claim, errors), "parameters":{"max_new_tokens":120}}
-        resp = requests.post(HF_URL, headers=HEADERS, json=payload, timeout=20)
-        if resp.status_code == 200:
-            output = resp.json()
-            # HF sometimes returns [{"generated_text": "..."}]
-            if isinstance(output, list) and "generated_text" in output[0]:
-                text = output[0]["generated_text"]
-                # naive attempt: split into bullets by newline
-                bullets = [l.strip("- ").strip() for l in text.splitlines() if l.strip()]
-                return {"bullets": bullets or [e["message"] for e in errors],
-                        "recommendation": bullets[-1] if bullets else "; ".join({e["recommendation"] for e in errors})}
-        # fallback
-        return {"bullets": [e["message"] for e in errors], "recommendation": "; ".join({e["recommendation"] for e in errors})}
-    except Exception:
-        return {"bullets": [e["message"] for e in errors], "recommendation": "; ".join({e["recommendation"] for e in errors})}
+        return _fallback(errors)
+    return explain_many([(claim, errors)])[0]
@@ -0,0 +1,99 @@
+# app/pipeline/metrics.py
+"""
+Incrementally maintained claim_metrics.
+
+Every write path that moves claims between categories (ingest resets them to
+Pending, the worker validates them) collects count/paid deltas per category and
+applies them in the same transaction as the claim writes. The cost of keeping
+/api/metrics correct is then proportional to the claims a job touched, not to
+the size of master_claims. An empty claim_metrics table is bootstrapped with a
+single SQL GROUP BY over master_claims.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from .. import models
+
+# Pending claims have an empty error_type and are reported under "No error"
+NO_ERROR = "No error"
+
+Deltas = Dict[str, List[float]]  # category -> [count delta, paid delta]
+
+
+def category(error_type: Optional[str]) -> str:
+    return error_type or NO_ERROR
+
+
+def track(deltas: Deltas, error_type: Optional[str], paid: Optional[float], sign: int = 1) -> Deltas:
+    """Add (sign=1) or remove (sign=-1) one claim from its category."""
+    acc = deltas.setdefault(category(error_type), [0, 0.0])
+    acc[0] += sign
+    acc[1] += sign * (paid or 0.0)
+    return deltas
+
+
+def upsert_deltas(db: Session, rows: Iterable[Dict[str, Any]]) -> Deltas:
+    """
+    Deltas for writing `rows` over master_claims: claims already stored leave
+    their current category, every row enters its new one. Call before the upsert.
+    """
+    rows = list({r["claim_id"]: r for r in rows}.values())  # last duplicate wins, as in bulk_upsert
+    deltas: Deltas = {}
+    ids = [r["claim_id"] for r in rows]
+    if ids:
+        prior = db.execute(
+            select(models.MasterClaim.error_type, models.MasterClaim.paid_amount_aed)
+            .where(models.MasterClaim.claim_id.in_(ids))
+        )
+        for error_type, paid in prior:
+            track(deltas, error_type, paid, -1)
+    for r in rows:
+        track(deltas, r.get("error_type"), r.get("paid_amount_aed"))
+    return deltas
+
+
+def rebuild_metrics(db: Session):
+    """Recompute claim_metrics from master_claims with one GROUP BY. Does not commit."""
+    cat = func.coalesce(func.nullif(models.MasterClaim.error_type, ""), NO_ERROR)
+    db.execute(delete(models.ClaimMetrics))
+    db.execute(
+        insert(models.ClaimMetrics).from_select(
+            ["category", "count", "paid"],
+            select(cat, func.count(), func.coalesce(func.sum(models.MasterClaim.paid_amount_aed), 0.0))
+            .group_by(cat)
+        )
+    )
+
+
+def apply_deltas(db: Session, deltas: Deltas):
+    """
+    Apply category deltas to claim_metrics. Run after the claim writes and
+    before their commit; if claim_metrics has never been filled it is rebuilt
+    instead, which already reflects those writes. Does not commit.
+    """
+    if db.execute(select(models.ClaimMetrics.id).limit(1)).first() is None:
+        rebuild_metrics(db)
+        return
+    for cat, (count, paid) in deltas.items():
+        if not count and not paid:
+            continue
+        res = db.execute(
+            update(models.ClaimMetrics)
+            .where(models.ClaimMetrics.category == cat)
+            .values(count=models.ClaimMetrics.count + count, paid=models.ClaimMetrics.paid + paid)
+        )
+        if not res.rowcount:
+            db.execute(insert(models.ClaimMetrics).values(category=cat, count=count, paid=paid))
+    db.execute(delete(models.ClaimMetrics).where(models.ClaimMetrics.count <= 0))
+
+
+def read_metrics(db: Session) -> List[Dict[str, Any]]:
+    """Per-category totals (rows for the same category are summed)."""
+    rows = db.execute(
+        select(models.ClaimMetrics.category, func.sum(models.ClaimMetrics.count), func.sum(models.ClaimMetrics.paid))
+        .group_by(models.ClaimMetrics.category)
+        .order_by(models.ClaimMetrics.category)
+    )
+    return [{"category": cat, "count": int(count or 0), "paid": float(paid or 0.0)} for cat, count, paid in rows]
@@ -1,24 +1,141 @@
 # app/pipeline/parser.py
-import pdfplumber
-import re
+"""
+Rule extraction from payer policy PDFs.
+
+Pages are extracted in parallel: the page range is split into contiguous
+slices and each slice is extracted in a worker process (one pdfplumber open
+per slice). Small PDFs are extracted in-process, where a pool would cost more
+than it saves. Pages come back in order and the regexes run page by page over
+a sliding window: each window is the previous window's unscanned tail plus
+the next page, so a match that straddles a page break is still found, exactly
+once. Matches are limited to MATCH_SPAN characters past the end of a page.
+
+Results are cached by file hash in rule_cache.pdf_rules; bump
+rule_cache.PDF_PARSER_VERSION when the patterns change.
+"""
 import json
-from typing import List, Dict
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, Iterator, List, Pattern
 
-def extract_text(pdf_path: str) -> str:
-    text = ""
+import pdfplumber
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+MATCH_SPAN = 400   # characters a match may extend past the page it starts on
+
+_PAID_RE = re.compile(r'(?:paid(?: amount)?\s*(?:>\s*|greater than\s*)AED\s*([0-9,]+))', re.I)
+# DOTALL so "SRVxxxx ... requires approval" may wrap lines; bounded so it cannot run across the document
+_SERVICE_APPROVAL_RE = re.compile(
+    r'\b(SRV[0-9]{3,5})\b[\s\S]{0,%d}?(?:requires|require|needs)\s+(?:prior\s+approval|approval)' % (MATCH_SPAN // 2),
+    re.I)
+_SERVICE_DX_RE = re.compile(r'\b(SRV[0-9]{3,5})\b[^\n\r]{0,80}?(?:requires|requires diagnosis|requires dx)\s*([A-Z0-9.\s,]+)', re.I)
+_MUTUAL_RE = re.compile(r'([A-Z0-9.\s,]+?)\s+cannot co-?exist with\s+([A-Z0-9.\s,]+)', re.I)
+_DX_CODE_RE = re.compile(r'[A-Z]\d{1,2}\.?[0-9A-Z]*')
+
+
+# ---------------------------------------------------------------------------
+# Page extraction
+# ---------------------------------------------------------------------------
+
+def _extract_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    """Text of pages [start, stop); runs in a worker process."""
+    texts = []
     with pdfplumber.open(pdf_path) as pdf:
-        for p in pdf.pages:
-            t = p.extract_text()
-            if t:
-                text += t + "\n"
-    return text
+        for page in pdf.pages[start:stop]:
+            texts.append(page.extract_text() or "")
+            page.close()   # drop the page's parsed layout before the next one
+    return texts
 
-def tech_pdf_to_rules(pdf_path: str) -> List[Dict]:
-    text = extract_text(pdf_path)
+
+def _page_count(pdf_path: str) -> int:
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+
+def iter_pages(pdf_path: str, workers: int = None) -> Iterator[str]:
+    """Text of every page, in order; large PDFs are extracted across a process pool."""
+    workers = workers or PDF_WORKERS
+    pages = _page_count(pdf_path)
+    if workers <= 1 or pages < PDF_PARALLEL_MIN_PAGES:
+        yield from _extract_range(pdf_path, 0, pages)
+        return
+
+    # ~2 slices per worker balances uneven pages without reopening the file per page
+    step = -(-pages // (workers * 2))
+    starts = list(range(0, pages, step))
+    done = 0
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(starts))) as pool:
+            for texts in pool.map(_extract_range, [pdf_path] * len(starts), starts,
+                                  [min(s + step, pages) for s in starts]):
+                for text in texts:
+                    done += 1
+                    yield text
+    except (OSError, BrokenProcessPool) as e:
+        # no usable process pool (e.g. restricted sandboxes): finish in-process
+        print(f"[Rules] Parallel PDF extraction failed ({e}); extracting the rest of {pdf_path} in-process.")
+        yield from _extract_range(pdf_path, done, pages)
+
+
+def extract_text(pdf_path: str) -> str:
+    return "".join([t + "\n" for t in iter_pages(pdf_path) if t])
+
+
+# ---------------------------------------------------------------------------
+# Page-streamed matching
+# ---------------------------------------------------------------------------
+
+def scan_pages(pages: Iterable[str], patterns: List[Pattern], span: int = MATCH_SPAN) -> List[List["re.Match"]]:
+    """
+    Run every pattern over the pages (joined as extract_text joins them) one
+    window at a time; returns the matches of each pattern in document order,
+    the same ones a scan of the whole text finds for matches up to `span`
+    characters long. A window owns the text before its last `span` characters
+    (cut at whitespace); matches starting in that tail are left to the next
+    window, which begins with it. Each pattern resumes where its last match
+    ended, so a match overlapping the tail is not found again.
+    """
+    found: List[List[re.Match]] = [[] for _ in patterns]
+    resume = [0] * len(patterns)   # per pattern: offset in the current window to search from
+    carry = ""
+    for text in pages:
+        if not text:
+            continue
+        window = carry + text + "\n"
+        cut = len(window) - span
+        if cut > 0:
+            ws = max(window.rfind(" ", 0, cut), window.rfind("\n", 0, cut))
+            cut = ws + 1 if ws >= 0 else cut
+        else:
+            cut = 0
+        for i, pattern in enumerate(patterns):
+            end = resume[i]
+            for m in pattern.finditer(window, resume[i]):
+                if m.start() >= cut:
+                    break
+                found[i].append(m)
+                end = m.end()
+            resume[i] = max(0, end - cut)
+        carry = window[cut:]
+    if carry:
+        for i, pattern in enumerate(patterns):
+            found[i].extend(pattern.finditer(carry, resume[i]))
+    return found
+
+
+# ---------------------------------------------------------------------------
+# Rules
+# ---------------------------------------------------------------------------
+
+def tech_rules_from_pages(pages: Iterable[str]) -> List[Dict]:
     rules = []
+    paid_matches, service_matches = scan_pages(pages, [_PAID_RE, _SERVICE_APPROVAL_RE])
 
     # Example: find paid thresholds "AED 250", "AED 500" etc.
-    for m in re.finditer(r'(?:paid(?: amount)?\s*(?:>\s*|greater than\s*)AED\s*([0-9,]+))', text, re.I):
+    for m in paid_matches:
         val = int(m.group(1).replace(',', ''))
         rules.append({
             "rule_id": f"TECH_PAID_GT_{val}",
@@ -32,7 +149,7 @@ def tech_pdf_to_rules(pdf_path: str) -> List[Dict]:
         })
 
     # Example: find service codes like SRV1234
-    for m in re.finditer(r'\b(SRV[0-9]{3,5})\b.*?(?:requires|require|needs)\s+(?:prior\s+approval|approval)', text, re.I | re.S):
+    for m in service_matches:
         code = m.group(1)
         rules.append({
             "rule_id": f"TECH_{code}_REQUIRES_APPROVAL",
@@ -48,15 +165,16 @@ def tech_pdf_to_rules(pdf_path: str) -> List[Dict]:
     # If nothing found, return an empty list so existing default rules are used
     return rules
 
-def med_pdf_to_rules(pdf_path: str) -> List[Dict]:
-    text = extract_text(pdf_path)
+
+def med_rules_from_pages(pages: Iterable[str]) -> List[Dict]:
     rules = []
+    dx_matches, mutual_matches = scan_pages(pages, [_SERVICE_DX_RE, _MUTUAL_RE])
 
     # Example: service requiring diagnosis mapping (heuristic)
     # Look for patterns "Service SRVxxxx requires diagnosis E11.9"
-    for m in re.finditer(r'\b(SRV[0-9]{3,5})\b[^\n\r]{0,80}?(?:requires|requires diagnosis|requires dx)\s*([A-Z0-9.\s,]+)', text, re.I):
+    for m in dx_matches:
         svc = m.group(1)
-        dxs = re.findall(r'[A-Z]\d{1,2}\.?[0-9A-Z]*', m.group(2))
+        dxs = _DX_CODE_RE.findall(m.group(2))
         if dxs:
             rules.append({
                 "rule_id": f"MED_{svc}_REQUIRES_DX",
@@ -70,9 +188,9 @@ def med_pdf_to_rules(pdf_path: str) -> List[Dict]:
             })
 
     # Mutually exclusive diag heuristics — look for "cannot co-exist" phrases
-    for m in re.finditer(r'([A-Z0-9.\s,]+?)\s+cannot co-?exist with\s+([A-Z0-9.\s,]+)', text, re.I):
-        a = re.findall(r'[A-Z]\d{1,2}\.?[0-9A-Z]*', m.group(1))
-        b = re.findall(r'[A-Z]\d{1,2}\.?[0-9A-Z]*', m.group(2))
+    for m in mutual_matches:
+        a = _DX_CODE_RE.findall(m.group(1))
+        b = _DX_CODE_RE.findall(m.group(2))
         if a and b:
             rules.append({
                 "rule_id": f"MED_MUTUAL_{a[0]}_{b[0]}",
@@ -87,6 +205,15 @@ def med_pdf_to_rules(pdf_path: str) -> List[Dict]:
 
     return rules
 
+
+def tech_pdf_to_rules(pdf_path: str) -> List[Dict]:
+    return tech_rules_from_pages(iter_pages(pdf_path))
+
+
+def med_pdf_to_rules(pdf_path: str) -> List[Dict]:
+    return med_rules_from_pages(iter_pages(pdf_path))
+
+
 def pdf_to_rules(tech_path: str, med_path: str) -> Dict[str, List[Dict]]:
     tech_rules = tech_pdf_to_rules(tech_path) if tech_path.lower().endswith(".pdf") else []
     med_rules = med_pdf_to_rules(med_path) if med_path.lower().endswith(".pdf") else []
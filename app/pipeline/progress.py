@@ -0,0 +1,119 @@
+# app/pipeline/progress.py
+"""
+Structured per-job progress in Redis.
+
+Every stage of an upload (ingestion, validation shards, enrichment) adds to the
+same hash, rcm:progress:{job_id}:
+
+    total, ingested, processed, validated, not_validated, enriched  counters
+    stage:<name>                                                    seconds spent
+    started_at, updated_at                                          unix time
+
+Increments are buffered in-process and flushed once per chunk through a
+pipeline (HINCRBY / HINCRBYFLOAT), so shards running on different workers
+aggregate without coordination. Redis errors disable progress for that job
+instead of failing it.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from .cache import redis_connection
+
+PROGRESS_TTL = int(os.getenv("PROGRESS_TTL", str(7 * 24 * 3600)))
+
+STAGES = ("ingest", "load_rules", "fetch", "evaluate", "llm_enrichment", "db_write", "metrics")
+
+
+def progress_key(job_id: str) -> str:
+    return f"rcm:progress:{job_id}"
+
+
+class JobProgress:
+    def __init__(self, job_id: str, conn: Any = None):
+        self.job_id = job_id
+        self._conn = conn
+        self._enabled = True
+        self._counts: Dict[str, int] = {}
+        self._seconds: Dict[str, float] = {}
+        self._fields: Dict[str, Any] = {}
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = redis_connection()
+        return self._conn
+
+    def set(self, **fields) -> "JobProgress":
+        """Overwrite fields (e.g. total) on the next flush."""
+        self._fields.update(fields)
+        return self
+
+    def incr(self, **counts: int) -> "JobProgress":
+        for name, n in counts.items():
+            self._counts[name] = self._counts.get(name, 0) + n
+        return self
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block and add its duration to stage:<name>."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._seconds[name] = self._seconds.get(name, 0.0) + time.perf_counter() - started
+
+    def flush(self) -> None:
+        counts, seconds, fields = self._counts, self._seconds, self._fields
+        self._counts, self._seconds, self._fields = {}, {}, {}
+        conn = self._connection() if self._enabled else None
+        if conn is None:
+            return
+        key = progress_key(self.job_id)
+        now = time.time()
+        try:
+            pipe = conn.pipeline()
+            pipe.hsetnx(key, "started_at", now)
+            for name, n in counts.items():
+                pipe.hincrby(key, name, n)
+            for name, s in seconds.items():
+                pipe.hincrbyfloat(key, f"stage:{name}", s)
+            pipe.hset(key, mapping={**fields, "updated_at": now})
+            pipe.expire(key, PROGRESS_TTL)
+            pipe.execute()
+        except Exception as e:
+            self._enabled = False
+            print(f"[Progress] Disabled for job {self.job_id}: {e}")
+
+
+def _num(raw) -> float:
+    try:
+        return float(raw.decode() if isinstance(raw, bytes) else raw)
+    except (TypeError, ValueError, AttributeError):
+        return 0.0
+
+
+def read_progress(job_id: str, conn: Any = None) -> Optional[Dict[str, Any]]:
+    """Progress of a job as reported by /admin/job, or None if nothing was recorded."""
+    conn = conn if conn is not None else redis_connection()
+    if conn is None:
+        return None
+    try:
+        raw = conn.hgetall(progress_key(job_id))
+    except Exception:
+        return None
+    if not raw:
+        return None
+    data = {(k.decode() if isinstance(k, bytes) else k): _num(v) for k, v in raw.items()}
+
+    out: Dict[str, Any] = {
+        name: int(data.get(name, 0))
+        for name in ("total", "ingested", "processed", "validated", "not_validated", "enriched")
+    }
+    elapsed = data.get("updated_at", 0.0) - data.get("started_at", 0.0)
+    out["elapsed_seconds"] = round(max(elapsed, 0.0), 3)
+    out["rows_per_second"] = round(out["processed"] / elapsed, 1) if elapsed > 0 else None
+    out["stages"] = {
+        name[len("stage:"):]: round(seconds, 3) for name, seconds in data.items() if name.startswith("stage:")
+    }
+    return out
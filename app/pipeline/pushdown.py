@@ -0,0 +1,386 @@
+# app/pipeline/pushdown.py
+"""
+Set-based validation: the built-in rules of a RulePlan compiled to SQL.
+
+With VALIDATION_MODE=pushdown, a validation job does not read its claims into
+Python. The job's pending claims are normalized once into a temporary table,
+and each built-in check becomes one INSERT ... SELECT over it into a temporary
+error table. Those checks are ID formats, unique_id, the paid threshold,
+approval-required services and diagnoses, inpatient/outpatient-only services,
+the facility-type allow-list, required diagnoses and mutually exclusive
+diagnoses; the diagnosis checks read claim_diagnoses, written at ingest.
+Window aggregates over the error table then produce each claim's error_type,
+error_explanation and recommended_action, and set-based statements write
+claim_errors and master_claims.
+
+Declarative rules (rule_engine) are not pushed down. When the plan has any,
+the job's claims are read in chunks and only those rules run in Python, with
+their errors joining the same table.
+
+The statements reproduce RulePlan.evaluate: same rule ids, messages and error
+order. The one exception is recommended_action, whose parts come in rule order
+instead of set order. Postgres and SQLite (3.33+) only; other databases use
+the Python path.
+"""
+import sqlite3
+from functools import reduce
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import (JSON, Column, Float, Integer, MetaData, String, Table, Text, and_, case, cast,
+                        delete, exists, func, insert, literal, null, or_, select, type_coerce, update)
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..utils import telemetry
+from .enrichment import enqueue_enrichment
+from .metrics import NO_ERROR, Deltas, apply_deltas
+from .progress import JobProgress
+from .static_eval import _ID_FIELDS, _NULL_MARKERS, _UNIQUE_ID_RE, RulePlan
+from .worker import VALIDATION_CHUNK_SIZE, _evaluate_row, _iter_chunks, _job_scope
+
+SUPPORTED_DIALECTS = ("postgresql", "sqlite")
+
+_claims = models.MasterClaim.__table__
+_diagnoses = models.ClaimDiagnosis.__table__
+
+# the claim fields the built-in checks read, normalized
+_FACT_FIELDS = _ID_FIELDS[1:] + ("unique_id", "service_code", "encounter_type", "approval_number")
+
+# per-connection scratch tables; created and dropped inside the job's transaction
+_scratch = MetaData()
+# the job's claims, normalized once so each check is a plain scan
+_facts = Table(
+    "pushdown_claims", _scratch,
+    Column("claim_id", String, primary_key=True), Column("claim_ref", String),
+    *[Column(f, String) for f in _FACT_FIELDS], Column("paid_amount_aed", Float),
+    prefixes=["TEMPORARY"],
+)
+_errors = Table(
+    "pushdown_errors", _scratch,
+    Column("claim_id", String), Column("ord", Integer), Column("category", String),
+    Column("rule_id", String), Column("message", Text), Column("recommendation", Text),
+    prefixes=["TEMPORARY"],
+)
+_outcomes = Table(
+    "pushdown_outcomes", _scratch,
+    Column("claim_id", String, primary_key=True), Column("error_type", String),
+    Column("error_explanation", JSON), Column("recommended_action", Text),
+    prefixes=["TEMPORARY"],
+)
+
+
+def supported(db: Session) -> bool:
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite3.sqlite_version_info >= (3, 33)   # UPDATE ... FROM
+    return dialect in SUPPORTED_DIALECTS
+
+
+# ---------------------------------------------------------------------------
+# SQL versions of the evaluator's normalization
+# ---------------------------------------------------------------------------
+
+def _text(value):
+    return literal(value, Text) if isinstance(value, str) else type_coerce(value, Text)
+
+
+def _cat(*parts):
+    """parts joined with ||; NULL if any part is NULL."""
+    return reduce(lambda a, b: a.concat(_text(b)), parts[1:], _text(parts[0]))
+
+
+def _norm(column):
+    """_normalize_value: trimmed, NULL when empty or an n/a marker."""
+    s = func.trim(column)
+    return case((or_(s == "", func.upper(s).in_(sorted(_NULL_MARKERS))), null()), else_=s)
+
+
+def _float_text(column, dialect: str):
+    """str(float) as in the Python messages (5000.0, not 5000)."""
+    t = cast(column, Text)
+    if dialect == "sqlite":
+        return t
+    return case((t.regexp_match("^-?[0-9]+$"), t.concat(".0")), else_=t)
+
+
+def _has_code(codes):
+    return exists().where(_diagnoses.c.claim_id == _facts.c.claim_id, _diagnoses.c.code.in_(sorted(codes)))
+
+
+# ---------------------------------------------------------------------------
+# Compiling the plan
+# ---------------------------------------------------------------------------
+
+def _rule(ord_: int, category: str, rule_id, message, recommendation, *where) -> Dict[str, Any]:
+    return {"ord": ord_, "category": category, "rule_id": rule_id, "message": message,
+            "recommendation": recommendation, "where": where}
+
+
+def _template(ord_: int, err: Dict[str, Any], *where) -> Dict[str, Any]:
+    return _rule(ord_, err["category"], err["rule_id"], err["message"], err["recommendation"], *where)
+
+
+def compile_rules(plan: RulePlan, dialect: str) -> List[Dict[str, Any]]:
+    """
+    The plan's built-in checks as SQL over pushdown_claims (one dict per
+    INSERT ... SELECT), with the position `ord` their errors take in
+    RulePlan.evaluate's output.
+    """
+    c = _facts.c
+    cid, nid, mid, fid = c.claim_ref, c.national_id, c.member_id, c.facility_id
+    uid, svc_raw, enc, approval = c.unique_id, c.service_code, c.encounter_type, c.approval_number
+    svc = func.upper(svc_raw)
+    rules = []
+
+    if plan.technical_builtin:
+        # 1) ID formatting checks
+        for ord_, (field_name, value) in enumerate(zip(_ID_FIELDS, (cid, nid, mid, fid))):
+            rules.append(_template(ord_, plan._id_format_errors[field_name],
+                                   or_(value.is_(None), func.upper(value).regexp_match("[^A-Z0-9]"))))
+
+        # 2) unique_id structure and segment comparison
+        uid_up = func.upper(uid)
+        uid_ok = uid_up.regexp_match(f"^{_UNIQUE_ID_RE.pattern}$")
+        rules.append(_template(4, plan._uniqueid_missing, uid.is_(None)))
+        rules.append(_template(4, plan._uniqueid_format, uid.isnot(None), ~uid_ok))
+        expected = [
+            case((nid.isnot(None), func.upper(func.substr(nid, 1, 4)))),
+            case((func.length(mid) <= 4, func.upper(func.substr(_cat(mid, "XXXX"), 1, 4))),
+                 else_=func.upper(func.substr(mid, (func.length(mid) - 4) // 2 + 1, 4))),
+            case((fid.isnot(None), func.upper(
+                case((func.length(fid) > 4, func.substr(fid, func.length(fid) - 3)), else_=fid)))),
+        ]
+        parts = []
+        for n, (exp, start) in enumerate(zip(expected, (1, 6, 11)), start=1):
+            seg = func.substr(uid_up, start, 4)
+            parts.append(case((and_(exp.isnot(None), seg != exp),
+                               _cat(f"segment{n} expected ", exp, " but got ", seg))))
+        joined = func.substr(_cat(*[func.coalesce(_cat("; ", p), "") for p in parts]), 3)
+        rules.append(_rule(
+            4, "technical", "TECH_UNIQUEID_MISMATCH",
+            _cat("unique_id segments do not match underlying ID sources: ", joined),
+            "Rebuild unique_id using the specified segments from national_id, member_id and facility_id.",
+            uid.isnot(None), uid_ok, or_(*[p.isnot(None) for p in parts]),
+        ))
+
+        no_approval = or_(approval.is_(None), func.lower(approval) == "obtain approval")
+        # 3) Paid amount threshold
+        rules.append(_rule(
+            5, "technical", "TECH_PAID_THRESHOLD_APPROVAL",
+            _cat("Paid amount AED ", _float_text(c.paid_amount_aed, dialect),
+                 f" exceeds threshold AED {plan.paid_threshold} and no valid approval number present."),
+            "Obtain prior approval and include approval number in approval_number field.",
+            no_approval, c.paid_amount_aed > plan.paid_threshold,
+        ))
+        # 4) Service-based approval requirement
+        rules.append(_rule(
+            6, "technical", _cat("TECH_SERVICE_", svc_raw, "_REQUIRES_APPROVAL"),
+            _cat("Service ", svc_raw, " requires prior approval but no valid approval number was supplied."),
+            "Obtain and include prior approval number for this service.",
+            no_approval, svc.in_(sorted(plan.approval_services)),
+        ))
+        # 5) Diagnosis-based approval requirement (first listed matching diagnosis)
+        if plan.diag_approval:
+            first = (select(_diagnoses.c.code)
+                     .where(_diagnoses.c.claim_id == c.claim_id, _diagnoses.c.code.in_(sorted(plan.diag_approval)))
+                     .order_by(_diagnoses.c.position).limit(1).scalar_subquery())
+            rules.append(_rule(
+                7, "technical", _cat("TECH_DIAG_", first, "_REQUIRES_APPROVAL"),
+                _cat("Diagnosis ", first, " requires prior approval, but approval number missing."),
+                "Obtain and include prior approval number for claims with this diagnosis.",
+                no_approval, _has_code(plan.diag_approval),
+            ))
+
+    if plan.medical_builtin:
+        # 6) Encounter type constraints
+        for ord_, allowed, kind in ((8, plan.inpatient_only, "INPATIENT"), (9, plan.outpatient_only, "OUTPATIENT")):
+            rules.append(_rule(
+                ord_, "medical", _cat("MED_ENCOUNTER_", svc, f"_{kind}_ONLY"),
+                _cat("Service ", svc, f" is {kind.lower()}-only but claim encounter_type=",
+                     func.coalesce(enc, "None"), "."),
+                f"Verify encounter_type is {kind} for this service.",
+                svc.in_(sorted(allowed)), or_(enc.is_(None), func.upper(enc) != kind),
+            ))
+        # 7) Facility type constraints, one statement per facility type
+        by_type: Dict[Any, List[str]] = {}
+        for facility, fac_type in plan.facility_registry.items():
+            if fac_type:
+                by_type.setdefault(fac_type, []).append(facility)
+        for fac_type, facilities in sorted(by_type.items(), key=lambda kv: str(kv[0])):
+            rules.append(_rule(
+                10, "medical", _cat("MED_FACILITY_", svc, "_NOT_ALLOWED"),
+                _cat("Service ", svc, " is not allowed at facility ", fid, f" (type {fac_type})."),
+                _cat("Perform ", svc, f" at a facility type that supports it (current facility type: {fac_type})."),
+                fid.in_(sorted(facilities)), svc_raw.isnot(None),
+                svc.notin_(sorted(plan.facility_allowed.get(fac_type, frozenset()))),
+            ))
+        # 8) Service requires specific diagnosis
+        for code, (required, err) in plan.service_required_diag.items():
+            rules.append(_template(11, err, svc == code, ~_has_code(required)))
+        # 9) Mutually exclusive diagnosis checks
+        for n, (a_set, b_set, err) in enumerate(plan.mutual_exclusive):
+            rules.append(_template(12 + n, err, _has_code(a_set), _has_code(b_set)))
+    return rules
+
+
+def _declarative_plan(plan: RulePlan) -> Optional[RulePlan]:
+    """The plan's declarative rules alone (no built-in checks), or None if it has none."""
+    if not len(plan.engine):
+        return None
+    return RulePlan({"technical": plan.declarative["technical"], "medical": plan.declarative["medical"]})
+
+
+# ---------------------------------------------------------------------------
+# Running a job
+# ---------------------------------------------------------------------------
+
+def _collect_errors(db: Session, plan: RulePlan, scope: list, dialect: str, progress: JobProgress):
+    """Fill the scratch error table: pushed-down checks in SQL, declarative rules in Python."""
+    columns = ["claim_id", "ord", "category", "rule_id", "message", "recommendation"]
+    with progress.stage("pushdown"):
+        db.execute(insert(_facts).from_select(
+            ["claim_id", "claim_ref", *_FACT_FIELDS, "paid_amount_aed"],
+            select(_claims.c.claim_id, _norm(_claims.c.claim_id), *[_norm(_claims.c[f]) for f in _FACT_FIELDS],
+                   _claims.c.paid_amount_aed).where(*scope),
+        ))
+        for rule in compile_rules(plan, dialect):
+            db.execute(insert(_errors).from_select(columns, select(
+                _facts.c.claim_id, literal(rule["ord"]), literal(rule["category"]),
+                _text(rule["rule_id"]), _text(rule["message"]), _text(rule["recommendation"]),
+            ).where(*rule["where"])))
+
+    declarative = _declarative_plan(plan)
+    if declarative is None:
+        return
+    # declarative errors follow every built-in one, in engine order
+    base = 12 + (len(plan.mutual_exclusive) if plan.medical_builtin else 0)
+    chunks = _iter_chunks(db, scope)
+    while True:
+        with progress.stage("fetch"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        with progress.stage("evaluate"):
+            rows = [
+                {"claim_id": row["claim_id"], "ord": base + i, "category": err["category"],
+                 "rule_id": err["rule_id"], "message": err["message"], "recommendation": err["recommendation"]}
+                for row in chunk
+                for i, err in enumerate(_evaluate_row(declarative, row)[1])
+            ]
+        if rows:
+            db.execute(insert(_errors), rows)
+
+
+def _build_outcomes(db: Session, dialect: str):
+    """One _outcomes row per failing claim, aggregated from the scratch error table in rule order."""
+    e = _errors.c
+    json_agg = func.json_agg if dialect == "postgresql" else func.json_group_array
+    string_agg = func.string_agg if dialect == "postgresql" else func.group_concat
+
+    # a recommendation is kept where it first appears (aggregates skip the NULLs)
+    first_use = func.row_number().over(partition_by=(e.claim_id, e.recommendation), order_by=e.ord) == 1
+    flagged = select(e.claim_id, e.ord, e.category, e.message,
+                     case((first_use, e.recommendation)).label("recommendation")).subquery()
+    f = flagged.c
+    whole = {"partition_by": f.claim_id, "order_by": f.ord, "rows": (None, None)}
+    per_claim = select(
+        f.claim_id,
+        func.min(f.category).over(partition_by=f.claim_id).label("first_category"),
+        func.max(f.category).over(partition_by=f.claim_id).label("last_category"),
+        json_agg(f.message).over(**whole).label("explanation"),
+        string_agg(f.recommendation, "; ").over(**whole).label("actions"),
+        func.row_number().over(partition_by=f.claim_id, order_by=f.ord).label("rn"),
+    ).subquery()
+
+    cat = per_claim.c.first_category
+    error_type = case(
+        (cat == per_claim.c.last_category,
+         _cat(func.upper(func.substr(cat, 1, 1)), func.lower(func.substr(cat, 2)), " error")),
+        else_="Both",
+    )
+    db.execute(insert(_outcomes).from_select(
+        ["claim_id", "error_type", "error_explanation", "recommended_action"],
+        select(per_claim.c.claim_id, error_type, per_claim.c.explanation, per_claim.c.actions)
+        .where(per_claim.c.rn == 1),
+    ))
+
+
+def _metric_deltas(db: Session, scope: list, summary: Dict[str, Any]) -> Deltas:
+    """Category deltas for moving the scope's pending claims to their outcomes; fills summary["categories"]."""
+    count, paid = db.execute(
+        select(func.count(), func.coalesce(func.sum(_claims.c.paid_amount_aed), 0.0)).where(*scope)
+    ).one()
+    # pending claims are counted under "No error" until validated
+    deltas: Deltas = {NO_ERROR: [-count, -paid]}
+    category = func.coalesce(_outcomes.c.error_type, NO_ERROR)
+    rows = db.execute(
+        select(category, func.count(), func.coalesce(func.sum(_claims.c.paid_amount_aed), 0.0))
+        .select_from(_claims.outerjoin(_outcomes, _outcomes.c.claim_id == _claims.c.claim_id))
+        .where(*scope).group_by(category)
+    )
+    for error_type, n, total in rows:
+        acc = deltas.setdefault(error_type, [0, 0.0])
+        acc[0] += n
+        acc[1] += total
+        summary["categories"][error_type] = {"count": n, "paid": total}
+    return deltas
+
+
+def validate_job(db: Session, plan: RulePlan, summary: Dict[str, Any], progress: JobProgress) -> Dict[str, Any]:
+    """
+    Validate all of a job's pending claims (summary["job_id"], summary["tenant"])
+    in one transaction, set-based. Same writes as worker._validate_pending.
+    """
+    dialect = db.get_bind().dialect.name
+    scope = _job_scope(summary["job_id"], summary["tenant"])
+    conn = db.connection()   # the scratch tables live on this connection until the commit
+    try:
+        for table in (_facts, _errors, _outcomes):
+            table.create(conn, checkfirst=True)
+            db.execute(delete(table))
+
+        _collect_errors(db, plan, scope, dialect, progress)
+        with progress.stage("pushdown"):
+            _build_outcomes(db, dialect)
+        with progress.stage("metrics"):
+            deltas = _metric_deltas(db, scope, summary)
+
+        with progress.stage("db_write"):
+            job_claims = select(_claims.c.claim_id).where(*scope)
+            db.execute(delete(models.ClaimError).where(models.ClaimError.claim_id.in_(job_claims)))
+            db.execute(insert(models.ClaimError).from_select(
+                ["claim_id", "rule_id", "message", "recommendation"],
+                select(_errors.c.claim_id, _errors.c.rule_id, _errors.c.message, _errors.c.recommendation)
+                .order_by(_errors.c.claim_id, _errors.c.ord),
+            ))
+            failed_ids = list(db.execute(select(_outcomes.c.claim_id).order_by(_outcomes.c.claim_id)).scalars())
+            o = _outcomes.c
+            db.execute(update(_claims).where(_claims.c.claim_id == o.claim_id, *scope).values(
+                status="Not validated", error_type=o.error_type,
+                error_explanation=o.error_explanation, recommended_action=o.recommended_action,
+            ))
+            processed = db.execute(update(_claims).where(*scope).values(
+                status="Validated", error_type=NO_ERROR, error_explanation=[],
+                recommended_action="No action needed.",
+            )).rowcount + len(failed_ids)
+        with progress.stage("metrics"):
+            apply_deltas(db, deltas)
+        for table in (_outcomes, _errors, _facts):
+            table.drop(conn)
+        with progress.stage("db_write"), telemetry.DB_COMMIT_SECONDS.labels("validation").time():
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    # --- Optionally enrich with LLM, off the critical path ---
+    for i in range(0, len(failed_ids), VALIDATION_CHUNK_SIZE):
+        enqueue_enrichment(summary["job_id"], failed_ids[i:i + VALIDATION_CHUNK_SIZE])
+
+    summary["processed"] += processed
+    summary["not_validated"] += len(failed_ids)
+    summary["validated"] += processed - len(failed_ids)
+    progress.incr(processed=processed, not_validated=len(failed_ids),
+                  validated=processed - len(failed_ids)).flush()
+    print(f"[Worker] {processed} claims validated in SQL ({len(failed_ids)} not validated).")
+    return summary
@@ -27,6 +27,9 @@ else:
     redis_conn = redis.from_url(redis_url)
 """
 
-# Create RQ queue
+# Create RQ queues
 queue = Queue("validation", connection=redis_conn)
-print(f"[Queue] Connected to Redis, queue 'validation' ready.")
\ No newline at end of file
+# LLM enrichment runs after the static results are committed; workers listen to
+# it after "validation" (rq worker validation enrichment), so it has lower priority
+enrichment_queue = Queue("enrichment", connection=redis_conn)
+print(f"[Queue] Connected to Redis, queues 'validation' and 'enrichment' ready.")
\ No newline at end of file
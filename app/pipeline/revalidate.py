@@ -0,0 +1,254 @@
+# app/pipeline/revalidate.py
+"""
+Incremental revalidation after a tenant's rules change.
+
+plan_diff compares the compiled rules before and after an update and reduces
+the change to the claim attributes it can affect: service codes, facilities,
+diagnosis codes, a paid-amount band (threshold moves), and facility/service
+pairs (facility type allow-lists). Declarative rules that changed are scoped
+by a positive ==/in test on service_code, facility_id or diagnosis_codes when
+they have one; a change that cannot be scoped (e.g. a rule on paid_amount_aed
+alone, or a category switching between built-in and declarative checks)
+falls back to revalidating every claim of the tenant.
+
+Only the claims matching the diff are selected (in SQL) and re-evaluated, and only those whose errors actually
+change are written, so their LLM explanations and claim_metrics stay intact
+otherwise.
+"""
+import json
+import os
+import shutil
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from ..db import SessionLocal
+from .. import models
+from .diagnoses import with_diagnosis
+from .enrichment import LLM_MARKER, enqueue_enrichment
+from .ingest import SCHEMA_ERROR_PREFIX
+from .metrics import track
+from .progress import JobProgress
+from .rule_cache import get_plan, save_rule_upload
+from .static_eval import RulePlan
+from .worker import _CLAIM_COLUMNS, _iter_chunks, _set_meta, _validate_rows, _write_chunk
+from ..utils import telemetry
+
+# claim column each scoped rule field is looked up by
+_SCOPE_FIELDS = {"service_code": "services", "facility_id": "facilities", "diagnosis_codes": "diagnoses"}
+
+
+def _codes(values) -> Set[str]:
+    if isinstance(values, (list, tuple, set, frozenset)):
+        return {str(v).strip().upper() for v in values}
+    return {str(values).strip().upper()}
+
+
+def _rule_key(rule: Any) -> str:
+    return json.dumps(rule, sort_keys=True, default=lambda v: sorted(v) if isinstance(v, (set, frozenset)) else str(v))
+
+
+def _rule_scope(rule: Any) -> Optional[Tuple[str, Set[str]]]:
+    """(diff key, values) of a test the rule needs to fire, or None if it can fire on any claim."""
+    if not isinstance(rule, dict):
+        return None
+    for test in [rule] + list(rule.get("conditions") or []):
+        field = str(test.get("field", "")).strip().lower()
+        if field not in _SCOPE_FIELDS or test.get("value") is None:
+            continue
+        if test.get("op") in ("==", "in"):
+            return _SCOPE_FIELDS[field], _codes(test["value"])
+        if test.get("op") == "conflict_pair" and field == "diagnosis_codes" and isinstance(test["value"], dict):
+            # both sides must be present, so one side's codes bound the claims
+            return "diagnoses", _codes(test["value"].get("a", []))
+    return None
+
+
+def plan_diff(old: RulePlan, new: RulePlan) -> Dict[str, Any]:
+    """What changed between two rule versions, as claim attributes (JSON-serializable)."""
+    diff: Dict[str, Any] = {"all": False, "services": set(), "facilities": set(), "diagnoses": set(),
+                            "paid_range": None, "facility_services": []}
+
+    if old.technical_builtin != new.technical_builtin or old.medical_builtin != new.medical_builtin:
+        diff["all"] = True
+
+    # built-in technical checks
+    if new.technical_builtin and old.technical_builtin:
+        diff["services"] |= old.approval_services ^ new.approval_services
+        diff["diagnoses"] |= old.diag_approval ^ new.diag_approval
+        if old.paid_threshold != new.paid_threshold:
+            diff["paid_range"] = sorted([old.paid_threshold, new.paid_threshold])
+
+    # built-in medical checks
+    if new.medical_builtin and old.medical_builtin:
+        diff["services"] |= old.inpatient_only ^ new.inpatient_only
+        diff["services"] |= old.outpatient_only ^ new.outpatient_only
+        for fac in set(old.facility_registry) | set(new.facility_registry):
+            if old.facility_registry.get(fac) != new.facility_registry.get(fac):
+                diff["facilities"].add(fac)
+        for fac_type in set(old.facility_allowed) | set(new.facility_allowed):
+            changed = old.facility_allowed.get(fac_type, frozenset()) ^ new.facility_allowed.get(fac_type, frozenset())
+            facilities = {f for f, t in new.facility_registry.items() if t == fac_type} - diff["facilities"]
+            if changed and facilities:
+                diff["facility_services"].append([sorted(_codes(facilities)), sorted(_codes(changed))])
+        for svc in set(old.service_required_diag) | set(new.service_required_diag):
+            before, after = old.service_required_diag.get(svc), new.service_required_diag.get(svc)
+            if (before or (None,))[0] != (after or (None,))[0]:
+                diff["services"].add(svc)
+        old_pairs = {(a, b) for a, b, _ in old.mutual_exclusive}
+        new_pairs = {(a, b) for a, b, _ in new.mutual_exclusive}
+        for a_set, _ in old_pairs ^ new_pairs:
+            diff["diagnoses"] |= _codes(a_set)
+
+    # declarative rules: every added, removed or edited rule
+    for cat in ("technical", "medical"):
+        before = {_rule_key(r): r for r in old.declarative.get(cat, [])}
+        after = {_rule_key(r): r for r in new.declarative.get(cat, [])}
+        for key in set(before) ^ set(after):
+            scope = _rule_scope(before.get(key) or after.get(key))
+            if scope is None:
+                diff["all"] = True
+            else:
+                diff[scope[0]] |= scope[1]
+
+    for key in ("services", "facilities", "diagnoses"):
+        diff[key] = sorted(_codes(diff[key])) if diff[key] else []
+    return diff
+
+
+def diff_is_empty(diff: Dict[str, Any]) -> bool:
+    return not (diff["all"] or diff["services"] or diff["facilities"] or diff["diagnoses"]
+                or diff["paid_range"] or diff["facility_services"])
+
+
+def _normalized(column):
+    # claims are stored as uploaded; the evaluator compares codes trimmed and case-insensitively
+    return func.upper(func.trim(column))
+
+
+def affected_where(diff: Dict[str, Any]) -> list:
+    """WHERE clauses selecting the claims a diff can affect (no extra clause when everything is)."""
+    if diff["all"]:
+        return []
+    claim = models.MasterClaim
+    service, facility = _normalized(claim.service_code), _normalized(claim.facility_id)
+    terms = []
+    if diff["services"]:
+        terms.append(service.in_(diff["services"]))
+    if diff["facilities"]:
+        terms.append(facility.in_(diff["facilities"]))
+    for facilities, services in diff["facility_services"]:
+        terms.append(and_(facility.in_(facilities), service.in_(services)))
+    if diff["paid_range"]:
+        lo, hi = diff["paid_range"]
+        terms.append(and_(claim.paid_amount_aed > lo, claim.paid_amount_aed <= hi))
+    if diff["diagnoses"]:
+        terms.append(with_diagnosis(diff["diagnoses"]))
+    return [or_(*terms)]
+
+
+def _tenant_scope(tenant: str) -> list:
+    """Validated claims of the tenant (pending ones are picked up by their own validation job)."""
+    return [
+        models.MasterClaim.tenant == tenant,
+        models.MasterClaim.status.in_(("Validated", "Not validated")),
+        ~models.MasterClaim.claim_id.startswith(SCHEMA_ERROR_PREFIX),
+    ]
+
+
+def _stored_errors(db: Session, claim_ids: List[str]) -> Dict[str, List[Tuple[str, str]]]:
+    """claim_id -> sorted (rule_id, message without LLM explanation) of its current errors."""
+    out: Dict[str, List[Tuple[str, str]]] = {cid: [] for cid in claim_ids}
+    rows = db.execute(
+        select(models.ClaimError.claim_id, models.ClaimError.rule_id, models.ClaimError.message)
+        .where(models.ClaimError.claim_id.in_(claim_ids))
+    )
+    for claim_id, rule_id, message in rows:
+        out[claim_id].append((rule_id, (message or "").split(LLM_MARKER)[0]))
+    return {cid: sorted(errs) for cid, errs in out.items()}
+
+
+def revalidate(db: Session, plan: RulePlan, tenant: str, diff: Dict[str, Any],
+               progress: JobProgress, job_id: str) -> Dict[str, Any]:
+    """Re-evaluate the tenant's claims the diff can affect; write only those whose errors changed."""
+    summary = {"tenant": tenant, "diff": diff, "evaluated": 0, "changed": 0, "validated": 0, "not_validated": 0}
+    if diff_is_empty(diff):
+        return summary
+
+    columns = [*_CLAIM_COLUMNS, models.MasterClaim.error_type]
+    chunks = _iter_chunks(db, [*_tenant_scope(tenant), *affected_where(diff)], columns=columns)
+    while True:
+        with progress.stage("fetch"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        old_types = {row["claim_id"]: row.pop("error_type") for row in chunk}
+        with progress.stage("evaluate"):
+            outcomes = _validate_rows(plan, chunk)
+            stored = _stored_errors(db, list(old_types))
+
+        updates, error_rows, deltas = [], [], {}
+        for row, (update_row, errs) in zip(chunk, outcomes):
+            if sorted((e["rule_id"], e["message"]) for e in errs) == stored[row["claim_id"]] \
+                    and update_row["error_type"] == old_types[row["claim_id"]]:
+                continue
+            updates.append(update_row)
+            error_rows.extend(errs)
+            track(deltas, old_types[row["claim_id"]], row["paid_amount_aed"], -1)
+            track(deltas, update_row["error_type"], row["paid_amount_aed"])
+
+        if updates:
+            _write_chunk(db, updates, error_rows, deltas, progress)
+            enqueue_enrichment(job_id, [u["claim_id"] for u in updates if u["status"] == "Not validated"])
+
+        failed = sum(1 for u in updates if u["status"] == "Not validated")
+        summary["evaluated"] += len(chunk)
+        summary["changed"] += len(updates)
+        summary["not_validated"] += failed
+        summary["validated"] += len(updates) - failed
+        progress.incr(processed=len(chunk), not_validated=failed, validated=len(updates) - failed).flush()
+        telemetry.push()
+        print(f"[Revalidate] {summary['evaluated']} claims re-evaluated, {summary['changed']} changed so far.")
+    return summary
+
+
+def run_rule_update(job_id: str, tenant: str, technical_path: Optional[str] = None,
+                    medical_path: Optional[str] = None):
+    """
+    RQ job behind POST /api/rules: saves the tenant's new rule files, diffs the
+    compiled rules against the previous version and revalidates the affected
+    claims. Removes the staging directory afterwards.
+    """
+    print(f"[Revalidate] Updating rules of tenant {tenant} (job {job_id})")
+    db: Session = SessionLocal()
+    progress = JobProgress(job_id)
+    staged = [p for p in (technical_path, medical_path) if p]
+    try:
+        _set_meta(stage="saving_rules")
+        with progress.stage("load_rules"):
+            old_plan = get_plan(tenant)
+            changed = False
+            for kind, path in (("technical", technical_path), ("medical", medical_path)):
+                if path:
+                    with open(path, "rb") as f:
+                        changed = save_rule_upload(tenant, kind, f.read()) or changed
+            new_plan = get_plan(tenant) if changed else old_plan
+
+        diff = plan_diff(old_plan, new_plan)
+        _set_meta(stage="revalidating", diff=diff)
+        summary = revalidate(db, new_plan, tenant, diff, progress, job_id)
+        _set_meta(stage="complete", summary=summary)
+        print(f"[Revalidate] Done: {summary['evaluated']} re-evaluated, {summary['changed']} changed.")
+        return summary
+    except Exception as e:
+        db.rollback()
+        _set_meta(stage="failed", error=str(e))
+        print(f"[Revalidate] ERROR: {e}")
+        raise
+    finally:
+        progress.flush()
+        telemetry.push()
+        db.close()
+        if staged:
+            shutil.rmtree(os.path.dirname(staged[0]), ignore_errors=True)
@@ -0,0 +1,181 @@
+# app/pipeline/rule_cache.py
+"""
+Caches for tenant rules.
+
+* Compiled RulePlans are kept in process memory per tenant and keyed by the
+  content hash of the tenant's rule files. A cheap stat() check avoids hashing
+  when nothing was touched; an edited file changes the hash and recompiles.
+  Workers warm it before each job (preload_plans, see worker.PlanCachingWorker).
+* Rules parsed from uploaded PDFs are cached by the PDF's content hash in a
+  TieredCache (optionally shared through Redis) backed by JSON files under
+  app/rules/parsed/, so re-uploading the same policy document never runs
+  pdfplumber again, even from a fresh worker process.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .cache import TieredCache
+from . import static_eval
+from .static_eval import RulePlan, load_rules, rule_path
+
+RULE_KINDS = ("technical", "medical")
+
+_plans: Dict[str, Tuple[tuple, str, RulePlan]] = {}   # tenant -> (file stats, digest, plan)
+_plans_lock = threading.Lock()
+
+pdf_rules_cache = TieredCache("pdf_rules", maxsize=256)
+
+# bump when the patterns in parser.py change, so cached PDF rules are re-derived
+PDF_PARSER_VERSION = 2
+
+
+def _stat(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _files_digest(paths) -> str:
+    h = hashlib.sha256()
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                h.update(content_hash(f.read()).encode())
+        except OSError:
+            h.update(b"-")
+    return h.hexdigest()
+
+
+def get_plan(tenant: str) -> RulePlan:
+    """Compiled rules for a tenant, rebuilt only when its rule files change."""
+    paths = [rule_path(tenant, kind) for kind in RULE_KINDS]
+    stats = tuple(_stat(p) for p in paths)
+    with _plans_lock:
+        cached = _plans.get(tenant)
+    if cached and cached[0] == stats:
+        return cached[2]
+
+    digest = _files_digest(paths)
+    if cached and cached[1] == digest:
+        plan = cached[2]      # touched but identical content
+    else:
+        plan = RulePlan(load_rules(tenant))
+    with _plans_lock:
+        _plans[tenant] = (stats, digest, plan)
+    return plan
+
+
+def rule_tenants() -> List[str]:
+    """Tenants with a technical or medical rule file in RULES_DIR."""
+    suffixes = tuple(f"_{kind}.json" for kind in RULE_KINDS)
+    try:
+        names = os.listdir(static_eval.RULES_DIR)
+    except OSError:
+        return []
+    return sorted({n[:-len(sfx)] for n in names for sfx in suffixes if n.endswith(sfx)})
+
+
+def preload_plans(tenants: Iterable[str] = ()) -> int:
+    """
+    Compile (or re-check) the plans of `tenants` and of every tenant with rule
+    files, in this process. Returns the number of plans now cached.
+    """
+    for tenant in sorted(set(rule_tenants()) | set(tenants)):
+        try:
+            get_plan(tenant)
+        except Exception as e:
+            print(f"[Rules] Could not preload rules for tenant {tenant}: {e}")
+    with _plans_lock:
+        return len(_plans)
+
+
+def invalidate(tenant: Optional[str] = None) -> None:
+    with _plans_lock:
+        if tenant is None:
+            _plans.clear()
+        else:
+            _plans.pop(tenant, None)
+
+
+def _parsed_path(key: str) -> str:
+    return os.path.join(static_eval.RULES_DIR, "parsed", key.replace(":", "_") + ".json")
+
+
+def _read_parsed(key: str) -> Optional[List[Dict]]:
+    try:
+        with open(_parsed_path(key), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_parsed(key: str, rules: List[Dict]) -> None:
+    path = _parsed_path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(rules, f)
+        os.replace(tmp, path)   # concurrent workers never see a partial file
+    except OSError as e:
+        print(f"[Rules] Could not store parsed rules {path}: {e}")
+
+
+def pdf_rules(pdf_path: str, kind: str) -> List[Dict]:
+    """Rules extracted from a technical/medical PDF, cached by the file's content hash."""
+    with open(pdf_path, "rb") as f:
+        key = f"{kind}:v{PDF_PARSER_VERSION}:{content_hash(f.read())}"
+    rules = pdf_rules_cache.get(key)
+    if rules is not None:
+        return rules
+    rules = _read_parsed(key)
+    if rules is None:
+        from . import parser  # pdfplumber is only needed when a PDF actually has to be parsed
+        extract = parser.tech_pdf_to_rules if kind == "technical" else parser.med_pdf_to_rules
+        rules = extract(pdf_path)
+        _write_parsed(key, rules)
+    pdf_rules_cache.set(key, rules)
+    return rules
+
+
+def _write_if_changed(path: str, data: bytes) -> bool:
+    """Write only when the content differs, so unchanged files keep their mtime (and cache entry)."""
+    try:
+        with open(path, "rb") as f:
+            if content_hash(f.read()) == content_hash(data):
+                return False
+    except OSError:
+        pass
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
+
+
+def save_rule_upload(tenant: str, kind: str, data: bytes) -> bool:
+    """
+    Store an uploaded technical/medical rule file for a tenant.
+    JSON uploads are saved as app/rules/{tenant}_{kind}.json. Anything else is
+    treated as a PDF: it is saved as {tenant}_{kind}.pdf and the rules parsed
+    from it are saved as the tenant's JSON. Returns True if the tenant's
+    rules changed.
+    """
+    try:
+        decoded = json.loads(data.decode("utf-8"))
+    except Exception:
+        pdf_path = rule_path(tenant, kind, "pdf")
+        _write_if_changed(pdf_path, data)
+        try:
+            decoded = pdf_rules(pdf_path, kind)
+        except Exception as e:
+            print(f"[Rules] Could not parse {pdf_path}, keeping current {kind} rules: {e}")
+            return False
+    return _write_if_changed(rule_path(tenant, kind), json.dumps(decoded, indent=2).encode("utf-8"))
@@ -0,0 +1,214 @@
+# app/pipeline/rule_engine.py
+"""
+Compiled engine for the declarative JSON rules shipped in app/rules/ and
+uploaded by tenants:
+
+    {"rule_id": "TECH001", "field": "paid_amount_aed", "op": ">", "value": 250,
+     "conditions": [{"field": "approval_number", "op": "is_null"}],
+     "message": "...", "recommendation": "...", "enabled": true}
+
+A rule fires when its own (field, op, value) test and every condition hold.
+Rules are compiled into predicates once. `==`/`in` rules are indexed by the
+value they match, so a claim is only tested against the rules that can fire
+for its field values plus the rules that cannot be indexed.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+SUPPORTED_OPS = {">", "==", "in", "not_in", "is_null", "conflict_pair"}
+INDEXED_OPS = {"==", "in"}
+
+# Fields holding several codes per claim (facts value is a frozenset)
+MULTI_VALUED_FIELDS = {"diagnosis_codes"}
+
+
+def _key(v):
+    """Comparison key: strings compare case-insensitively, numbers by value."""
+    if isinstance(v, str):
+        return v.strip().upper()
+    if isinstance(v, bool):
+        return v
+    if isinstance(v, (int, float)):
+        return float(v)
+    return v
+
+
+def _keys(value) -> frozenset:
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return frozenset(_key(v) for v in value)
+    return frozenset([_key(value)])
+
+
+def _as_float(v) -> Optional[float]:
+    try:
+        return float(v) if v is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class FrameFacts:
+    """
+    Column accessors used to evaluate rules over a DataFrame. Built by
+    static_eval.evaluate_frame, which owns the claim normalization.
+    """
+
+    def __init__(self, scalar: Callable[[str], pd.Series], number: Callable[[str], pd.Series],
+                 has_code: Callable[[Iterable[str]], pd.Series], no_codes: pd.Series,
+                 codes: Callable[[], frozenset]):
+        self.scalar = scalar        # field -> normalized upper-case string series
+        self.number = number        # field -> float series (NaN when not numeric)
+        self.has_code = has_code    # codes -> bool series: claim has any of the diagnoses
+        self.no_codes = no_codes    # bool series: claim has no diagnoses
+        self.codes = codes          # () -> every diagnosis code present in the frame
+
+
+def _compile_test(field: str, op: str, value):
+    """Return (claim predicate, frame mask builder) for one field/op/value."""
+    multi = field in MULTI_VALUED_FIELDS
+
+    if op == "is_null":
+        if multi:
+            return (lambda facts: not facts.get(field)), (lambda frame: frame.no_codes)
+        return (lambda facts: facts.get(field) is None), (lambda frame: frame.scalar(field).isna())
+
+    if op == ">":
+        threshold = float(value)
+
+        def test(facts):
+            v = _as_float(facts.get(field))
+            return v is not None and v > threshold
+        return test, (lambda frame: (frame.number(field) > threshold).fillna(False))
+
+    if op == "conflict_pair":
+        a = frozenset(_key(v) for v in value.get("a", []))
+        b = frozenset(_key(v) for v in value.get("b", []))
+        if multi:
+            return (
+                lambda facts: not a.isdisjoint(facts.get(field) or ()) and not b.isdisjoint(facts.get(field) or ()),
+                lambda frame: frame.has_code(a) & frame.has_code(b),
+            )
+        # a single-valued field can never hold both sides of a pair
+        return (lambda facts: False), (lambda frame: pd.Series(False, index=frame.no_codes.index))
+
+    if op in ("==", "in", "not_in"):
+        keys = _keys(value)
+        numeric = all(isinstance(k, float) for k in keys)
+        negate = op == "not_in"
+        if multi:
+            return (
+                lambda facts: keys.isdisjoint(facts.get(field) or ()) == negate,
+                lambda frame: ~frame.has_code(keys) if negate else frame.has_code(keys),
+            )
+
+        def test(facts):
+            v = facts.get(field)
+            return (v is not None and _key(v) in keys) != negate
+
+        def mask(frame):
+            col = frame.number(field) if numeric else frame.scalar(field)
+            hit = col.isin(keys).fillna(False).astype(bool)
+            return ~hit if negate else hit
+        return test, mask
+
+    raise ValueError(f"unsupported op {op!r}")
+
+
+class CompiledRule:
+    __slots__ = ("pos", "rule_id", "category", "field", "op", "value", "tests", "masks", "error")
+
+    def __init__(self, pos: int, rule: Dict[str, Any], category: str):
+        self.pos = pos
+        self.rule_id = str(rule["rule_id"])
+        self.category = rule.get("category") or category
+        self.field = str(rule["field"]).strip().lower()
+        self.op = rule["op"]
+        self.value = rule.get("value")
+        self.tests = []
+        self.masks = []
+        for cond in [rule] + list(rule.get("conditions") or []):
+            test, mask = _compile_test(str(cond["field"]).strip().lower(), cond["op"], cond.get("value"))
+            self.tests.append(test)
+            self.masks.append(mask)
+        self.error = {
+            "rule_id": self.rule_id,
+            "category": self.category,
+            "message": rule.get("message") or f"Rule {self.rule_id} failed.",
+            "recommendation": rule.get("recommendation") or "Review the claim against rule " + self.rule_id + "."
+        }
+
+    def matches(self, facts: Dict[str, Any]) -> bool:
+        return all(test(facts) for test in self.tests)
+
+    def mask(self, frame: FrameFacts) -> pd.Series:
+        out = None
+        for build in self.masks:
+            m = build(frame)
+            out = m if out is None else out & m
+        return out
+
+
+class RuleEngine:
+    """
+    Declarative rules of every category, compiled once per tenant.
+    `rules_by_category` maps a category ("technical"/"medical") to its list of rule dicts.
+    """
+
+    def __init__(self, rules_by_category: Dict[str, List[Dict[str, Any]]]):
+        self.rules: List[CompiledRule] = []
+        for category, rules in rules_by_category.items():
+            for rule in rules or []:
+                if not isinstance(rule, dict) or rule.get("enabled", True) is False:
+                    continue
+                if rule.get("op") not in SUPPORTED_OPS:
+                    print(f"[Rules] Skipping rule {rule.get('rule_id')}: unsupported op {rule.get('op')!r}")
+                    continue
+                try:
+                    self.rules.append(CompiledRule(len(self.rules), rule, category))
+                except (KeyError, TypeError, ValueError, AttributeError) as e:
+                    print(f"[Rules] Skipping malformed rule {rule.get('rule_id')}: {e}")
+
+        # field -> key -> [rule positions] for rules whose own test is ==/in
+        self.index: Dict[str, Dict[Any, List[int]]] = {}
+        self.scan: List[int] = []
+        for r in self.rules:
+            if r.op in INDEXED_OPS and r.value is not None:
+                buckets = self.index.setdefault(r.field, {})
+                for k in _keys(r.value):
+                    buckets.setdefault(k, []).append(r.pos)
+            else:
+                self.scan.append(r.pos)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def candidates(self, facts: Dict[str, Any]) -> List[CompiledRule]:
+        """Rules that can fire for these facts, in rule-file order."""
+        positions = set(self.scan)
+        for field, buckets in self.index.items():
+            v = facts.get(field)
+            if v is None:
+                continue
+            if field in MULTI_VALUED_FIELDS:
+                for code in v:
+                    positions.update(buckets.get(code, ()))
+            else:
+                positions.update(buckets.get(_key(v), ()))
+        return [self.rules[p] for p in sorted(positions)]
+
+    def evaluate(self, facts: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [dict(r.error) for r in self.candidates(facts) if r.matches(facts)]
+
+    def frame_candidates(self, frame: FrameFacts) -> List[CompiledRule]:
+        """Rules whose indexed value occurs somewhere in the frame (plus unindexed rules)."""
+        positions = set(self.scan)
+        for field, buckets in self.index.items():
+            if field in MULTI_VALUED_FIELDS:
+                present = frame.codes()
+            else:
+                present = set(frame.scalar(field).dropna().unique())
+                if any(isinstance(k, float) for k in buckets):
+                    present |= set(frame.number(field).dropna().unique())
+            for k in present.intersection(buckets):
+                positions.update(buckets[k])
+        return [self.rules[p] for p in sorted(positions)]
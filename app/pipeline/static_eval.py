@@ -1,8 +1,15 @@
 # app/pipeline/static_eval.py
 import re
 import json
+import itertools
 import os
-from typing import Dict, List, Any
+from time import perf_counter
+from typing import Dict, List, Any, Optional, Tuple
+
+import pandas as pd
+
+from .rule_engine import FrameFacts, RuleEngine
+from ..utils import telemetry
 
 # --- Hard-coded defaults extracted from the Technical & Medical rules you provided.
 # These are used if tenant JSON files are not present.
@@ -75,6 +82,9 @@ MUTUALLY_EXCLUSIVE_PAIRS = [
 ]
 
 
+_NULL_MARKERS = frozenset({"NA", "N/A", "NONE", "NULL", "-"})
+
+
 def _normalize_value(v):
     if v is None:
         return None
@@ -83,20 +93,30 @@ def _normalize_value(v):
         if s == "":
             return None
         # treat common n/a markers as missing
-        if s.upper() in {"NA", "N/A", "NONE", "NULL", "-"}:
+        if s.upper() in _NULL_MARKERS:
             return None
         return s
     return v
 
 
+RULES_DIR = "app/rules"
+
+
+def rule_path(tenant: str, kind: str, ext: str = "json") -> str:
+    """Location of a tenant's rule file, kind is "technical" or "medical"."""
+    return f"{RULES_DIR}/{tenant}_{kind}.{ext}"
+
+
 def load_rules(tenant: str) -> Dict[str, Any]:
     """
     Load tenant-specific rule JSONs if present, else fallback to defaults.
     Expects files at app/rules/{tenant}_technical.json and ..._medical.json
+    A JSON object overrides the built-in rule parameters; a JSON list of
+    declarative rules is kept under the category's "rules" key (RulePlan drops
+    the ones that restate a built-in check).
     """
-    base = f"app/rules/{tenant}"
-    tech_path = f"{base}_technical.json"
-    med_path = f"{base}_medical.json"
+    tech_path = rule_path(tenant, "technical")
+    med_path = rule_path(tenant, "medical")
 
     rules = {
         "technical": {
@@ -122,6 +142,10 @@ def load_rules(tenant: str) -> Dict[str, Any]:
                 # expected structure is flexible; check keys
                 if isinstance(loaded, dict):
                     rules["technical"].update(loaded)
+                elif isinstance(loaded, list):
+                    # declarative rule list (see rule_engine), run alongside the built-in checks
+                    # except where they repeat one (RulePlan._restated_builtin)
+                    rules["technical"]["rules"] = loaded
     except Exception:
         pass
 
@@ -131,16 +155,35 @@ def load_rules(tenant: str) -> Dict[str, Any]:
                 loaded = json.load(f)
                 if isinstance(loaded, dict):
                     rules["medical"].update(loaded)
+                elif isinstance(loaded, list):
+                    # declarative rule list (see rule_engine), run alongside the built-in checks
+                    # except where they repeat one (RulePlan._restated_builtin)
+                    rules["medical"]["rules"] = loaded
     except Exception:
         pass
 
     return rules
 
 
+_UPPER_ALNUM_RE = re.compile(r"[A-Z0-9]+")
+_UNIQUE_ID_RE = re.compile(r"[A-Z0-9]{4}-[A-Z0-9]{4}-[A-Z0-9]{4}")
+_DIAG_SPLIT_RE = re.compile(r"[;,|]")
+
+_ID_FIELDS = ("claim_id", "national_id", "member_id", "facility_id")
+
+# bound once: evaluate() runs per claim, and only every EVALUATE_SAMPLE-th claim is timed
+_eval_ticks = itertools.count()
+_EVAL_TIME = telemetry.EVALUATE_SECONDS.labels()
+_EVAL_FAMILY_TIME = {
+    family: telemetry.EVALUATE_FAMILY_SECONDS.labels(family)
+    for family in ("technical", "medical", "declarative")
+}
+
+
 def _is_upper_alnum(val: str) -> bool:
     if not isinstance(val, str):
         return False
-    return bool(re.fullmatch(r"[A-Z0-9]+", val))
+    return bool(_UPPER_ALNUM_RE.fullmatch(val))
 
 
 def _compute_middle4(member_id: str) -> str:
@@ -155,201 +198,605 @@ def _compute_middle4(member_id: str) -> str:
     return s[start:start + 4].upper()
 
 
-def evaluate_claim(claim: Dict[str, Any], rules: Dict[str, Any]) -> List[Dict[str, Any]]:
+def _has_valid_approval(x) -> bool:
+    """Detect real approval numbers: not None and not a placeholder like 'Obtain approval'."""
+    if x is None:
+        return False
+    if isinstance(x, str):
+        s = x.strip()
+        if s == "":
+            return False
+        if s.upper() in {"NA", "N/A", "NONE"}:
+            return False
+        if s.lower() == "obtain approval":
+            return False
+        # otherwise treat as provided (APP001 etc)
+        return True
+    return True
+
+
+def parse_diagnoses(raw_diag) -> Tuple[str, ...]:
+    """
+    Normalize diagnosis codes -> tuple of uppercase codes (input order kept).
+    A tuple is taken as already parsed by this function and returned as is; a
+    frozenset of parsed codes is ordered by code.
+    """
+    if isinstance(raw_diag, tuple):
+        return raw_diag
+    if isinstance(raw_diag, frozenset):
+        return tuple(sorted(raw_diag))
+    if isinstance(raw_diag, str):
+        # split on ; or , or |
+        return tuple(d.strip().upper() for d in _DIAG_SPLIT_RE.split(raw_diag) if d.strip() != "")
+    if isinstance(raw_diag, list):
+        return tuple(str(d).strip().upper() for d in raw_diag if str(d).strip() != "")
+    return ()
+
+
+def _amount_text(paid) -> str:
+    """Paid amount as shown in messages: always as a float (9000 -> "9000.0"), in every evaluation path."""
+    return str(float(paid))
+
+
+def _error(rule_id: str, category: str, message: str, recommendation: str) -> Dict[str, Any]:
+    return {
+        "rule_id": rule_id,
+        "category": category,
+        "message": message,
+        "recommendation": recommendation
+    }
+
+
+class RulePlan:
+    """
+    Rules for one tenant compiled for repeated evaluation.
+
+    Everything that depends only on the rules (uppercased lookup sets, facility
+    maps, static error messages) is built once here; `evaluate` only does the
+    per-claim work. Build one plan per job and reuse it for every claim.
+
+    Each category is either a dict of built-in rule parameters (optionally with
+    declarative rules under "rules") or a bare list of declarative rules, which
+    replaces that category's built-in checks.
+    """
+
+    def __init__(self, rules: Dict[str, Any]):
+        tech = rules.get("technical", {})
+        med = rules.get("medical", {})
+        self.technical_builtin = not isinstance(tech, list)
+        self.medical_builtin = not isinstance(med, list)
+        declared = {
+            "technical": list(tech if isinstance(tech, list) else tech.get("rules", [])),
+            "medical": list(med if isinstance(med, list) else med.get("rules", [])),
+        }
+        tech = tech if self.technical_builtin else {}
+        med = med if self.medical_builtin else {}
+
+        # TECHNICAL RULES
+        self.approval_services = frozenset(s.upper() for s in tech.get("approval_services", DEFAULT_TECH_APPROVAL_SERVICES))
+        self.diag_approval = frozenset(d.upper() for d in tech.get("diag_approval", DEFAULT_TECH_DIAG_APPROVAL))
+        self.paid_threshold = float(tech.get("paid_threshold", DEFAULT_PAID_THRESHOLD))
+
+        # MEDICAL RULES
+        self.inpatient_only = frozenset(med.get("inpatient_only", INPATIENT_ONLY))
+        self.outpatient_only = frozenset(med.get("outpatient_only", OUTPATIENT_ONLY))
+        self.facility_registry = dict(med.get("facility_registry", FACILITY_REGISTRY))
+        self.facility_allowed = {
+            fac_type: frozenset(services)
+            for fac_type, services in med.get("facility_allowed", FACILITY_TYPE_ALLOWED_SERVICES).items()
+        }
+
+        # Prebuilt error messages for checks whose text does not depend on the claim
+        self._id_format_errors = {
+            field_name: _error(
+                f"TECH_{field_name.upper()}_FORMAT",
+                "technical",
+                f"{field_name} must be UPPERCASE alphanumeric (A–Z, 0–9).",
+                f"Ensure {field_name} uses uppercase letters and digits only."
+            )
+            for field_name in _ID_FIELDS
+        }
+        self._uniqueid_missing = _error(
+            "TECH_UNIQUEID_MISSING",
+            "technical",
+            "unique_id is missing.",
+            "Provide unique_id using first4(national_id)-middle4(member_id)-last4(facility_id)."
+        )
+        self._uniqueid_format = _error(
+            "TECH_UNIQUEID_FORMAT",
+            "technical",
+            "unique_id must be 3 segments of 4 UPPERCASE alphanumeric characters separated by hyphens.",
+            "Format unique_id as first4(national)-middle4(member)-last4(facility)."
+        )
+        self._diag_approval_errors = {d: self._diag_approval_error(d) for d in self.diag_approval}
+
+        # service -> (required diagnoses, error)
+        self.service_required_diag = {
+            svc: (
+                frozenset(required),
+                _error(
+                    f"MED_SERVICE_{svc}_MISSING_REQUIRED_DIAG",
+                    "medical",
+                    f"Service {svc} requires one of diagnoses: {', '.join(required)} but none present.",
+                    f"Include required diagnosis code(s): {', '.join(required)} when billing {svc}."
+                )
+            )
+            for svc, required in med.get("service_required_diag", SERVICE_REQUIRED_DIAG).items()
+            if required
+        }
+
+        # [(a codes, b codes, error)]
+        self.mutual_exclusive = [
+            (
+                frozenset(a_set),
+                frozenset(b_set),
+                _error(
+                    f"MED_MUTUAL_{'_'.join(list(a_set)[:1])}_{'_'.join(list(b_set)[:1])}",
+                    "medical",
+                    f"Mutually exclusive diagnoses present: {', '.join(a_set)} cannot co-exist with {', '.join(b_set)}.",
+                    "Review diagnosis list and remove incorrect / conflicting diagnosis codes."
+                )
+            )
+            for a_set, b_set in med.get("mutual_exclusive", MUTUALLY_EXCLUSIVE_PAIRS)
+        ]
+
+        # declarative rules, kept for diffing rule versions (see revalidate.py); a rule
+        # restating an enabled built-in check would report the same violation twice
+        self.declarative = {
+            kind: [r for r in kind_rules if self._restated_builtin(kind, r) is None]
+            for kind, kind_rules in declared.items()
+        }
+        self.engine = RuleEngine(self.declarative)
+
+    def _restated_builtin(self, kind: str, rule: Dict[str, Any]) -> Optional[str]:
+        """
+        Rule id of the enabled built-in check a declarative rule repeats, else None.
+        The shipped default JSON rules and the rules parsed from PDFs restate several.
+        """
+        field_name, op, value = rule.get("field"), rule.get("op"), rule.get("value")
+        conditions = [(c.get("field"), c.get("op")) for c in rule.get("conditions") or []]
+        rule_id = rule.get("rule_id")
+        if kind == "technical" and self.technical_builtin:
+            if field_name == "paid_amount_aed" and op == ">" and conditions in ([], [("approval_number", "is_null")]):
+                try:
+                    if float(value) == self.paid_threshold:
+                        return "TECH_PAID_THRESHOLD_APPROVAL"
+                except (TypeError, ValueError):
+                    return None
+            if field_name == "unique_id" and op == "is_null" and not conditions:
+                return self._uniqueid_missing["rule_id"]
+            if field_name == "service_code" and op == "==" and str(value).upper() in self.approval_services \
+                    and (conditions == [("approval_number", "is_null")] or rule_id == f"TECH_{value}_REQUIRES_APPROVAL"):
+                return f"TECH_SERVICE_{str(value).upper()}_REQUIRES_APPROVAL"
+        if kind == "medical" and self.medical_builtin:
+            if field_name == "service_code" and op == "==" and isinstance(value, str) \
+                    and value in self.service_required_diag \
+                    and (conditions == [("diagnosis_codes", "not_in")] or rule_id == f"MED_{value}_REQUIRES_DX"):
+                return self.service_required_diag[value][1]["rule_id"]
+            if field_name == "diagnosis_codes" and op == "conflict_pair" and isinstance(value, dict):
+                pair = {frozenset(value.get("a") or ()), frozenset(value.get("b") or ())}
+                for a_set, b_set, err in self.mutual_exclusive:
+                    if pair == {a_set, b_set}:
+                        return err["rule_id"]
+        return None
+
+    @classmethod
+    def for_tenant(cls, tenant: str) -> "RulePlan":
+        return cls(load_rules(tenant))
+
+    @staticmethod
+    def _diag_approval_error(d: str) -> Dict[str, Any]:
+        return _error(
+            f"TECH_DIAG_{d}_REQUIRES_APPROVAL",
+            "technical",
+            f"Diagnosis {d} requires prior approval, but approval number missing.",
+            "Obtain and include prior approval number for claims with this diagnosis."
+        )
+
+    def evaluate(self, claim: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Evaluate a single claim dict against the compiled rules.
+        Returns list of error dicts with keys: rule_id, category, message, recommendation
+        """
+        timed = telemetry.TELEMETRY_ENABLED and next(_eval_ticks) % telemetry.EVALUATE_SAMPLE == 0
+        started = perf_counter() if timed else 0.0
+        errs = []
+
+        # Normalize inputs
+        cid = _normalize_value(claim.get("claim_id"))
+        encounter = _normalize_value(claim.get("encounter_type"))
+        service = _normalize_value(claim.get("service_code"))
+        national_id = _normalize_value(claim.get("national_id"))
+        member_id = _normalize_value(claim.get("member_id"))
+        facility_id = _normalize_value(claim.get("facility_id"))
+        unique_id = _normalize_value(claim.get("unique_id"))
+        approval = _normalize_value(claim.get("approval_number"))
+        approval_ok = _has_valid_approval(approval)
+        paid = claim.get("paid_amount_aed")
+        diag_list = parse_diagnoses(claim.get("diagnosis_codes") or ())
+
+        t_tech = perf_counter() if timed else 0.0
+        if self.technical_builtin:
+            self._technical_checks(errs, cid, national_id, member_id, facility_id, unique_id,
+                                   service, paid, approval_ok, diag_list)
+        t_med = perf_counter() if timed else 0.0
+        if self.medical_builtin:
+            self._medical_checks(errs, service, encounter, facility_id, diag_list)
+        t_decl = perf_counter() if timed else 0.0
+
+        # DECLARATIVE RULES
+        if self.engine:
+            facts = {k: _normalize_value(v) for k, v in claim.items()}
+            facts.update({
+                "claim_id": cid, "encounter_type": encounter, "service_code": service,
+                "national_id": national_id, "member_id": member_id, "facility_id": facility_id,
+                "unique_id": unique_id, "approval_number": approval, "paid_amount_aed": paid,
+                "diagnosis_codes": frozenset(diag_list)
+            })
+            errs.extend(self.engine.evaluate(facts))
+
+        if timed:
+            t_end = perf_counter()
+            _EVAL_TIME.observe(t_end - started)
+            _EVAL_FAMILY_TIME["technical"].observe(t_med - t_tech)
+            _EVAL_FAMILY_TIME["medical"].observe(t_decl - t_med)
+            _EVAL_FAMILY_TIME["declarative"].observe(t_end - t_decl)
+
+        # Done
+        return errs
+
+    def _technical_checks(self, errs, cid, national_id, member_id, facility_id, unique_id,
+                          service, paid, approval_ok, diag_list):
+        # TECHNICAL RULES
+        # 1) ID formatting checks (All IDs uppercase alphanumeric)
+        for field_name, value in zip(_ID_FIELDS, (cid, national_id, member_id, facility_id)):
+            if value is None or not _is_upper_alnum(value.upper()):
+                errs.append(dict(self._id_format_errors[field_name]))
+
+        # 2) unique_id structure check: first4(national)-middle4(member)-last4(facility), hyphen-separated
+        if unique_id is None:
+            errs.append(dict(self._uniqueid_missing))
+        else:
+            uid = unique_id.upper()
+            if not _UNIQUE_ID_RE.fullmatch(uid):
+                errs.append(dict(self._uniqueid_format))
+            else:
+                seg1, seg2, seg3 = uid.split("-")
+                expected1 = (national_id or "")[:4].upper() if national_id else None
+                expected2 = _compute_middle4(member_id) if member_id else None
+                expected3 = (facility_id or "")[-4:].upper() if facility_id else None
+                # Compare only if sources exist; if they do and mismatch -> error
+                mismatches = []
+                if expected1 and seg1 != expected1:
+                    mismatches.append(f"segment1 expected {expected1} but got {seg1}")
+                if expected2 and seg2 != expected2:
+                    mismatches.append(f"segment2 expected {expected2} but got {seg2}")
+                if expected3 and seg3 != expected3:
+                    mismatches.append(f"segment3 expected {expected3} but got {seg3}")
+                if mismatches:
+                    errs.append(_error(
+                        "TECH_UNIQUEID_MISMATCH",
+                        "technical",
+                        "unique_id segments do not match underlying ID sources: " + "; ".join(mismatches),
+                        "Rebuild unique_id using the specified segments from national_id, member_id and facility_id."
+                    ))
+
+        if not approval_ok:
+            # 3) Paid amount threshold
+            try:
+                if paid is not None and float(paid) > self.paid_threshold:
+                    errs.append(_error(
+                        "TECH_PAID_THRESHOLD_APPROVAL",
+                        "technical",
+                        f"Paid amount AED {_amount_text(paid)} exceeds threshold AED {self.paid_threshold} and no valid approval number present.",
+                        "Obtain prior approval and include approval number in approval_number field."
+                    ))
+            except Exception:
+                # if parsing paid fails, ignore here (other validators or DB schema handles)
+                pass
+
+            # 4) Service-based approval requirement
+            if service and service.upper() in self.approval_services:
+                errs.append(_error(
+                    f"TECH_SERVICE_{service}_REQUIRES_APPROVAL",
+                    "technical",
+                    f"Service {service} requires prior approval but no valid approval number was supplied.",
+                    "Obtain and include prior approval number for this service."
+                ))
+
+            # 5) Diagnosis-based approval requirement (one message per claim is sufficient)
+            for d in diag_list:
+                if d in self.diag_approval:
+                    errs.append(dict(self._diag_approval_errors[d]))
+                    break
+
+    def _medical_checks(self, errs, service, encounter, facility_id, diag_list):
+        # MEDICAL RULES
+        svc = (service or "").upper()
+        # 6) Encounter type constraints
+        if svc in self.inpatient_only and (not encounter or encounter.upper() != "INPATIENT"):
+            errs.append(_error(
+                f"MED_ENCOUNTER_{svc}_INPATIENT_ONLY",
+                "medical",
+                f"Service {svc} is inpatient-only but claim encounter_type={encounter}.",
+                "Verify encounter_type is INPATIENT for this service."
+            ))
+        if svc in self.outpatient_only and (not encounter or encounter.upper() != "OUTPATIENT"):
+            errs.append(_error(
+                f"MED_ENCOUNTER_{svc}_OUTPATIENT_ONLY",
+                "medical",
+                f"Service {svc} is outpatient-only but claim encounter_type={encounter}.",
+                "Verify encounter_type is OUTPATIENT for this service."
+            ))
+
+        # 7) Facility type constraints (unknown facilities are not failed)
+        fac_type = self.facility_registry.get(facility_id) if facility_id else None
+        if fac_type and svc and svc not in self.facility_allowed.get(fac_type, frozenset()):
+            errs.append(_error(
+                f"MED_FACILITY_{svc}_NOT_ALLOWED",
+                "medical",
+                f"Service {svc} is not allowed at facility {facility_id} (type {fac_type}).",
+                f"Perform {svc} at a facility type that supports it (current facility type: {fac_type})."
+            ))
+
+        diags = frozenset(diag_list)
+        # 8) Service requires specific diagnosis
+        required = self.service_required_diag.get(svc)
+        if required and required[0].isdisjoint(diags):
+            errs.append(dict(required[1]))
+
+        # 9) Mutually exclusive diagnosis checks
+        for a_set, b_set, err in self.mutual_exclusive:
+            if not a_set.isdisjoint(diags) and not b_set.isdisjoint(diags):
+                errs.append(dict(err))
+
+
+def evaluate_claim(claim: Dict[str, Any], rules) -> List[Dict[str, Any]]:
     """
     Evaluate a single claim dict against the technical and medical rules.
     claim keys expected: claim_id, encounter_type, service_date, national_id,
       member_id, facility_id, unique_id, diagnosis_codes (list), service_code,
       paid_amount_aed, approval_number
+    `rules` is either the dict from load_rules() or a prebuilt RulePlan; pass a
+    RulePlan when evaluating many claims so the rules are compiled only once.
     Returns list of error dicts with keys: rule_id, category, message, recommendation
     """
-    errs = []
-
-    # Normalize inputs
-    cid = _normalize_value(claim.get("claim_id"))
-    encounter = _normalize_value(claim.get("encounter_type"))
-    service = _normalize_value(claim.get("service_code"))
-    national_id = _normalize_value(claim.get("national_id"))
-    member_id = _normalize_value(claim.get("member_id"))
-    facility_id = _normalize_value(claim.get("facility_id"))
-    unique_id = _normalize_value(claim.get("unique_id"))
-    approval = _normalize_value(claim.get("approval_number"))
-    paid = claim.get("paid_amount_aed")
-    # normalize diagnosis codes -> list of uppercase codes
-    raw_diag = claim.get("diagnosis_codes") or []
-    if isinstance(raw_diag, str):
-        # split on ; or , or |
-        diag_list = [d.strip().upper() for d in re.split(r"[;,|]", raw_diag) if d.strip() != ""]
-    elif isinstance(raw_diag, list):
-        diag_list = [str(d).strip().upper() for d in raw_diag if str(d).strip() != ""]
-    else:
-        diag_list = []
-
-    # Helper to detect real approval numbers: not None and not a placeholder like 'Obtain approval'
-    def has_valid_approval(x):
-        if x is None:
-            return False
-        if isinstance(x, str):
-            s = x.strip()
-            if s == "":
-                return False
-            if s.upper() in {"NA", "N/A", "NONE"}:
-                return False
-            if s.strip().lower() in {"obtain approval", "obtain approval "}:
-                return False
-            # otherwise treat as provided (APP001 etc)
-            return True
-        return True
+    plan = rules if isinstance(rules, RulePlan) else RulePlan(rules)
+    return plan.evaluate(claim)
 
-    # TECHNICAL RULES
-    tech = rules.get("technical", {})
-    tech_approval_svcs = set([s.upper() for s in tech.get("approval_services", DEFAULT_TECH_APPROVAL_SERVICES)])
-    tech_diag_approval = set([d.upper() for d in tech.get("diag_approval", DEFAULT_TECH_DIAG_APPROVAL)])
-    paid_threshold = float(tech.get("paid_threshold", DEFAULT_PAID_THRESHOLD))
-
-    # 1) ID formatting checks (All IDs uppercase alphanumeric)
-    for field_name, value in [("claim_id", cid), ("national_id", national_id), ("member_id", member_id), ("facility_id", facility_id)]:
-        if value is None or not _is_upper_alnum(value.upper()):
-            errs.append({
-                "rule_id": f"TECH_{field_name.upper()}_FORMAT",
-                "category": "technical",
-                "message": f"{field_name} must be UPPERCASE alphanumeric (A–Z, 0–9).",
-                "recommendation": f"Ensure {field_name} uses uppercase letters and digits only."
-            })
 
-    # 2) unique_id structure check: first4(national)-middle4(member)-last4(facility), hyphen-separated
-    if unique_id is None:
-        errs.append({
-            "rule_id": "TECH_UNIQUEID_MISSING",
-            "category": "technical",
-            "message": "unique_id is missing.",
-            "recommendation": "Provide unique_id using first4(national_id)-middle4(member_id)-last4(facility_id)."
-        })
-    else:
-        uid = unique_id.upper()
-        if not re.fullmatch(r"[A-Z0-9]{4}-[A-Z0-9]{4}-[A-Z0-9]{4}", uid):
-            errs.append({
-                "rule_id": "TECH_UNIQUEID_FORMAT",
-                "category": "technical",
-                "message": "unique_id must be 3 segments of 4 UPPERCASE alphanumeric characters separated by hyphens.",
-                "recommendation": "Format unique_id as first4(national)-middle4(member)-last4(facility)."
-            })
-        else:
-            seg1, seg2, seg3 = uid.split("-")
-            expected1 = (national_id or "")[:4].upper() if national_id else None
-            expected2 = _compute_middle4(member_id) if member_id else None
-            expected3 = (facility_id or "")[-4:].upper() if facility_id else None
-            # Compare only if sources exist; if they do and mismatch -> error
-            mismatches = []
-            if expected1 and seg1 != expected1:
-                mismatches.append(f"segment1 expected {expected1} but got {seg1}")
-            if expected2 and seg2 != expected2:
-                mismatches.append(f"segment2 expected {expected2} but got {seg2}")
-            if expected3 and seg3 != expected3:
-                mismatches.append(f"segment3 expected {expected3} but got {seg3}")
-            if mismatches:
-                errs.append({
-                    "rule_id": "TECH_UNIQUEID_MISMATCH",
-                    "category": "technical",
-                    "message": "unique_id segments do not match underlying ID sources: " + "; ".join(mismatches),
-                    "recommendation": "Rebuild unique_id using the specified segments from national_id, member_id and facility_id."
-                })
-
-    # 3) Paid amount threshold
-    try:
-        if paid is not None and float(paid) > paid_threshold and not has_valid_approval(approval):
-            errs.append({
-                "rule_id": "TECH_PAID_THRESHOLD_APPROVAL",
-                "category": "technical",
-                "message": f"Paid amount AED {paid} exceeds threshold AED {paid_threshold} and no valid approval number present.",
-                "recommendation": "Obtain prior approval and include approval number in approval_number field."
-            })
-    except Exception:
-        # if parsing paid fails, ignore here (other validators or DB schema handles)
-        pass
+# --- Batch (column-wise) evaluation ---
 
-    # 4) Service-based approval requirement
-    if service and service.upper() in tech_approval_svcs and not has_valid_approval(approval):
-        errs.append({
-            "rule_id": f"TECH_SERVICE_{service}_REQUIRES_APPROVAL",
-            "category": "technical",
-            "message": f"Service {service} requires prior approval but no valid approval number was supplied.",
-            "recommendation": "Obtain and include prior approval number for this service."
-        })
-
-    # 5) Diagnosis-based approval requirement
-    for d in diag_list:
-        if d in tech_diag_approval and not has_valid_approval(approval):
-            errs.append({
-                "rule_id": f"TECH_DIAG_{d}_REQUIRES_APPROVAL",
-                "category": "technical",
-                "message": f"Diagnosis {d} requires prior approval, but approval number missing.",
-                "recommendation": "Obtain and include prior approval number for claims with this diagnosis."
-            })
-            # one message per diag is sufficient
-            break
-
-    # MEDICAL RULES
-    med = rules.get("medical", {})
-    inpatient_only = set(med.get("inpatient_only", INPATIENT_ONLY))
-    outpatient_only = set(med.get("outpatient_only", OUTPATIENT_ONLY))
-    facility_registry = med.get("facility_registry", FACILITY_REGISTRY)
-    facility_allowed = med.get("facility_allowed", FACILITY_TYPE_ALLOWED_SERVICES)
-    service_required_diag = med.get("service_required_diag", SERVICE_REQUIRED_DIAG)
-    mutual_exclusive = med.get("mutual_exclusive", MUTUALLY_EXCLUSIVE_PAIRS)
-
-    svc = (service or "").upper()
-    # 6) Encounter type constraints
-    if svc in inpatient_only and (not encounter or encounter.upper() != "INPATIENT"):
-        errs.append({
-            "rule_id": f"MED_ENCOUNTER_{svc}_INPATIENT_ONLY",
-            "category": "medical",
-            "message": f"Service {svc} is inpatient-only but claim encounter_type={encounter}.",
-            "recommendation": "Verify encounter_type is INPATIENT for this service."
-        })
-    if svc in outpatient_only and (not encounter or encounter.upper() != "OUTPATIENT"):
-        errs.append({
-            "rule_id": f"MED_ENCOUNTER_{svc}_OUTPATIENT_ONLY",
-            "category": "medical",
-            "message": f"Service {svc} is outpatient-only but claim encounter_type={encounter}.",
-            "recommendation": "Verify encounter_type is OUTPATIENT for this service."
-        })
-
-    # 7) Facility type constraints
-    fac_type = facility_registry.get(facility_id) if facility_id else None
-    if fac_type:
-        allowed = facility_allowed.get(fac_type, set())
-        if svc and svc not in allowed:
-            errs.append({
-                "rule_id": f"MED_FACILITY_{svc}_NOT_ALLOWED",
-                "category": "medical",
-                "message": f"Service {svc} is not allowed at facility {facility_id} (type {fac_type}).",
-                "recommendation": f"Perform {svc} at a facility type that supports it (current facility type: {fac_type})."
-            })
-    else:
-        # unknown facility - optionally warn (not necessarily fail)
-        pass
+try:
+    import pyarrow  # noqa: F401  optional: Arrow-backed strings give C-level str kernels
+    _STR_DTYPE = "string[pyarrow]"
+except ImportError:
+    _STR_DTYPE = "string"
 
-    # 8) Service requires specific diagnosis
-    required = service_required_diag.get(svc)
-    if required:
-        if not any(d in diag_list for d in required):
-            errs.append({
-                "rule_id": f"MED_SERVICE_{svc}_MISSING_REQUIRED_DIAG",
-                "category": "medical",
-                "message": f"Service {svc} requires one of diagnoses: {', '.join(required)} but none present.",
-                "recommendation": f"Include required diagnosis code(s): {', '.join(required)} when billing {svc}."
-            })
+ERROR_COLUMNS = ["claim_id", "rule_id", "category", "message", "recommendation"]
 
-    # 9) Mutually exclusive diagnosis checks
-    for a_set, b_set in mutual_exclusive:
-        if any(a in diag_list for a in a_set) and any(b in diag_list for b in b_set):
-            errs.append({
-                "rule_id": f"MED_MUTUAL_{'_'.join(list(a_set)[:1])}_{'_'.join(list(b_set)[:1])}",
-                "category": "medical",
-                "message": f"Mutually exclusive diagnoses present: {', '.join(a_set)} cannot co-exist with {', '.join(b_set)}.",
-                "recommendation": "Review diagnosis list and remove incorrect / conflicting diagnosis codes."
-            })
 
-    # Done
-    return errs
+def _frame_col(df: pd.DataFrame, name: str) -> pd.Series:
+    """Column as a nullable string series normalized like _normalize_value."""
+    if name not in df.columns:
+        return pd.Series(pd.NA, index=df.index, dtype=_STR_DTYPE)
+    s = df[name].astype(_STR_DTYPE).str.strip()
+    return s.mask((s == "") | s.str.upper().isin(_NULL_MARKERS))
+
+
+def _frame_slice(s: pd.Series, start: int, length: int) -> pd.Series:
+    """s.str[start:start + length] as a regex replace, which Arrow strings run natively."""
+    return s.str.replace(rf"^.{{0,{start}}}(.{{0,{length}}}).*$", r"\1", regex=True)
+
+
+def _frame_tail(s: pd.Series, length: int) -> pd.Series:
+    """s.str[-length:] as a regex replace."""
+    return s.str.replace(rf"^.*?(.{{0,{length}}})$", r"\1", regex=True)
+
+
+def _frame_middle4(member: pd.Series) -> pd.Series:
+    """Vectorized _compute_middle4: slice each length bucket in one go."""
+    out = pd.Series(pd.NA, index=member.index, dtype=_STR_DTYPE)
+    lengths = member.str.len()
+    short = lengths <= 4
+    out[short] = _frame_slice(member[short].str.upper().str.ljust(4, "X"), 0, 4)
+    for n in lengths[~short].dropna().unique():
+        rows = lengths == n
+        start = (int(n) - 4) // 2
+        out[rows] = _frame_slice(member[rows], start, 4).str.upper()
+    return out
+
+
+def _join_parts(parts: List[pd.Series], sep: str) -> pd.Series:
+    """Row-wise "sep".join() of the non-null entries of several string series."""
+    out = pd.Series(pd.NA, index=parts[0].index, dtype=_STR_DTYPE)
+    for p in parts:
+        out = out.where(p.isna(), out.where(out.isna(), out + sep).fillna("") + p)
+    return out
+
+
+def _frame_diagnoses(df: pd.DataFrame) -> pd.Series:
+    """
+    Diagnosis codes as one normalized string per claim, ";E11.9;R51;", so a
+    code lookup is a plain substring search: _frame_has_code(text, codes).
+    """
+    if "diagnosis_codes" not in df.columns:
+        return pd.Series(";;", index=df.index, dtype=_STR_DTYPE)
+    raw = df["diagnosis_codes"]
+    lists = raw.map(lambda v: isinstance(v, list))
+    if lists.any():
+        raw = raw.copy()
+        raw[lists] = raw[lists].map(lambda codes: ";".join(str(d) for d in codes))
+    text = raw.where(raw.map(lambda v: isinstance(v, str)), "").astype(_STR_DTYPE)
+    text = text.str.upper().str.replace(r"\s*[;,|]\s*", ";", regex=True).str.strip()
+    return ";" + text + ";"
+
+
+def _frame_has_code(diag_text: pd.Series, codes) -> pd.Series:
+    hit = pd.Series(False, index=diag_text.index)
+    for code in codes:
+        hit |= diag_text.str.contains(f";{code};", regex=False).fillna(False).astype(bool)
+    return hit
+
+
+def evaluate_frame(df: pd.DataFrame, rules) -> pd.DataFrame:
+    """
+    Evaluate a DataFrame of claims (same columns as evaluate_claim expects)
+    with column operations instead of a Python loop per claim.
+    Returns a long-format error table with columns
+    claim_id, rule_id, category, message, recommendation, ordered by claim
+    and then by rule in the same order evaluate_claim reports them.
+    """
+    plan = rules if isinstance(rules, RulePlan) else RulePlan(rules)
+    df = df.reset_index(drop=True)
+    if df.empty:
+        return pd.DataFrame(columns=ERROR_COLUMNS)
+
+    cols = {name: _frame_col(df, name) for name in (
+        "claim_id", "encounter_type", "service_code", "national_id", "member_id",
+        "facility_id", "unique_id", "approval_number"
+    )}
+    upper = {name: s.str.upper() for name, s in cols.items()}
+    service = cols["service_code"]
+    svc = upper["service_code"].fillna("")
+    facility_id = cols["facility_id"]
+    approval = cols["approval_number"]
+    no_approval = (approval.isna() | (approval.str.lower() == "obtain approval")).fillna(True).astype(bool)
+    diag_text = _frame_diagnoses(df)
+
+    frames = []
+
+    def add(order: int, mask: pd.Series, rule_id, category: str, message, recommendation):
+        """Append hits for one rule; callables build per-row text for the hit rows only."""
+        mask = mask.fillna(False).astype(bool)
+        if not mask.any():
+            return
+        hits = {"_pos": df.index[mask], "_order": order, "category": category}
+        for key, value in (("rule_id", rule_id), ("message", message), ("recommendation", recommendation)):
+            hits[key] = value(mask).to_numpy() if callable(value) else value
+        frames.append(pd.DataFrame(hits))
+
+    def add_template(order: int, mask: pd.Series, err: Dict[str, Any]):
+        add(order, mask, err["rule_id"], err["category"], err["message"], err["recommendation"])
+
+    if plan.technical_builtin:
+        # TECHNICAL RULES
+        # 1) ID formatting checks
+        for order, field_name in enumerate(_ID_FIELDS):
+            ok = upper[field_name].str.fullmatch(_UPPER_ALNUM_RE.pattern).fillna(False).astype(bool)
+            add_template(order, ~ok, plan._id_format_errors[field_name])
+
+        # 2) unique_id structure and segment comparison
+        uid = upper["unique_id"]
+        add_template(4, uid.isna(), plan._uniqueid_missing)
+        uid_ok = uid.str.fullmatch(_UNIQUE_ID_RE.pattern).fillna(False).astype(bool)
+        add_template(4, uid.notna() & ~uid_ok, plan._uniqueid_format)
+        checked = uid[uid_ok]
+        if not checked.empty:
+            expected = [
+                _frame_slice(upper["national_id"][uid_ok], 0, 4),
+                _frame_middle4(cols["member_id"][uid_ok]),
+                _frame_tail(upper["facility_id"][uid_ok], 4),
+            ]
+            segments = [_frame_slice(checked, start, 4) for start in (0, 5, 10)]
+            mismatches = []
+            for n, (exp, seg) in enumerate(zip(expected, segments), start=1):
+                bad = (exp.notna() & (exp != "") & (seg != exp)).fillna(False).astype(bool)
+                part = pd.Series(pd.NA, index=checked.index, dtype=_STR_DTYPE)
+                part[bad] = "segment" + str(n) + " expected " + exp[bad] + " but got " + seg[bad]
+                mismatches.append(part)
+            joined = _join_parts(mismatches, "; ").reindex(df.index)
+            add(4, joined.notna(), "TECH_UNIQUEID_MISMATCH", "technical",
+                lambda m: "unique_id segments do not match underlying ID sources: " + joined[m],
+                "Rebuild unique_id using the specified segments from national_id, member_id and facility_id.")
+
+        # 3) Paid amount threshold
+        if "paid_amount_aed" in df.columns:
+            paid = pd.to_numeric(df["paid_amount_aed"], errors="coerce")
+            add(5, (paid > plan.paid_threshold) & no_approval, "TECH_PAID_THRESHOLD_APPROVAL", "technical",
+                lambda m: "Paid amount AED " + paid[m].map(_amount_text)
+                + f" exceeds threshold AED {plan.paid_threshold} and no valid approval number present.",
+                "Obtain prior approval and include approval number in approval_number field.")
+
+        # 4) Service-based approval requirement
+        add(6, service.notna() & svc.isin(plan.approval_services) & no_approval,
+            lambda m: "TECH_SERVICE_" + service[m] + "_REQUIRES_APPROVAL", "technical",
+            lambda m: "Service " + service[m] + " requires prior approval but no valid approval number was supplied.",
+            "Obtain and include prior approval number for this service.")
+
+        # 5) Diagnosis-based approval requirement (first matching diagnosis only)
+        found = _frame_has_code(diag_text, plan.diag_approval) & no_approval
+        if found.any():
+            first_dx = diag_text[found].map(
+                lambda text: next(d for d in text.split(";") if d in plan.diag_approval)
+            ).astype(_STR_DTYPE).reindex(df.index)
+            add(7, found,
+                lambda m: "TECH_DIAG_" + first_dx[m] + "_REQUIRES_APPROVAL", "technical",
+                lambda m: "Diagnosis " + first_dx[m] + " requires prior approval, but approval number missing.",
+                "Obtain and include prior approval number for claims with this diagnosis.")
+
+    if plan.medical_builtin:
+        # MEDICAL RULES
+        # 6) Encounter type constraints
+        enc_upper = upper["encounter_type"]
+        enc_text = cols["encounter_type"].fillna("None")
+        for order, allowed_set, kind in ((8, plan.inpatient_only, "INPATIENT"), (9, plan.outpatient_only, "OUTPATIENT")):
+            add(order, svc.isin(allowed_set) & (enc_upper != kind).fillna(True),
+                lambda m, kind=kind: "MED_ENCOUNTER_" + svc[m] + f"_{kind}_ONLY", "medical",
+                lambda m, kind=kind: "Service " + svc[m] + f" is {kind.lower()}-only but claim encounter_type=" + enc_text[m] + ".",
+                f"Verify encounter_type is {kind} for this service.")
+
+        # 7) Facility type constraints (registry join; unknown facilities are not failed)
+        fac_type = facility_id.map(plan.facility_registry).astype(_STR_DTYPE)
+        allowed_pairs = {f"{t}|{s}" for t, services in plan.facility_allowed.items() for s in services}
+        known = fac_type.notna() & (svc != "")
+        not_allowed = known.copy()
+        not_allowed[known] = ~(fac_type[known] + "|" + svc[known]).isin(allowed_pairs)
+        add(10, not_allowed,
+            lambda m: "MED_FACILITY_" + svc[m] + "_NOT_ALLOWED", "medical",
+            lambda m: "Service " + svc[m] + " is not allowed at facility " + facility_id[m] + " (type " + fac_type[m] + ").",
+            lambda m: "Perform " + svc[m] + " at a facility type that supports it (current facility type: " + fac_type[m] + ").")
+
+        # 8) Service requires specific diagnosis
+        for code, (required, err) in plan.service_required_diag.items():
+            rows = svc == code
+            if rows.any():
+                missing = ~_frame_has_code(diag_text[rows], required)
+                add_template(11, missing.reindex(df.index, fill_value=False), err)
+
+        # 9) Mutually exclusive diagnosis checks
+        for n, (a_set, b_set, err) in enumerate(plan.mutual_exclusive):
+            add_template(12 + n, _frame_has_code(diag_text, a_set) & _frame_has_code(diag_text, b_set), err)
+
+    # DECLARATIVE RULES
+    if plan.engine:
+        numbers = {}
+
+        def scalar(field: str) -> pd.Series:
+            if field not in upper:
+                upper[field] = _frame_col(df, field).str.upper()
+            return upper[field]
+
+        def number(field: str) -> pd.Series:
+            if field not in numbers:
+                numbers[field] = (pd.to_numeric(df[field], errors="coerce") if field in df.columns
+                                  else pd.Series(float("nan"), index=df.index))
+            return numbers[field]
+
+        present = []
+
+        def codes() -> frozenset:
+            if not present:
+                present.append(frozenset(diag_text.str.split(";").explode().dropna()) - {""})
+            return present[0]
+
+        facts = FrameFacts(scalar, number, lambda c: _frame_has_code(diag_text, c), diag_text == ";;", codes)
+        for rule in plan.engine.frame_candidates(facts):
+            add_template(1000 + rule.pos, rule.mask(facts), rule.error)
+
+    if not frames:
+        return pd.DataFrame(columns=ERROR_COLUMNS)
+    out = pd.concat(frames, ignore_index=True).sort_values(["_pos", "_order"], kind="stable")
+    claim_ids = df["claim_id"] if "claim_id" in df.columns else pd.Series(None, index=df.index, dtype=object)
+    out["claim_id"] = claim_ids.to_numpy()[out["_pos"].to_numpy()]
+    return out[ERROR_COLUMNS].reset_index(drop=True)
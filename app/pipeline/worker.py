@@ -1,116 +1,474 @@
+import os
+import shutil
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from rq import Queue, Worker, get_current_job
+from rq.job import Dependency, Job
+from sqlalchemy import delete, func, insert, select, update
 from sqlalchemy.orm import Session
 from ..db import SessionLocal
 from .. import models
-from .static_eval import load_rules, evaluate_claim
-from .llm_client import explain_with_llm
-import datetime
+from .static_eval import RulePlan, evaluate_claim, parse_diagnoses
+from .rule_cache import get_plan, preload_plans, save_rule_upload
+from .enrichment import enqueue_enrichment
+from .ingest import ClaimsFileError, SchemaError, ingest_claims, record_schema_error
+from .progress import JobProgress
+from ..utils import telemetry
+from .metrics import Deltas, apply_deltas, track
+
+VALIDATION_CHUNK_SIZE = int(os.getenv("VALIDATION_CHUNK_SIZE", "1000"))
+# "python" evaluates claims chunk by chunk in the worker; "pushdown" runs the
+# built-in rules as SQL in the database (app/pipeline/pushdown.py)
+VALIDATION_MODE = os.getenv("VALIDATION_MODE", "python").lower()
+
+# Columns the evaluator needs; selected as plain rows so nothing lands in the identity map
+_CLAIM_COLUMNS = [
+    models.MasterClaim.claim_id,
+    models.MasterClaim.encounter_type,
+    models.MasterClaim.service_date,
+    models.MasterClaim.national_id,
+    models.MasterClaim.member_id,
+    models.MasterClaim.facility_id,
+    models.MasterClaim.unique_id,
+    models.MasterClaim.diagnosis_codes,
+    models.MasterClaim.service_code,
+    models.MasterClaim.paid_amount_aed,
+    models.MasterClaim.approval_number,
+]
+
+
+def _iter_chunks(db: Session, where, chunk_size: Optional[int] = None,
+                 columns: Optional[list] = None) -> Iterator[List[Dict[str, Any]]]:
+    """Keyset-paginate claims matching `where` in claim_id order, one chunk of row dicts at a time."""
+    chunk_size = chunk_size or VALIDATION_CHUNK_SIZE
+    last_id = None
+    while True:
+        stmt = select(*(columns or _CLAIM_COLUMNS)).where(*where).order_by(models.MasterClaim.claim_id).limit(chunk_size)
+        if last_id is not None:
+            stmt = stmt.where(models.MasterClaim.claim_id > last_id)
+        chunk = [dict(row._mapping) for row in db.execute(stmt.execution_options(yield_per=chunk_size))]
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1]["claim_id"]
+
+
+def _evaluate_row(plan: RulePlan, row: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Run static rule evaluation for one claim row; returns (claim dict, errors)."""
+    claim_dict = dict(row)
+    claim_dict["diagnosis_codes"] = parse_diagnoses(row["diagnosis_codes"])   # parsed once, not again by the evaluator
+    return claim_dict, evaluate_claim(claim_dict, plan)
+
+
+def _claim_outcome(claim_id: str, errors: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Returns (master_claims update mapping, claim_errors rows) for one evaluated claim."""
+    if not errors:
+        return {
+            "claim_id": claim_id,
+            "status": "Validated",
+            "error_type": "No error",
+            "error_explanation": [],
+            "recommended_action": "No action needed.",
+        }, []
+
+    categories = {err["category"] for err in errors}
+    if len(categories) == 1:
+        error_type = f"{list(categories)[0].capitalize()} error"
+    else:
+        error_type = "Both"
+
+    update_row = {
+        "claim_id": claim_id,
+        "status": "Not validated",
+        "error_type": error_type,
+        "error_explanation": [err["message"] for err in errors],
+        "recommended_action": "; ".join({err["recommendation"] for err in errors}),
+    }
+    error_rows = [
+        {
+            "claim_id": claim_id,
+            "rule_id": err["rule_id"],
+            "message": err["message"],
+            "recommendation": err["recommendation"],
+        }
+        for err in errors
+    ]
+    return update_row, error_rows
+
+
+def _validate_rows(plan: RulePlan, chunk: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """Static evaluation of a chunk (LLM enrichment runs later, see enrichment.py)."""
+    return [_claim_outcome(row["claim_id"], _evaluate_row(plan, row)[1]) for row in chunk]
+
+
+def _write_chunk(db: Session, updates: List[Dict[str, Any]], error_rows: List[Dict[str, Any]], deltas: Deltas,
+                 progress: JobProgress):
+    """Persist one chunk: bulk UPDATE by primary key, replace its claim_errors, adjust metrics, commit."""
+    claim_ids = [u["claim_id"] for u in updates]
+    with progress.stage("db_write"):
+        db.execute(update(models.MasterClaim), updates)
+        db.execute(delete(models.ClaimError).where(models.ClaimError.claim_id.in_(claim_ids)))
+        if error_rows:
+            db.execute(insert(models.ClaimError), error_rows)
+    with progress.stage("metrics"):
+        apply_deltas(db, deltas)
+    with progress.stage("db_write"), telemetry.DB_COMMIT_SECONDS.labels("validation").time():
+        db.commit()
+
+
+def _new_summary(job_id: str, tenant: str) -> Dict[str, Any]:
+    # categories: error_type -> {"count", "paid"} for the claims this job validated
+    return {"job_id": job_id, "tenant": tenant, "processed": 0, "validated": 0, "not_validated": 0,
+            "categories": {}}
+
+
+def _job_scope(job_id: str, tenant: str) -> list:
+    """The pending claims a job owns: ingested for this tenant under this job id."""
+    return [
+        models.MasterClaim.job_id == job_id,
+        models.MasterClaim.tenant == tenant,
+        models.MasterClaim.status == "Pending",
+    ]
+
+
+def _validate_pending(db: Session, plan: RulePlan, where: list, summary: Dict[str, Any],
+                      progress: JobProgress) -> Dict[str, Any]:
+    """
+    Validate the job's pending claims matching `where`, chunk by chunk; each
+    chunk is committed on its own and its progress flushed to Redis.
+    """
+    scope = _job_scope(summary["job_id"], summary["tenant"])
+    chunks = _iter_chunks(db, [*scope, *where])
+    while True:
+        with progress.stage("fetch"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        with progress.stage("evaluate"):
+            outcomes = _validate_rows(plan, chunk)
+
+        updates, error_rows, deltas = [], [], {}
+        for row, (update_row, errs) in zip(chunk, outcomes):
+            updates.append(update_row)
+            error_rows.extend(errs)
+
+            # pending claims are counted under "No error" until validated
+            track(deltas, "", row["paid_amount_aed"], -1)
+            track(deltas, update_row["error_type"], row["paid_amount_aed"])
+            cat = summary["categories"].setdefault(update_row["error_type"], {"count": 0, "paid": 0.0})
+            cat["count"] += 1
+            cat["paid"] += row["paid_amount_aed"] or 0.0
+        _write_chunk(db, updates, error_rows, deltas, progress)
+
+        # --- Optionally enrich with LLM, off the critical path ---
+        enqueue_enrichment(summary["job_id"], [u["claim_id"] for u in updates if u["status"] == "Not validated"])
+
+        summary["processed"] += len(updates)
+        failed = sum(1 for u in updates if u["status"] == "Not validated")
+        summary["not_validated"] += failed
+        summary["validated"] += len(updates) - failed
+        progress.incr(processed=len(updates), not_validated=failed, validated=len(updates) - failed).flush()
+        telemetry.push()
+        print(f"[Worker] {summary['processed']} claims validated so far.")
+    return summary
+
+
+def _set_meta(job_id: Optional[str] = None, **fields):
+    """
+    Merge `fields` into the meta of an RQ job (the running job, or `job_id`),
+    which /admin/job/{job_id} reports. No-op outside an RQ worker.
+    """
+    current = get_current_job()
+    if current is None:
+        return
+    try:
+        job = current if job_id in (None, current.id) else Job.fetch(job_id, connection=current.connection)
+        job.meta.update(fields)
+        job.save_meta()
+    except Exception as e:
+        print(f"[Worker] Could not update meta of job {job_id or current.id}: {e}")
+
+
+def _pushdown():
+    from . import pushdown   # imports this module
+    return pushdown
+
 
 def run_validation(job_id: str, tenant: str):
     print(f"[Worker] Running validation job {job_id} for tenant {tenant}")
 
     db: Session = SessionLocal()
+    progress = JobProgress(job_id)
     try:
-        # Load rules (parsed from uploaded files)
-        rules = load_rules(tenant)
-
-        # Fetch pending claims
-        pending_claims = db.query(models.MasterClaim).filter(models.MasterClaim.status == "Pending").all()
-        print(f"[Worker] Found {len(pending_claims)} pending claims.")
-
-        for claim in pending_claims:
-            claim_dict = {
-                "claim_id": claim.claim_id,
-                "encounter_type": claim.encounter_type,
-                "service_date": claim.service_date,
-                "national_id": claim.national_id,
-                "member_id": claim.member_id,
-                "facility_id": claim.facility_id,
-                "unique_id": claim.unique_id,
-                "diagnosis_codes": (claim.diagnosis_codes or "").split(";"),
-                "service_code": claim.service_code,
-                "paid_amount_aed": claim.paid_amount_aed,
-                "approval_number": claim.approval_number,
-            }
-
-            # --- Run static rule evaluation ---
-            errors = evaluate_claim(claim_dict, rules)
-
-            # --- Optionally enrich with LLM ---
-            if errors:
-                llm_explanations = explain_with_llm(claim_dict, errors)
-                # merge LLM text into explanations
-                for i, err in enumerate(errors):
-                    if i < len(llm_explanations):
-                        err["message"] += f" | LLM says: {llm_explanations[i]}"
-
-            # --- Update DB ---
-            if errors:
-                claim.status = "Not validated"
-                categories = {err["category"] for err in errors}
-                if len(categories) == 1:
-                    claim.error_type = f"{list(categories)[0].capitalize()} error"
-                else:
-                    claim.error_type = "Both"
-
-                claim.error_explanation = [err["message"] for err in errors]
-                claim.recommended_action = "; ".join({err["recommendation"] for err in errors})
-
-                # Insert into claim_errors
-                for err in errors:
-                    ce = models.ClaimError(
-                        claim_id=claim.claim_id,
-                        rule_id=err["rule_id"],
-                        message=err["message"],
-                        recommendation=err["recommendation"],
-                    )
-                    db.add(ce)
-
-            else:
-                claim.status = "Validated"
-                claim.error_type = "No error"
-                claim.error_explanation = []
-                claim.recommended_action = "No action needed."
-
-            db.add(claim)
+        # Load rules (parsed from uploaded files); compiled once and cached until the files change
+        with progress.stage("load_rules"):
+            plan = get_plan(tenant)
 
-        db.commit()
-
-        # --- Compute metrics for charts ---
-        _compute_metrics(db)
+        if VALIDATION_MODE == "pushdown" and _pushdown().supported(db):
+            summary = _pushdown().validate_job(db, plan, _new_summary(job_id, tenant), progress)
+        else:
+            # claim_metrics is adjusted chunk by chunk alongside the claims
+            summary = _validate_pending(db, plan, [], _new_summary(job_id, tenant), progress)
 
+        _set_meta(job_id, stage="complete", summary=summary)
         print("[Worker] Validation complete.")
+        return summary
 
     except Exception as e:
+        db.rollback()
+        _set_meta(job_id, stage="failed", error=str(e))
         print(f"[Worker] ERROR: {e}")
+        raise   # RQ records the job as failed
     finally:
+        progress.flush()
+        telemetry.push()
         db.close()
 
 
-def _compute_metrics(db: Session):
-    """Aggregate metrics and store in claim_metrics."""
-    db.query(models.ClaimMetrics).delete()  # reset metrics
-    db.commit()
-
-    results = db.query(
-        models.MasterClaim.error_type,
-        models.MasterClaim.status,
-        models.MasterClaim.paid_amount_aed
-    ).all()
-
-    metrics = {}
-    for error_type, status, paid in results:
-        cat = error_type or "No error"
-        if cat not in metrics:
-            metrics[cat] = {"count": 0, "paid": 0.0}
-        metrics[cat]["count"] += 1
-        metrics[cat]["paid"] += paid or 0.0
-
-    for cat, vals in metrics.items():
-        m = models.ClaimMetrics(
-            category=cat,
-            count=vals["count"],
-            paid=vals["paid"]
-        )
-        db.add(m)
-
-    db.commit()
+# ---------------------------------------------------------------------------
+# Fan-out / fan-in: one upload split into claim_id ranges across RQ workers
+# ---------------------------------------------------------------------------
+
+VALIDATION_SHARDS = int(os.getenv("VALIDATION_SHARDS", "4"))
+VALIDATION_SHARD_MIN = int(os.getenv("VALIDATION_SHARD_MIN", "5000"))
+# seconds before RQ kills a validate, shard or reduce job (RQ's own default is 180)
+VALIDATION_JOB_TIMEOUT = int(os.getenv("VALIDATION_JOB_TIMEOUT", "3600"))
+
+
+def _shard_where(lo: Optional[str], hi: Optional[str]) -> list:
+    where = []
+    if lo is not None:
+        where.append(models.MasterClaim.claim_id >= lo)
+    if hi is not None:
+        where.append(models.MasterClaim.claim_id < hi)
+    return where
+
+
+def pending_count(db: Session, job_id: str, tenant: str) -> int:
+    return db.query(func.count(models.MasterClaim.claim_id)).filter(*_job_scope(job_id, tenant)).scalar() or 0
+
+
+def shard_bounds(db: Session, job_id: str, tenant: str, shards: Optional[int] = None,
+                 min_size: Optional[int] = None, total: Optional[int] = None) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Split the job's pending claims into at most `shards` contiguous claim_id
+    ranges [lo, hi) of at least `min_size` claims. None means unbounded on that side.
+    """
+    shards = shards or VALIDATION_SHARDS
+    min_size = min_size or VALIDATION_SHARD_MIN
+    scope = _job_scope(job_id, tenant)
+    if total is None:
+        total = pending_count(db, job_id, tenant)
+    n = max(1, min(shards, total // min_size))
+    if n == 1:
+        return [(None, None)]
+
+    # keyset boundaries: the claim_id at every total/n-th position
+    per = -(-total // n)
+    cuts = []
+    for k in range(1, n):
+        cut = db.execute(
+            select(models.MasterClaim.claim_id).where(*scope)
+            .order_by(models.MasterClaim.claim_id).offset(k * per).limit(1)
+        ).scalar()
+        if cut is not None and (not cuts or cut > cuts[-1]):
+            cuts.append(cut)
+    edges = [None] + cuts + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def run_validation_shard(job_id: str, tenant: str, lo: Optional[str], hi: Optional[str]):
+    """Validate the job's pending claims with lo <= claim_id < hi (metrics are adjusted per chunk)."""
+    print(f"[Worker] Running validation shard [{lo}, {hi}) of job {job_id} for tenant {tenant}")
+
+    db: Session = SessionLocal()
+    progress = JobProgress(job_id)
+    try:
+        with progress.stage("load_rules"):
+            plan = get_plan(tenant)
+        summary = _validate_pending(db, plan, _shard_where(lo, hi), _new_summary(job_id, tenant), progress)
+        summary["shard"] = [lo, hi]
+        return summary
+    except Exception as e:
+        db.rollback()
+        # the shard job fails; the reducer (allow_failure) reports it on the upload job
+        _set_meta(stage="failed", error=str(e))
+        print(f"[Worker] ERROR in shard [{lo}, {hi}): {e}")
+        raise
+    finally:
+        progress.flush()
+        telemetry.push()
+        db.close()
+
+
+def _merge_summaries(job_id: str, tenant: str, results: List[Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+    merged = _new_summary(job_id, tenant)
+    merged["shards"] = len(results)
+    merged["failed_shards"] = 0
+    for res in results:
+        if not res:
+            merged["failed_shards"] += 1
+            continue
+        for key in ("processed", "validated", "not_validated"):
+            merged[key] += res.get(key, 0)
+        for cat, vals in (res.get("categories") or {}).items():
+            acc = merged["categories"].setdefault(cat, {"count": 0, "paid": 0.0})
+            acc["count"] += vals["count"]
+            acc["paid"] += vals["paid"]
+    return merged
+
+
+def _shard_results(shard_job_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+    current = get_current_job()
+    if current is not None:
+        connection = current.connection
+    else:
+        from .queue import redis_conn as connection
+    return [job.result if job else None for job in Job.fetch_many(shard_job_ids, connection=connection)]
+
+
+def reduce_validation(job_id: str, tenant: str, shard_job_ids: List[str]):
+    """
+    Fan-in step, enqueued once every shard has finished: merges the shard
+    summaries (metrics were already adjusted by each shard) and marks the
+    upload job complete, or "partial"/"failed" when some/all shards failed
+    (their claims stay Pending).
+    """
+    summary = _merge_summaries(job_id, tenant, _shard_results(shard_job_ids))
+    failed = summary["failed_shards"]
+    if not failed:
+        _set_meta(job_id, stage="complete", summary=summary)
+    else:
+        _set_meta(job_id, stage="failed" if failed == summary["shards"] else "partial", summary=summary,
+                  error=f"{failed} of {summary['shards']} validation shards failed")
+    print(f"[Worker] Validation job {job_id} {'complete' if not failed else 'incomplete'}: "
+          f"{summary['processed']} claims across {summary['shards']} shards ({failed} failed).")
+    return summary
+
+
+def enqueue_validation(db: Session, q: Queue, job_id: str, tenant: str) -> Job:
+    """
+    Enqueue validation of the job's pending claims. Small uploads run as a
+    single run_validation job ({job_id}-validate); larger ones fan out into
+    shard jobs plus a dependent reducer ({job_id}-reduce). Both mark the
+    upload job `job_id` complete when they finish. In pushdown mode the
+    database does the work, so there is nothing to shard.
+    """
+    total = pending_count(db, job_id, tenant)
+    JobProgress(job_id).set(total=total).flush()
+    bounds = [] if VALIDATION_MODE == "pushdown" else shard_bounds(db, job_id, tenant, total=total)
+    if len(bounds) <= 1:
+        return q.enqueue(run_validation, job_id, tenant, job_id=f"{job_id}-validate",
+                         job_timeout=VALIDATION_JOB_TIMEOUT)
+
+    shard_jobs = [
+        q.enqueue(run_validation_shard, job_id, tenant, lo, hi, job_id=f"{job_id}-shard{i}",
+                  job_timeout=VALIDATION_JOB_TIMEOUT)
+        for i, (lo, hi) in enumerate(bounds)
+    ]
+    shard_ids = [j.id for j in shard_jobs]
+    print(f"[Worker] Job {job_id} split into {len(shard_ids)} shards.")
+    return q.enqueue(
+        reduce_validation, job_id, tenant, shard_ids,
+        job_id=f"{job_id}-reduce", depends_on=Dependency(jobs=shard_ids, allow_failure=True),
+        job_timeout=VALIDATION_JOB_TIMEOUT,
+    )
+
+
+# ---------------------------------------------------------------------------
+# First stage of an upload: ingest the staged files, then fan out validation
+# ---------------------------------------------------------------------------
+
+def run_ingestion(job_id: str, tenant: str, claims_path: str, technical_path: str, medical_path: str):
+    """
+    Runs as the upload's RQ job (id `job_id`): streams the staged claims file
+    into master_claims, saves the rule files and enqueues validation. Progress
+    and schema errors are reported in the job's meta. The staging directory is
+    removed afterwards.
+    """
+    print(f"[Worker] Ingesting upload {job_id} for tenant {tenant}")
+    result = {"job_id": job_id, "tenant": tenant}
+    db: Session = SessionLocal()
+    progress = JobProgress(job_id)
+
+    def ingested(counts: Dict[str, int]):
+        n = counts["inserted"] + counts["updated"] + counts["unchanged"]
+        _set_meta(ingested=n)
+        progress.set(ingested=n).flush()
+
+    try:
+        _set_meta(stage="ingesting", ingested=0)
+        try:
+            with open(claims_path, "rb") as f, progress.stage("ingest"):
+                counts = ingest_claims(db, f, claims_path, tenant=tenant, job_id=job_id, progress=ingested)
+        except SchemaError as e:
+            record_schema_error(db, e.missing_columns, tenant, job_id)
+            _set_meta(stage="failed", error="schema_missing", missing_columns=e.missing_columns)
+            print(f"[Worker] Upload {job_id} rejected: {e}")
+            return dict(result, error="schema_missing", missing_columns=e.missing_columns)
+        except ClaimsFileError as e:
+            _set_meta(stage="failed", error="unreadable_claims_file", detail=str(e))
+            print(f"[Worker] Upload {job_id} rejected: could not read claims file: {e}")
+            return dict(result, error="unreadable_claims_file", detail=str(e))
+        result.update(counts)
+
+        # ---- Save rules (unchanged files and already-parsed PDFs are skipped) ----
+        _set_meta(stage="saving_rules", inserted=counts["inserted"], updated=counts["updated"],
+                  unchanged=counts["unchanged"])
+        old_plan = get_plan(tenant)
+        rules_changed = False
+        for kind, path in (("technical", technical_path), ("medical", medical_path)):
+            with open(path, "rb") as f:
+                rules_changed = save_rule_upload(tenant, kind, f.read()) or rules_changed
+
+        # ---- Unchanged claims kept their status; re-check those the new rules affect ----
+        if rules_changed:
+            from .revalidate import diff_is_empty, plan_diff, revalidate
+            plan = get_plan(tenant)
+            diff = plan_diff(old_plan, plan)
+            if not diff_is_empty(diff):
+                _set_meta(stage="revalidating", diff=diff)
+                # counted apart from this upload's validation progress
+                result["revalidated"] = revalidate(db, plan, tenant, diff, JobProgress(f"{job_id}-rules"), job_id)
+                _set_meta(revalidated=result["revalidated"])
+
+        # ---- Enqueue validation (sharded across workers for large uploads) ----
+        _set_meta(stage="validating")
+        from .queue import queue
+        enqueue_validation(db, queue, job_id, tenant)
+        return result
+    finally:
+        progress.flush()
+        telemetry.push()
+        db.close()
+        shutil.rmtree(os.path.dirname(claims_path), ignore_errors=True)
+
+
+# ---------------------------------------------------------------------------
+# Worker process: compiled rules outlive the per-job fork
+# ---------------------------------------------------------------------------
+
+# jobs taking (job_id, tenant, ...) that compile the tenant's rules
+_PLAN_JOBS = {f"{__name__}.{name}" for name in
+              ("run_ingestion", "run_validation", "run_validation_shard")} | {"app.pipeline.revalidate.run_rule_update"}
+
+
+class PlanCachingWorker(Worker):
+    """
+    RQ worker that warms the rule_cache plans before each job.
+
+    RQ forks a fresh work horse for every job and the horse exits when the job
+    ends, so anything a job puts in process memory is gone for the next one:
+    compiled plans, the in-process cache tiers (cache.TieredCache, hence their
+    Redis tier) and telemetry values (hence telemetry.push). The fork does copy
+    the parent's memory, so plans compiled here in the parent are inherited by
+    every horse. Unchanged rule files cost one stat() per tenant.
+
+        rq worker --worker-class app.pipeline.worker.PlanCachingWorker validation enrichment
+    """
+
+    def fork_work_horse(self, job: Job, queue: Queue):
+        tenants = [job.args[1]] if job.func_name in _PLAN_JOBS and len(job.args) > 1 else []
+        preload_plans(tenants)
+        return super().fork_work_horse(job, queue)
+
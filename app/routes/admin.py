@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 import datetime
 from ..pipeline.queue import redis_conn
+from ..pipeline.progress import read_progress
 from rq.job import Job
 
 router = APIRouter()
@@ -13,6 +14,9 @@ def health():
 def job_status(job_id: str):
     try:
         job = Job.fetch(job_id, connection=redis_conn)
-        return {"id": job.id, "status": job.get_status(), "result": job.result}
+        # meta carries the pipeline stage and schema errors; progress aggregates
+        # counters and stage timings across the job's shards and enrichment jobs
+        return {"id": job.id, "status": job.get_status(), "meta": job.meta, "result": job.result,
+                "progress": read_progress(job_id)}
     except Exception as e:
         return {"error": str(e)}
@@ -1,10 +1,93 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from ..db import get_db
+from ..db import get_db, SessionLocal
 from .. import models
+from ..pipeline.diagnoses import with_diagnosis
+from ..pipeline.export import EXPORT_FORMATS, parquet_available, stream_export
 
 router = APIRouter()
 
+CLAIM_FIELDS = [c.name for c in models.MasterClaim.__table__.columns]
+FILTER_FIELDS = ("status", "error_type", "facility_id", "service_code", "tenant")
+MAX_PAGE_SIZE = 1000
+DEFAULT_PAGE_SIZE = 100
+
+
 @router.get("/claims")
-def get_claims(db: Session = Depends(get_db)):
-    return db.query(models.MasterClaim).all()
+def get_claims(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE,
+                                 description=f"Page size (default {DEFAULT_PAGE_SIZE} once paging)"),
+    status: Optional[str] = None,
+    error_type: Optional[str] = None,
+    facility_id: Optional[str] = None,
+    service_code: Optional[str] = None,
+    tenant: Optional[str] = None,
+    diagnosis: Optional[str] = Query(None, description="Only claims with this diagnosis code"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return (claim_id is always included)"),
+    db: Session = Depends(get_db)
+):
+    """
+    One page of claims in claim_id order. Pass the returned next_cursor back as
+    `cursor` to fetch the following page; it is null on the last page.
+    Without `cursor` and `limit` the original response is kept for existing
+    clients: a plain list of every matching claim.
+    """
+    names = CLAIM_FIELDS
+    if fields:
+        names = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in names if f not in CLAIM_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail={"error": "unknown_fields", "fields": unknown})
+        names = ["claim_id"] + [f for f in names if f != "claim_id"]
+
+    table = models.MasterClaim.__table__
+    stmt = select(*[table.c[n] for n in names])
+    values = {"status": status, "error_type": error_type, "facility_id": facility_id,
+              "service_code": service_code, "tenant": tenant}
+    for name in FILTER_FIELDS:
+        if values[name] is not None:
+            stmt = stmt.where(table.c[name] == values[name])
+    if diagnosis:
+        stmt = stmt.where(with_diagnosis([diagnosis.strip().upper()]))
+    stmt = stmt.order_by(table.c.claim_id)
+    if cursor is None and limit is None:
+        return [dict(r) for r in db.execute(stmt).mappings()]
+
+    limit = limit or DEFAULT_PAGE_SIZE
+    if cursor is not None:
+        stmt = stmt.where(table.c.claim_id > cursor)
+    # fetch one extra row to know whether another page exists
+    rows = db.execute(stmt.limit(limit + 1)).mappings().all()
+    items = [dict(r) for r in rows[:limit]]
+    next_cursor = items[-1]["claim_id"] if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@router.get("/claims/export")
+def export_claims(
+    format: str = Query("csv", description="csv, ndjson or parquet"),
+    job_id: Optional[str] = None,
+    tenant: Optional[str] = None
+):
+    """
+    Stream claims joined with their errors (one row per error) for a job and/or
+    tenant. Rows are read through a server-side cursor and sent chunk by chunk.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format {format!r}; use one of {', '.join(EXPORT_FORMATS)}")
+    if job_id is None and tenant is None:
+        raise HTTPException(status_code=400, detail="Pass job_id and/or tenant to export")
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow to be installed")
+
+    filename = f"claims_{job_id or tenant}.{format}"
+    return StreamingResponse(
+        stream_export(SessionLocal, format, job_id, tenant),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
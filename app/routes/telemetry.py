@@ -0,0 +1,28 @@
+# app/routes/telemetry.py
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..db import engine
+from ..pipeline.queue import enrichment_queue, queue
+from ..utils import telemetry
+
+router = APIRouter()
+
+
+def _queue_depth():
+    return [({"queue": q.name}, q.count) for q in (queue, enrichment_queue)]
+
+
+def _pool():
+    pool = engine.pool
+    return [({"state": "checked_out"}, pool.checkedout()), ({"state": "idle"}, pool.checkedin())]
+
+
+telemetry.gauge("rcm_queue_depth", "Jobs waiting in each RQ queue.", _queue_depth)
+telemetry.gauge("rcm_db_pool_connections", "API database pool connections by state.", _pool)
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics_exposition():
+    """Prometheus text exposition: this process's metrics plus those pushed by workers."""
+    return PlainTextResponse(telemetry.render(), media_type=telemetry.CONTENT_TYPE)
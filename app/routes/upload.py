@@ -1,148 +1,108 @@
 # app/routes/upload.py
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ..db import get_db
-from .. import models
-import pandas as pd
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status
+import os
+import shutil
 import uuid
-import io
 from ..pipeline.queue import queue
-from ..pipeline.worker import run_validation
-from ..db_utils import upsert
+from ..pipeline.worker import run_ingestion
+from ..pipeline.revalidate import run_rule_update
+from ..pipeline.ingest import STAGING_DIR
+from ..utils.concurrency import run_blocking
 
 router = APIRouter()
 
-REQUIRED_COLUMNS = [
-    "claim_id", "encounter_type", "service_date", "national_id",
-    "member_id", "facility_id", "unique_id", "diagnosis_codes",
-    "service_code", "paid_amount_aed", "approval_number"
-]
+INGEST_JOB_TIMEOUT = int(os.getenv("INGEST_JOB_TIMEOUT", "3600"))
+RULE_UPDATE_JOB_TIMEOUT = int(os.getenv("RULE_UPDATE_JOB_TIMEOUT", "3600"))
 
-INSTRUCTION_SNIPPET = (
-    "Submission schema required: claim_id | encounter_type | service_date | national_id | "
-    "member_id | facility_id | unique_id | diagnosis_codes | service_code | paid_amount_aed | approval_number."
-)
 
-@router.post("/upload")
+def _spool(upload: UploadFile, job_dir: str, name: str) -> str:
+    """Copy an upload to the staging directory (keeping its extension) and return the path."""
+    ext = os.path.splitext(upload.filename or "")[1].lower()
+    path = os.path.join(job_dir, name + ext)
+    upload.file.seek(0)
+    with open(path, "wb") as out:
+        shutil.copyfileobj(upload.file, out, 1024 * 1024)
+    return path
+
+
+def _stage_upload(job_id: str, claims: UploadFile, technical: UploadFile, medical: UploadFile):
+    job_dir = os.path.join(STAGING_DIR, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    return _spool(claims, job_dir, "claims"), _spool(technical, job_dir, "technical"), _spool(medical, job_dir, "medical")
+
+
+def _stage_rules(job_id: str, technical: Optional[UploadFile], medical: Optional[UploadFile]):
+    job_dir = os.path.join(STAGING_DIR, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    return (_spool(technical, job_dir, "technical") if technical else None,
+            _spool(medical, job_dir, "medical") if medical else None)
+
+
+@router.post("/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_files(
     claims: UploadFile = File(...),
     technical: UploadFile = File(...),
     medical: UploadFile = File(...),
-    tenant: str = Form("default"),
-    db: Session = Depends(get_db)
+    tenant: str = Form("default")
+):
+    """
+    Accept claims + rules and return immediately. The files are spooled to the
+    staging area; ingestion (schema check, claim upserts, rule parsing) runs as
+    the first stage of the background job, followed by validation. Poll
+    /admin/job/{job_id} for progress and schema errors.
+    """
+    job_id = str(uuid.uuid4())
+
+    try:
+        paths = await run_blocking(_stage_upload, job_id, claims, technical, medical)
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Could not stage upload: {e}")
+
+    try:
+        queue.enqueue(run_ingestion, job_id, tenant, *paths, job_id=job_id,
+                      job_timeout=INGEST_JOB_TIMEOUT, meta={"stage": "queued", "tenant": tenant})
+    except Exception as e:
+        shutil.rmtree(os.path.dirname(paths[0]), ignore_errors=True)
+        raise HTTPException(status_code=500, detail=f"Failed to enqueue job: {e}")
+
+    return {
+        "message": "Files accepted. Ingestion and validation running in background.",
+        "job_id": job_id,
+        "status_url": f"/admin/job/{job_id}"
+    }
+
+
+@router.post("/rules", status_code=status.HTTP_202_ACCEPTED)
+async def update_rules(
+    technical: Optional[UploadFile] = File(None),
+    medical: Optional[UploadFile] = File(None),
+    tenant: str = Form("default")
 ):
     """
-    Upload claims + rules, do schema validation immediately,
-    then enqueue background validation (static + LLM).
+    Replace a tenant's technical and/or medical rules without uploading claims.
+    The background job saves the rules, works out which claims the change can
+    affect and revalidates only those. Poll /admin/job/{job_id} for the diff
+    and a summary.
     """
+    if technical is None and medical is None:
+        raise HTTPException(status_code=400, detail="Upload a technical and/or medical rules file.")
     job_id = str(uuid.uuid4())
 
     try:
-        # ---- Step 1: Read claims Excel ----
-        content = await claims.read()
-        try:
-            df = pd.read_excel(io.BytesIO(content), engine="openpyxl")
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Could not read claims Excel file: {e}")
-
-        df.columns = [str(c).strip().lower() for c in df.columns]
-
-        # ---- Step 2: Handle claim_id ----
-        cols = df.columns.tolist()
-        if "claim_id" not in cols:
-            df.insert(0, "claim_id", [f"AUTO_{i+1}" for i in range(len(df))])
-            print("[Upload] claim_id missing -> auto-generated.")
-
-        # Check for other required columns
-        missing_cols = [c for c in REQUIRED_COLUMNS if c not in df.columns]
-        if missing_cols:
-            placeholder_id = f"UPLOAD_SCHEMA_ERROR_{job_id}"
-            explanation = [f"Missing required columns: {', '.join(missing_cols)}", INSTRUCTION_SNIPPET]
-            placeholder = models.MasterClaim(
-                claim_id=placeholder_id,
-                encounter_type=None,
-                service_date=None,
-                national_id=None,
-                member_id=None,
-                facility_id=None,
-                unique_id=None,
-                diagnosis_codes=None,
-                service_code=None,
-                paid_amount_aed=None,
-                approval_number=None,
-                status="Not validated",
-                error_type="Technical error",
-                error_explanation=explanation,
-                recommended_action=f"Add missing columns: {', '.join(missing_cols)}. {INSTRUCTION_SNIPPET}"
-            )
-            upsert(db, placeholder)
-            db.commit()
-            raise HTTPException(status_code=400, detail={"error": "schema_missing", "missing_columns": missing_cols})
-
-        # ---- Step 3: Insert all claims as Pending ----
-        inserted = 0
-        for _, raw_row in df.iterrows():
-            row = {k: (v if not (isinstance(v, float) and pd.isna(v)) else None) for k, v in raw_row.items()}
-            claim_id_val = str(row.get("claim_id") or f"auto_{uuid.uuid4()}")
-
-            claim = models.MasterClaim(
-                claim_id=claim_id_val,
-                encounter_type=row.get("encounter_type"),
-                service_date=row.get("service_date"),
-                national_id=row.get("national_id"),
-                member_id=row.get("member_id"),
-                facility_id=row.get("facility_id"),
-                unique_id=row.get("unique_id"),
-                diagnosis_codes=row.get("diagnosis_codes"),
-                service_code=row.get("service_code"),
-                paid_amount_aed=row.get("paid_amount_aed"),
-                approval_number=row.get("approval_number"),
-                status="Pending",
-                error_type="",
-                error_explanation=[],
-                recommended_action=""
-            )
-
-            upsert(db, claim)
-            inserted += 1
-
-        # Commit once after all rows
-        db.commit()
-
-        # ---- Step 4: Save rules ----
-        tech_bytes = await technical.read()
-        med_bytes = await medical.read()
-
-        try:
-            import json as _json
-            _decoded = _json.loads(tech_bytes.decode("utf-8"))
-            with open(f"app/rules/{tenant}_technical.json", "w", encoding="utf-8") as f:
-                f.write(_json.dumps(_decoded, indent=2))
-        except Exception:
-            with open(f"app/rules/{tenant}_technical.pdf", "wb") as f:
-                f.write(tech_bytes)
-
-        try:
-            _decoded = _json.loads(med_bytes.decode("utf-8"))
-            with open(f"app/rules/{tenant}_medical.json", "w", encoding="utf-8") as f:
-                f.write(_json.dumps(_decoded, indent=2))
-        except Exception:
-            with open(f"app/rules/{tenant}_medical.pdf", "wb") as f:
-                f.write(med_bytes)
-
-        # ---- Step 5: Enqueue async validation job ----
-        try:
-            job = queue.enqueue(run_validation, job_id, tenant)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to enqueue job: {e}")
-
-        return {
-            "message": "Files uploaded successfully. Validation running in background.",
-            "job_id": job.id if job else job_id,
-            "inserted": inserted
-        }
-
-    except HTTPException:
-        raise
+        paths = await run_blocking(_stage_rules, job_id, technical, medical)
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Could not stage upload: {e}")
+
+    try:
+        queue.enqueue(run_rule_update, job_id, tenant, *paths, job_id=job_id,
+                      job_timeout=RULE_UPDATE_JOB_TIMEOUT, meta={"stage": "queued", "tenant": tenant})
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Upload error: {str(e)}")
+        shutil.rmtree(os.path.join(STAGING_DIR, job_id), ignore_errors=True)
+        raise HTTPException(status_code=500, detail=f"Failed to enqueue job: {e}")
+
+    return {
+        "message": "Rules accepted. Affected claims are being revalidated in background.",
+        "job_id": job_id,
+        "status_url": f"/admin/job/{job_id}"
+    }
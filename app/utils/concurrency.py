@@ -0,0 +1,37 @@
+# app/utils/concurrency.py
+"""
+Thread-pool offload for blocking file I/O called from async request handlers.
+
+Spooling an upload's files to the staging directory (routes/upload.py) is
+synchronous. Awaiting it through run_blocking runs it on a worker thread, so
+the event loop keeps serving other requests (health checks, claim reads)
+while a large upload is being written. Parsing and database work happen in
+the background job, not here. The offload has its own limiter, so a burst of
+uploads cannot exhaust the default thread pool used by FastAPI's sync
+endpoints.
+"""
+import functools
+import os
+from typing import Any, Callable, Optional, TypeVar
+
+import anyio.to_thread
+from anyio import CapacityLimiter
+
+T = TypeVar("T")
+
+# concurrent upload spools; each is one large sequential write
+UPLOAD_IO_THREADS = int(os.getenv("UPLOAD_IO_THREADS", "4"))
+
+_io_limiter: Optional[CapacityLimiter] = None
+
+
+def _limiter() -> CapacityLimiter:
+    global _io_limiter
+    if _io_limiter is None:
+        _io_limiter = CapacityLimiter(UPLOAD_IO_THREADS)
+    return _io_limiter
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking file I/O call on the offload pool and await its result."""
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=_limiter())
@@ -0,0 +1,315 @@
+# app/utils/telemetry.py
+"""
+Prometheus-style counters and histograms for the hot paths, rendered in the
+text exposition format by GET /metrics.
+
+There is no client library: a metric holds one small child per label set and
+`labels(...)` returns that child, so recording on a hot path is a bisect and
+two additions under an uncontended lock. The API process keeps its values in
+memory. A worker's values would be lost when its job exits, so it calls push()
+after every chunk: push() drains the local values into one Redis hash with HINCRBYFLOAT, and /metrics adds that hash to the API's own
+values. Counters and histogram buckets only ever grow, so any number of
+workers can push concurrently. Per-claim evaluation timing is sampled
+(TELEMETRY_EVALUATE_SAMPLE); TELEMETRY_ENABLED=0 turns recording off.
+"""
+import bisect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "1").lower() in {"1", "true", "yes"}
+TELEMETRY_KEY = "rcm:telemetry"
+
+# seconds; requests, DB statements, LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# per-claim evaluation timing is recorded for one claim in EVALUATE_SAMPLE
+EVALUATE_SAMPLE = max(1, int(os.getenv("TELEMETRY_EVALUATE_SAMPLE", "16")))
+
+# seconds; per-claim rule evaluation
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (labels, suffix, le) -> value
+Samples = Dict[Tuple[str, str, str], float]
+
+REGISTRY: List["_Metric"] = []
+_GAUGES: List[Tuple[str, str, Callable[[], Iterable[Tuple[Dict[str, str], float]]]]] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, n: float = 1.0) -> None:
+        with self._lock:
+            self.value += n
+
+    def collect(self, out: Samples, labels: str, drain: bool) -> None:
+        with self._lock:
+            value = self.value
+            if drain:
+                self.value = 0.0
+        if value or not drain:
+            out[(labels, "", "")] = value
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def collect(self, out: Samples, labels: str, drain: bool) -> None:
+        with self._lock:
+            counts, total = self.counts, self.sum
+            if drain:
+                self.counts, self.sum = [0] * len(counts), 0.0
+        if drain and not any(counts):
+            return
+        cumulative = 0
+        for le, n in zip((*self.buckets, math.inf), counts):
+            cumulative += n
+            out[(labels, "_bucket", _fmt(le))] = cumulative
+        out[(labels, "_sum", "")] = total
+        out[(labels, "_count", "")] = cumulative
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: Any, **by_name: Any):
+        """The child for one label set; keep it around on hot paths."""
+        key = tuple(str(by_name[n]) for n in self.labelnames) if by_name else tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def samples(self, drain: bool = False) -> Samples:
+        out: Samples = {}
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            child.collect(out, _label_str(self.labelnames, values), drain)
+        return out
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, n: float = 1.0) -> None:
+        self.labels().inc(n)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+def gauge(name: str, help: str, read: Callable[[], Iterable[Tuple[Dict[str, str], float]]]) -> None:
+    """Register a gauge read at scrape time; `read` returns (labels, value) pairs and may raise."""
+    _GAUGES.append((name, help, read))
+
+
+# ---------------------------------------------------------------------------
+# Hot-path metrics
+# ---------------------------------------------------------------------------
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "rcm_http_request_seconds", "HTTP request latency by route template.", ("method", "route", "status"))
+EVALUATE_SECONDS = Histogram(
+    "rcm_evaluate_claim_seconds", "Rule evaluation time per claim (sampled).", buckets=FAST_BUCKETS)
+EVALUATE_FAMILY_SECONDS = Histogram(
+    "rcm_evaluate_family_seconds", "Rule evaluation time per claim and rule family (sampled).", ("family",), FAST_BUCKETS)
+DB_UPSERT_SECONDS = Histogram(
+    "rcm_db_upsert_seconds", "Duration of db_utils upserts.", ("op",))
+DB_COMMIT_SECONDS = Histogram(
+    "rcm_db_commit_seconds", "Duration of pipeline commits.", ("site",))
+DB_POOL_WAIT_SECONDS = Histogram(
+    "rcm_db_pool_wait_seconds", "Time request handlers wait to check a connection out of the pool.")
+LLM_REQUEST_SECONDS = Histogram(
+    "rcm_llm_request_seconds", "Latency of inference endpoint calls (one per attempt).", ("outcome",))
+LLM_FAILURES = Counter(
+    "rcm_llm_failures_total", "Failed inference attempts and skipped calls.", ("reason",))
+
+
+# ---------------------------------------------------------------------------
+# Worker push / exposition
+# ---------------------------------------------------------------------------
+
+_push_paused_until = 0.0
+
+
+def _field(name: str, key: Tuple[str, str, str]) -> str:
+    return "\x1f".join((name, *key))
+
+
+def _default_conn():
+    from ..pipeline.cache import redis_connection
+    return redis_connection()
+
+
+def push(conn: Any = None) -> None:
+    """Drain this process's values into the shared Redis hash (worker side)."""
+    global _push_paused_until
+    if not TELEMETRY_ENABLED or time.monotonic() < _push_paused_until:
+        return
+    fields = {
+        _field(metric.name, key): value
+        for metric in REGISTRY
+        for key, value in metric.samples(drain=True).items()
+    }
+    if not fields:
+        return
+    conn = conn if conn is not None else _default_conn()
+    if conn is None:
+        return
+    try:
+        pipe = conn.pipeline()
+        for field, value in fields.items():
+            pipe.hincrbyfloat(TELEMETRY_KEY, field, value)
+        pipe.execute()
+    except Exception as e:
+        _push_paused_until = time.monotonic() + 60
+        print(f"[Telemetry] Could not push worker metrics (paused for 60s): {e}")
+
+
+def _pushed(conn: Any) -> Dict[str, Samples]:
+    try:
+        raw = conn.hgetall(TELEMETRY_KEY) if conn is not None else {}
+    except Exception:
+        return {}
+    out: Dict[str, Samples] = {}
+    for field, value in raw.items():
+        field = field.decode() if isinstance(field, bytes) else field
+        parts = field.split("\x1f")
+        if len(parts) != 4:
+            continue
+        out.setdefault(parts[0], {})[tuple(parts[1:])] = float(value)
+    return out
+
+
+_SUFFIX_ORDER = {"": 0, "_bucket": 0, "_sum": 1, "_count": 2}
+
+
+def _sort_key(key: Tuple[str, str, str]):
+    labels, suffix, le = key
+    return labels, _SUFFIX_ORDER.get(suffix, 3), float(le) if le else 0.0
+
+
+def _series(name: str, key: Tuple[str, str, str], value: float) -> str:
+    labels, suffix, le = key
+    if le:
+        labels = f'{labels},le="{le}"' if labels else f'le="{le}"'
+    return f"{name}{suffix}{{{labels}}} {_fmt(value)}" if labels else f"{name}{suffix} {_fmt(value)}"
+
+
+def render(conn: Any = None, include_pushed: bool = True) -> str:
+    """Text exposition of this process's metrics plus those pushed by workers."""
+    pushed = _pushed(conn if conn is not None else _default_conn()) if include_pushed else {}
+    lines: List[str] = []
+    for metric in REGISTRY:
+        samples = metric.samples()
+        for key, value in pushed.get(metric.name, {}).items():
+            samples[key] = samples.get(key, 0.0) + value
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(_series(metric.name, key, samples[key]) for key in sorted(samples, key=_sort_key))
+    for name, help, read in _GAUGES:
+        try:
+            values = list(read())
+        except Exception:
+            continue
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in values:
+            key = (_label_str(tuple(labels), tuple(str(v) for v in labels.values())), "", "")
+            lines.append(_series(name, key, value))
+    return "\n".join(lines) + "\n"
+
+
+class RequestTimer:
+    """ASGI middleware: observes rcm_http_request_seconds once the response is sent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TELEMETRY_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # route templates (/admin/job/{job_id}) keep label cardinality bounded
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, status[0]).observe(time.perf_counter() - started)
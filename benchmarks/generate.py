@@ -0,0 +1,196 @@
+# benchmarks/generate.py
+"""
+Synthetic claims for benchmarks.
+
+Claims are built from the built-in rule tables in static_eval, so a clean
+claim passes the default rules: its facility comes from FACILITY_REGISTRY,
+its SRV code is one the facility type allows, the encounter type matches
+INPATIENT_ONLY / OUTPATIENT_ONLY, required diagnoses (SERVICE_REQUIRED_DIAG)
+are present, MUTUALLY_EXCLUSIVE_PAIRS are avoided and an approval number is
+supplied whenever one is needed. A share of claims (`error_rate`) gets one
+injected error, drawn from ERROR_KINDS with the weights in `mix`.
+
+Rows are generated lazily, so 10M-row files stream to disk in constant memory:
+
+    python -m benchmarks.generate --rows 1000000 --error-rate 0.2 --out claims.csv
+"""
+import argparse
+import csv
+import datetime
+import random
+import string
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from app.pipeline.ingest import REQUIRED_COLUMNS
+from app.pipeline.static_eval import (
+    DEFAULT_PAID_THRESHOLD,
+    DEFAULT_TECH_APPROVAL_SERVICES,
+    DEFAULT_TECH_DIAG_APPROVAL,
+    FACILITY_REGISTRY,
+    FACILITY_TYPE_ALLOWED_SERVICES,
+    INPATIENT_ONLY,
+    MUTUALLY_EXCLUSIVE_PAIRS,
+    OUTPATIENT_ONLY,
+    SERVICE_REQUIRED_DIAG,
+    _compute_middle4,
+)
+
+# injected error -> rule_id prefix it triggers under the default rules
+ERROR_KINDS = {
+    "id_format": "TECH_NATIONAL_ID_FORMAT",
+    "unique_id": "TECH_UNIQUEID_MISMATCH",
+    "paid_threshold": "TECH_PAID_THRESHOLD_APPROVAL",
+    "approval_service": "TECH_SERVICE_",
+    "encounter": "MED_ENCOUNTER_",
+    "facility": "MED_FACILITY_",
+    "missing_diag": "MED_SERVICE_",
+    "mutual_exclusive": "MED_MUTUAL_",
+}
+
+# diagnoses that no default rule cares about
+FILLER_DIAGNOSES = ("I10", "K21.9", "M54.5", "E78.5", "J06.9", "Z00.00")
+
+_ALNUM = string.ascii_uppercase + string.digits
+_FACILITIES = sorted(FACILITY_REGISTRY)
+_GENERAL = sorted(f for f, t in FACILITY_REGISTRY.items() if t == "GENERAL_HOSPITAL")
+_SPECIALIST = sorted(f for f, t in FACILITY_REGISTRY.items() if t != "GENERAL_HOSPITAL")
+_ALL_SERVICES = sorted(set().union(*FACILITY_TYPE_ALLOWED_SERVICES.values()))
+_EPOCH = datetime.date(2024, 1, 1)
+
+
+def _token(rng: random.Random, n: int = 8) -> str:
+    return "".join(rng.choices(_ALNUM, k=n))
+
+
+def _encounter(rng: random.Random, service: str) -> str:
+    if service in INPATIENT_ONLY:
+        return "INPATIENT"
+    if service in OUTPATIENT_ONLY:
+        return "OUTPATIENT"
+    return rng.choice(("INPATIENT", "OUTPATIENT"))
+
+
+def _claim(rng: random.Random, n: int, facility: Optional[str] = None, service: Optional[str] = None,
+           encounter: Optional[str] = None, drop_required: bool = False, extra_diags=(),
+           approval: Optional[bool] = None, paid: Optional[float] = None) -> Dict[str, Any]:
+    """One claim; every argument left as None is chosen so that no rule fires."""
+    facility = facility or rng.choice(_FACILITIES)
+    if service is None:
+        service = rng.choice(sorted(FACILITY_TYPE_ALLOWED_SERVICES[FACILITY_REGISTRY[facility]]))
+    encounter = encounter or _encounter(rng, service)
+
+    diags = []
+    required = SERVICE_REQUIRED_DIAG.get(service)
+    if required and not drop_required:
+        diags.append(rng.choice(sorted(required)))
+    diags += rng.sample(FILLER_DIAGNOSES, rng.randint(0, 2))
+    diags += [d for d in extra_diags if d not in diags]
+
+    needs_approval = service in DEFAULT_TECH_APPROVAL_SERVICES or any(d in DEFAULT_TECH_DIAG_APPROVAL for d in diags)
+    if approval is None:
+        approval = needs_approval or rng.random() < 0.2
+    if paid is None:
+        paid = rng.uniform(50, 2500) if approval else rng.uniform(20, DEFAULT_PAID_THRESHOLD)
+
+    national_id, member_id = _token(rng), _token(rng)
+    return {
+        "claim_id": f"CLM{n:09d}",
+        "encounter_type": encounter,
+        "service_date": (_EPOCH + datetime.timedelta(days=rng.randrange(365))).isoformat(),
+        "national_id": national_id,
+        "member_id": member_id,
+        "facility_id": facility,
+        "unique_id": f"{national_id[:4]}-{_compute_middle4(member_id)}-{facility[-4:]}",
+        "diagnosis_codes": ";".join(diags),
+        "service_code": service,
+        "paid_amount_aed": round(paid, 2),
+        "approval_number": f"APP{rng.randrange(10 ** 6):06d}" if approval else None,
+    }
+
+
+def _with_error(rng: random.Random, n: int, kind: str) -> Dict[str, Any]:
+    if kind == "id_format":
+        claim = _claim(rng, n)
+        claim["national_id"] = claim["national_id"][:7] + "_"   # unique_id only uses the first 4
+        return claim
+    if kind == "unique_id":
+        claim = _claim(rng, n)
+        seg1, seg2, seg3 = claim["unique_id"].split("-")
+        claim["unique_id"] = f"{seg1}-{'ZZZZ' if seg2 != 'ZZZZ' else 'YYYY'}-{seg3}"
+        return claim
+    if kind == "paid_threshold":
+        return _claim(rng, n, approval=False, paid=rng.uniform(DEFAULT_PAID_THRESHOLD + 1, 10 * DEFAULT_PAID_THRESHOLD))
+    if kind == "approval_service":
+        service = rng.choice(sorted(DEFAULT_TECH_APPROVAL_SERVICES))
+        return _claim(rng, n, facility=rng.choice(_GENERAL), service=service, approval=False)
+    if kind == "encounter":
+        service = rng.choice(sorted(INPATIENT_ONLY | OUTPATIENT_ONLY))
+        flipped = "OUTPATIENT" if service in INPATIENT_ONLY else "INPATIENT"
+        return _claim(rng, n, facility=rng.choice(_GENERAL), service=service, encounter=flipped)
+    if kind == "facility":
+        facility = rng.choice(_SPECIALIST)
+        allowed = FACILITY_TYPE_ALLOWED_SERVICES[FACILITY_REGISTRY[facility]]
+        return _claim(rng, n, facility=facility, service=rng.choice([s for s in _ALL_SERVICES if s not in allowed]))
+    if kind == "missing_diag":
+        service = rng.choice(sorted(s for s in SERVICE_REQUIRED_DIAG if s in _ALL_SERVICES))
+        return _claim(rng, n, facility=rng.choice(_GENERAL), service=service, drop_required=True)
+    if kind == "mutual_exclusive":
+        a_set, b_set = rng.choice(MUTUALLY_EXCLUSIVE_PAIRS)
+        return _claim(rng, n, extra_diags=(rng.choice(sorted(a_set)), rng.choice(sorted(b_set))))
+    raise ValueError(f"Unknown error kind {kind!r}; use one of {', '.join(ERROR_KINDS)}")
+
+
+def parse_mix(spec: Optional[str]) -> Dict[str, float]:
+    """'facility=2,missing_diag=1' -> weights; empty means every kind equally."""
+    if not spec:
+        return {kind: 1.0 for kind in ERROR_KINDS}
+    mix = {}
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in ERROR_KINDS:
+            raise ValueError(f"Unknown error kind {kind!r}; use one of {', '.join(ERROR_KINDS)}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def iter_claims(rows: int, seed: int = 0, error_rate: float = 0.2,
+                mix: Optional[Dict[str, float]] = None) -> Iterator[Tuple[Optional[str], Dict[str, Any]]]:
+    """Yields (injected error kind or None, claim row) for `rows` claims; same seed, same claims."""
+    rng = random.Random(seed)
+    mix = mix or parse_mix(None)
+    kinds, weights = list(mix), list(mix.values())
+    for n in range(rows):
+        if rng.random() < error_rate:
+            kind = rng.choices(kinds, weights)[0]
+            yield kind, _with_error(rng, n, kind)
+        else:
+            yield None, _claim(rng, n)
+
+
+def generate_claims(rows: int, seed: int = 0, error_rate: float = 0.2,
+                    mix: Optional[Dict[str, float]] = None) -> Iterator[Dict[str, Any]]:
+    for _, claim in iter_claims(rows, seed, error_rate, mix):
+        yield claim
+
+
+def write_csv(path: str, rows: int, seed: int = 0, error_rate: float = 0.2,
+              mix: Optional[Dict[str, float]] = None) -> str:
+    """Stream generated claims to a CSV in the upload schema."""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=REQUIRED_COLUMNS)
+        writer.writeheader()
+        writer.writerows(generate_claims(rows, seed, error_rate, mix))
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic claims as an upload CSV.")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--mix", help=f"error weights, e.g. facility=2,missing_diag=1 (kinds: {', '.join(ERROR_KINDS)})")
+    parser.add_argument("--out", default="claims.csv")
+    args = parser.parse_args()
+    write_csv(args.out, args.rows, args.seed, args.error_rate, parse_mix(args.mix))
+    print(f"[Bench] Wrote {args.rows} claims to {args.out}")
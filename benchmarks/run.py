@@ -0,0 +1,258 @@
+# benchmarks/run.py
+"""
+Benchmark suite: rule evaluation, rule loading, upserts, upload ingestion and
+an end-to-end run_validation (Python and SQL pushdown modes), each against a
+fresh SQLite database and the same synthetic claims (benchmarks.generate).
+
+    python -m benchmarks.run --rows 100000 --out benchmarks/results/current.json
+    python -m benchmarks.run --rows 100000 --baseline benchmarks/results/main.json
+
+Results are written as JSON ({"meta": ..., "results": {name: {...}}}). With
+--baseline, any benchmark whose rows_per_second drops more than --tolerance
+below the baseline is reported and the exit status is 1.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# app.db refuses to import without a DATABASE_URL; every benchmark builds its own engine anyway
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "rcm_bench.db"))
+
+import sqlalchemy
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.db_utils import bulk_upsert, ensure_schema, upsert
+from app.pipeline import worker
+from app.pipeline.ingest import INGEST_BATCH_SIZE, _row_to_claim, ingest_claims
+from app.pipeline.static_eval import RulePlan, load_rules, parse_diagnoses
+from .generate import ERROR_KINDS, generate_claims, parse_mix, write_csv
+
+BENCHMARKS = ("evaluate_claim", "load_rules", "upsert", "bulk_upsert", "ingest", "run_validation",
+              "run_validation_pushdown")
+
+EVALUATE_BATCH = 10_000
+
+
+def _session(workdir: str, name: str):
+    path = os.path.join(workdir, f"{name}.db")
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f"sqlite:///{path}")
+    ensure_schema(engine, models.Base.metadata)
+    return sessionmaker(bind=engine)
+
+
+def _result(rows: int, seconds: float, **extra) -> Dict[str, Any]:
+    return {"rows": rows, "seconds": round(seconds, 4),
+            "rows_per_second": round(rows / seconds, 1) if seconds > 0 else None, **extra}
+
+
+def _claim_rows(cfg) -> List[Dict[str, Any]]:
+    return [_row_to_claim(r) for r in generate_claims(cfg.rows, cfg.seed, cfg.error_rate, cfg.mix)]
+
+
+def bench_evaluate_claim(cfg, workdir: str) -> Dict[str, Any]:
+    """evaluate_claim over every generated claim (diagnoses pre-parsed, as in the worker)."""
+    plan = RulePlan(load_rules(cfg.tenant))
+    seconds, failing, batch = 0.0, 0, []
+
+    def run(batch):
+        nonlocal seconds, failing
+        started = time.perf_counter()
+        failing += sum(1 for claim in batch if plan.evaluate(claim))
+        seconds += time.perf_counter() - started
+
+    for row in generate_claims(cfg.rows, cfg.seed, cfg.error_rate, cfg.mix):
+        row["diagnosis_codes"] = parse_diagnoses(row["diagnosis_codes"])
+        batch.append(row)
+        if len(batch) >= EVALUATE_BATCH:
+            run(batch)
+            batch = []
+    if batch:
+        run(batch)
+    return _result(cfg.rows, seconds, failing=failing)
+
+
+def bench_load_rules(cfg, workdir: str) -> Dict[str, Any]:
+    """load_rules + RulePlan compilation (the uncached get_plan path)."""
+    repeat = 200
+    started = time.perf_counter()
+    for _ in range(repeat):
+        RulePlan(load_rules(cfg.tenant))
+    seconds = time.perf_counter() - started
+    return {"calls": repeat, "seconds": round(seconds, 4), "ms_per_call": round(1000 * seconds / repeat, 3)}
+
+
+def bench_upsert(cfg, workdir: str) -> Dict[str, Any]:
+    """db_utils.upsert one ORM instance at a time (capped at --upsert-rows), then one commit."""
+    Session = _session(workdir, "upsert")
+    rows = _claim_rows(cfg)[:cfg.upsert_rows]
+    db = Session()
+    try:
+        started = time.perf_counter()
+        for row in rows:
+            upsert(db, models.MasterClaim(**row))
+        db.commit()
+        return _result(len(rows), time.perf_counter() - started)
+    finally:
+        db.close()
+
+
+def bench_bulk_upsert(cfg, workdir: str) -> Dict[str, Any]:
+    """db_utils.bulk_upsert in INGEST_BATCH_SIZE batches: first load, then the same rows again (all updates)."""
+    Session = _session(workdir, "bulk_upsert")
+    rows = _claim_rows(cfg)
+    db = Session()
+    try:
+        timings = []
+        for _ in range(2):
+            started = time.perf_counter()
+            for i in range(0, len(rows), INGEST_BATCH_SIZE):
+                bulk_upsert(db, models.MasterClaim, rows[i:i + INGEST_BATCH_SIZE])
+                db.commit()
+            timings.append(time.perf_counter() - started)
+        return _result(len(rows), timings[0], reupload_seconds=round(timings[1], 4))
+    finally:
+        db.close()
+
+
+def bench_ingest(cfg, workdir: str) -> Dict[str, Any]:
+    """The upload ingestion job's path: stream the CSV through ingest_claims (upserts, metric deltas, commits)."""
+    Session = _session(workdir, "ingest")
+    path = write_csv(os.path.join(workdir, "claims.csv"), cfg.rows, cfg.seed, cfg.error_rate, cfg.mix)
+    db = Session()
+    try:
+        started = time.perf_counter()
+        with open(path, "rb") as f:
+            counts = ingest_claims(db, f, "claims.csv", tenant=cfg.tenant, job_id="bench")
+        return _result(cfg.rows, time.perf_counter() - started, **counts)
+    finally:
+        db.close()
+
+
+def _run_validation(cfg, workdir: str, mode: str) -> Dict[str, Any]:
+    Session = _session(workdir, f"validation_{mode}")
+    path = os.path.join(workdir, "claims.csv")
+    if not os.path.exists(path):
+        write_csv(path, cfg.rows, cfg.seed, cfg.error_rate, cfg.mix)
+    db = Session()
+    try:
+        with open(path, "rb") as f:
+            ingest_claims(db, f, "claims.csv", tenant=cfg.tenant, job_id="bench")
+    finally:
+        db.close()
+
+    real_session, real_mode = worker.SessionLocal, worker.VALIDATION_MODE
+    worker.SessionLocal, worker.VALIDATION_MODE = Session, mode
+    try:
+        started = time.perf_counter()
+        summary = worker.run_validation("bench", cfg.tenant)
+        seconds = time.perf_counter() - started
+    finally:
+        worker.SessionLocal, worker.VALIDATION_MODE = real_session, real_mode
+    if not summary:
+        raise RuntimeError("run_validation failed; see the [Worker] log above")
+    return _result(summary["processed"], seconds,
+                   validated=summary["validated"], not_validated=summary["not_validated"])
+
+
+def bench_run_validation(cfg, workdir: str) -> Dict[str, Any]:
+    """run_validation end to end on an ingested job (ingestion itself is not timed)."""
+    return _run_validation(cfg, workdir, "python")
+
+
+def bench_run_validation_pushdown(cfg, workdir: str) -> Dict[str, Any]:
+    """The same job with VALIDATION_MODE=pushdown: built-in rules run as SQL in the database."""
+    return _run_validation(cfg, workdir, "pushdown")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(cfg, names=BENCHMARKS) -> Dict[str, Any]:
+    funcs: Dict[str, Callable] = {name: globals()[f"bench_{name}"] for name in names}
+    report = {
+        "meta": {
+            "rows": cfg.rows, "seed": cfg.seed, "error_rate": cfg.error_rate, "mix": cfg.mix,
+            "tenant": cfg.tenant, "git_commit": _git_commit(),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "started_at": datetime.datetime.utcnow().isoformat(),
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="rcm-bench-") as workdir:
+        for name, func in funcs.items():
+            print(f"[Bench] {name} ...")
+            report["results"][name] = result = func(cfg, workdir)
+            print(f"[Bench] {name}: {result}")
+    return report
+
+
+def regressions(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Benchmarks whose throughput fell more than `tolerance` (a fraction) below the baseline."""
+    found = []
+    for name, old in baseline.get("results", {}).items():
+        new = report["results"].get(name)
+        if not new:
+            continue
+        if new.get("rows_per_second") and old.get("rows_per_second"):
+            if new["rows_per_second"] < old["rows_per_second"] * (1 - tolerance):
+                found.append(f"{name}: {new['rows_per_second']} rows/s vs {old['rows_per_second']} in the baseline")
+        elif new.get("ms_per_call") and old.get("ms_per_call"):
+            if new["ms_per_call"] > old["ms_per_call"] * (1 + tolerance):
+                found.append(f"{name}: {new['ms_per_call']} ms/call vs {old['ms_per_call']} in the baseline")
+    return found
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the RCM validation benchmarks.")
+    parser.add_argument("--rows", type=int, default=10_000, help="synthetic claims (10k - 10M)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--mix", help=f"error weights, e.g. facility=2,missing_diag=1 (kinds: {', '.join(ERROR_KINDS)})")
+    parser.add_argument("--tenant", default="bench", help="tenant whose rule files are used (none = built-in defaults)")
+    parser.add_argument("--upsert-rows", type=int, default=2000, help="cap for the row-by-row upsert benchmark")
+    parser.add_argument("--only", help=f"comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--out", default="benchmarks/results/latest.json")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed throughput drop vs the baseline")
+    cfg = parser.parse_args(argv)
+    cfg.mix = parse_mix(cfg.mix)
+
+    names = [n.strip() for n in cfg.only.split(",")] if cfg.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    report = run(cfg, names)
+    os.makedirs(os.path.dirname(cfg.out) or ".", exist_ok=True)
+    with open(cfg.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[Bench] Results written to {cfg.out}")
+
+    if cfg.baseline:
+        with open(cfg.baseline, encoding="utf-8") as f:
+            found = regressions(report, json.load(f), cfg.tolerance)
+        for line in found:
+            print(f"[Bench] REGRESSION {line}")
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
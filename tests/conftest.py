@@ -0,0 +1,62 @@
+import csv
+import io
+import os
+import tempfile
+
+import pytest
+
+# app.db refuses to import without a DATABASE_URL; tests that need a database build their own engine
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "rcm_test.db"))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app import models  # noqa: E402
+from app.pipeline.ingest import REQUIRED_COLUMNS  # noqa: E402
+
+# a claim that passes the default tenant's checks; tests override the fields they care about
+CLAIM_DEFAULTS = {
+    "claim_id": "C1", "encounter_type": "OUTPATIENT", "service_date": "2024-01-02", "national_id": "A1B2C3D4",
+    "member_id": "EFGH5678", "facility_id": "OCQUMGDW", "unique_id": "A1B2-GH56-MGDW", "diagnosis_codes": "E11.9",
+    "service_code": "SRV2001", "paid_amount_aed": 100.0, "approval_number": "APP1",
+}
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """session_factory(name="claims.db") -> sessionmaker for a new SQLite file under tmp_path with the full schema."""
+    def make(name="claims.db"):
+        engine = create_engine(f"sqlite:///{tmp_path / name}")
+        models.Base.metadata.create_all(engine)
+        return sessionmaker(bind=engine)
+    return make
+
+
+@pytest.fixture
+def claims_csv():
+    """claims_csv(rows, header=REQUIRED_COLUMNS) -> CSV upload as a bytes buffer.
+
+    Dict rows are laid over CLAIM_DEFAULTS; list rows are written as given.
+    """
+    def make(rows, header=REQUIRED_COLUMNS):
+        f = io.StringIO()
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(header)
+        for row in rows:
+            if isinstance(row, dict):
+                row = {**CLAIM_DEFAULTS, **row}
+                row = [row[c] for c in header]
+            writer.writerow(row)
+        return io.BytesIO(f.getvalue().encode("utf-8"))
+    return make
+
+
+@pytest.fixture
+def make_claim():
+    """make_claim(claim_id, **columns) -> unsaved Pending MasterClaim of job-1 for the default tenant."""
+    def make(claim_id, **columns):
+        fields = {k: v for k, v in CLAIM_DEFAULTS.items() if k != "service_date"}
+        fields.update(job_id="job-1", tenant="default", status="Pending", claim_id=claim_id)
+        fields.update(columns)
+        return models.MasterClaim(**fields)
+    return make
@@ -0,0 +1,41 @@
+import json
+
+from benchmarks import run
+from benchmarks.generate import ERROR_KINDS, iter_claims, parse_mix
+from app.pipeline.static_eval import RulePlan, load_rules
+
+
+def test_generated_claims_fail_only_where_errors_were_injected():
+    plan = RulePlan(load_rules("bench"))
+    seen = set()
+    for kind, row in iter_claims(2000, seed=3, error_rate=0.5):
+        claim = dict(row, diagnosis_codes=row["diagnosis_codes"].split(";") if row["diagnosis_codes"] else [])
+        rule_ids = [e["rule_id"] for e in plan.evaluate(claim)]
+        if kind is None:
+            assert rule_ids == [], row
+        else:
+            assert any(r.startswith(ERROR_KINDS[kind]) for r in rule_ids), (kind, rule_ids)
+            seen.add(kind)
+    assert seen == set(ERROR_KINDS)
+
+
+def test_generator_is_reproducible_and_honours_mix():
+    a = list(iter_claims(200, seed=7, error_rate=1.0, mix=parse_mix("facility=1")))
+    assert a == list(iter_claims(200, seed=7, error_rate=1.0, mix=parse_mix("facility=1")))
+    assert {kind for kind, _ in a} == {"facility"}
+
+
+def test_runner_writes_results_and_flags_regressions(tmp_path):
+    out = tmp_path / "results.json"
+    names = "evaluate_claim,load_rules,run_validation,run_validation_pushdown"
+    code = run.main(["--rows", "300", "--only", names, "--out", str(out)])
+    report = json.loads(out.read_text())
+    assert code == 0
+    assert set(report["results"]) == set(names.split(","))
+    assert report["results"]["run_validation"]["rows"] == 300
+    assert report["results"]["run_validation_pushdown"]["not_validated"] == \
+        report["results"]["run_validation"]["not_validated"]
+
+    faster = {"results": {"evaluate_claim": {"rows_per_second": report["results"]["evaluate_claim"]["rows_per_second"] * 10}}}
+    assert run.regressions(report, faster, tolerance=0.2)[0].startswith("evaluate_claim")
+    assert run.regressions(report, report, tolerance=0.2) == []
@@ -0,0 +1,107 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models
+from app.db import get_db
+from app.routes import claims
+
+
+def _client():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    for i in range(7):
+        db.add(models.MasterClaim(
+            claim_id=f"C{i}", status="Validated" if i % 2 else "Not validated", facility_id="F1",
+            service_code="SRV2001", tenant="acme", error_explanation=["x"] * i,
+        ))
+    db.commit()
+
+    app = FastAPI()
+    app.include_router(claims.router, prefix="/api")
+    app.dependency_overrides[get_db] = lambda: Session()
+    return TestClient(app)
+
+
+def test_claims_keyset_pages_with_filters_and_projection():
+    client = _client()
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, "status": "Not validated", "fields": "status,facility_id"}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/api/claims", params=params).json()
+        assert all(set(item) == {"claim_id", "status", "facility_id"} for item in page["items"])
+        seen += [item["claim_id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ["C0", "C2", "C4", "C6"]
+
+
+def test_claims_without_paging_params_keep_the_list_response():
+    client = _client()
+    claims_list = client.get("/api/claims").json()
+    assert [c["claim_id"] for c in claims_list] == [f"C{i}" for i in range(7)]
+    assert claims_list[3]["error_explanation"] == ["x"] * 3
+
+    filtered = client.get("/api/claims", params={"status": "Validated", "fields": "status"}).json()
+    assert filtered == [{"claim_id": f"C{i}", "status": "Validated"} for i in (1, 3, 5)]
+
+    page = client.get("/api/claims", params={"cursor": "C4"}).json()
+    assert [c["claim_id"] for c in page["items"]] == ["C5", "C6"] and page["next_cursor"] is None
+
+
+def test_claims_rejects_unknown_fields():
+    resp = _client().get("/api/claims", params={"fields": "claim_id,password"})
+    assert resp.status_code == 400
+
+
+def test_export_streams_claims_joined_with_errors(monkeypatch):
+    import csv
+    import io
+    import json
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    db.add_all([
+        models.MasterClaim(claim_id="C1", status="Not validated", job_id="job-1", tenant="acme", paid_amount_aed=10.0),
+        models.MasterClaim(claim_id="C2", status="Validated", job_id="job-1", tenant="acme"),
+        models.MasterClaim(claim_id="C3", status="Validated", job_id="job-2", tenant="acme"),
+        models.ClaimError(claim_id="C1", rule_id="R1", message="m1", recommendation="r1"),
+        models.ClaimError(claim_id="C1", rule_id="R2", message="m2", recommendation="r2"),
+    ])
+    db.commit()
+    monkeypatch.setattr(claims, "SessionLocal", Session)
+    monkeypatch.setattr("app.pipeline.export.EXPORT_CHUNK_SIZE", 1)
+
+    app = FastAPI()
+    app.include_router(claims.router, prefix="/api")
+    client = TestClient(app)
+
+    resp = client.get("/api/claims/export", params={"job_id": "job-1"})
+    assert resp.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(resp.text)))
+    assert [(r["claim_id"], r["rule_id"]) for r in rows] == [("C1", "R1"), ("C1", "R2"), ("C2", "")]
+
+    resp = client.get("/api/claims/export", params={"job_id": "job-1", "format": "ndjson"})
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert [line["error_message"] for line in lines] == ["m1", "m2", None]
+
+    assert client.get("/api/claims/export", params={"format": "xml", "job_id": "job-1"}).status_code == 400
+    assert client.get("/api/claims/export").status_code == 400
+
+    from app.pipeline.export import parquet_available
+    if parquet_available():
+        import pyarrow.parquet as pq
+
+        resp = client.get("/api/claims/export", params={"tenant": "acme", "format": "parquet"})
+        table = pq.read_table(io.BytesIO(resp.content))
+        assert table.column("claim_id").to_pylist() == ["C1", "C1", "C2", "C3"]
+        assert table.num_rows == 4
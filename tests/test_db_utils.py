@@ -0,0 +1,49 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.db_utils import bulk_upsert
+
+
+def _session():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
+
+
+def _claim(claim_id, status="Pending", paid=10.0):
+    return {"claim_id": claim_id, "service_code": "SRV2001", "paid_amount_aed": paid,
+            "status": status, "error_explanation": []}
+
+
+def test_bulk_upsert_counts_inserts_and_updates():
+    db = _session()
+    assert bulk_upsert(db, models.MasterClaim, [_claim("C1"), _claim("C2")]) == {"inserted": 2, "updated": 0}
+
+    counts = bulk_upsert(db, models.MasterClaim, [_claim("C2", paid=99.0), _claim("C3"), _claim("C3", status="Validated")],
+                         batch_size=1)
+    assert counts == {"inserted": 1, "updated": 1}
+    db.commit()
+
+    assert db.get(models.MasterClaim, "C2").paid_amount_aed == 99.0
+    # last duplicate in the input wins
+    assert db.get(models.MasterClaim, "C3").status == "Validated"
+    assert db.query(models.MasterClaim).count() == 3
+
+
+def test_ensure_schema_adds_new_columns_and_indexes():
+    from sqlalchemy import inspect, text
+
+    from app.db_utils import ensure_schema
+
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE master_claims (claim_id VARCHAR PRIMARY KEY, status VARCHAR)"))
+    ensure_schema(engine, models.Base.metadata)
+
+    insp = inspect(engine)
+    columns = {c["name"] for c in insp.get_columns("master_claims")}
+    assert {"tenant", "job_id", "error_type"} <= columns
+    indexes = {ix["name"] for ix in insp.get_indexes("master_claims")}
+    assert {"ix_master_claims_tenant_status", "ix_master_claims_job_id"} <= indexes
+    assert "claim_metrics" in insp.get_table_names()
@@ -0,0 +1,65 @@
+from sqlalchemy import select
+
+from app import models
+from app.pipeline import revalidate
+from app.pipeline.diagnoses import backfill_diagnoses, with_diagnosis
+from app.pipeline.ingest import ingest_claims
+from app.pipeline.static_eval import RulePlan, load_rules, parse_diagnoses
+
+
+def _diagnosed(claims_csv, rows):
+    return claims_csv([{"claim_id": cid, "diagnosis_codes": diags} for cid, diags in rows])
+
+
+def _codes(db):
+    rows = db.execute(select(models.ClaimDiagnosis.claim_id, models.ClaimDiagnosis.code)
+                      .order_by(models.ClaimDiagnosis.claim_id, models.ClaimDiagnosis.position))
+    return [tuple(r) for r in rows]
+
+
+def test_parse_diagnoses_accepts_pre_parsed_codes():
+    assert parse_diagnoses(" e11.9; R07.9 ,i10|") == ("E11.9", "R07.9", "I10")
+    assert parse_diagnoses(("E11.9", "R07.9")) == ("E11.9", "R07.9")
+    assert parse_diagnoses(frozenset({"R07.9", "E11.9"})) == ("E11.9", "R07.9")
+    plan = RulePlan(load_rules("none"))
+    claim = {"service_code": "SRV2001", "encounter_type": "OUTPATIENT"}
+    assert plan.evaluate(dict(claim, diagnosis_codes="r07.9;E11.9")) == \
+        plan.evaluate(dict(claim, diagnosis_codes=parse_diagnoses("r07.9;E11.9")))
+
+
+def test_ingest_normalizes_diagnoses_and_lookups_use_them(session_factory, claims_csv):
+    Session = session_factory()
+    db = Session()
+    ingest_claims(db, _diagnosed(claims_csv, [("C1", "e11.9;R07.9;E11.9"), ("C2", "I10"), ("C3", "")]),
+                  "claims.csv", tenant="acme")
+    assert _codes(db) == [("C1", "E11.9"), ("C1", "R07.9"), ("C2", "I10")]
+
+    # a modified claim's codes are replaced
+    ingest_claims(db, _diagnosed(claims_csv, [("C1", "I10")]), "claims.csv", tenant="acme")
+    assert _codes(db) == [("C1", "I10"), ("C2", "I10")]
+
+    found = db.execute(select(models.MasterClaim.claim_id).where(with_diagnosis(["I10"]))
+                       .order_by(models.MasterClaim.claim_id)).scalars().all()
+    assert found == ["C1", "C2"]
+
+    diff = {"all": False, "services": [], "facilities": [], "diagnoses": ["R07.9", "I10"],
+            "paid_range": None, "facility_services": []}
+    stmt = select(models.MasterClaim.claim_id).where(*revalidate.affected_where(diff))
+    assert sorted(db.execute(stmt).scalars()) == ["C1", "C2"]
+    db.close()
+
+
+def test_backfill_fills_claims_without_rows_once(session_factory):
+    Session = session_factory()
+    db = Session()
+    db.add_all([models.MasterClaim(claim_id=f"C{i}", diagnosis_codes="E11.9;j45.909" if i % 2 else None)
+                for i in range(7)])
+    # C5 was ingested by an upgraded worker before the backfill ran
+    db.add(models.ClaimDiagnosis(claim_id="C5", code="E11.9", position=0))
+    db.commit()
+
+    assert backfill_diagnoses(db, batch_size=1) == 2
+    assert _codes(db) == [("C1", "E11.9"), ("C1", "J45.909"), ("C3", "E11.9"), ("C3", "J45.909"),
+                          ("C5", "E11.9")]
+    assert backfill_diagnoses(db) == 0
+    db.close()
@@ -0,0 +1,101 @@
+import time
+
+import pytest
+
+from app import models
+from app.pipeline import enrichment, worker
+from app.pipeline.breaker import CircuitBreaker
+
+
+def _seed(session_factory, make_claim):
+    Session = session_factory()
+    db = Session()
+    db.add(make_claim("C1", status="Not validated", service_code="SRV1001", error_explanation=["m1", "m2"]))
+    db.add_all([
+        models.ClaimError(claim_id="C1", rule_id="R1", message="m1", recommendation="r1"),
+        models.ClaimError(claim_id="C1", rule_id="R2", message="m2", recommendation="r2"),
+    ])
+    db.commit()
+    return Session
+
+
+def test_enrichment_merges_explanations_once(session_factory, make_claim, monkeypatch):
+    Session = _seed(session_factory, make_claim)
+    calls = []
+
+    def fake_explain(items):
+        calls.append(items)
+        return [{"bullets": ["why 1", "why 2"], "recommendation": "x"} for _ in items]
+
+    monkeypatch.setattr(enrichment, "SessionLocal", Session)
+    monkeypatch.setattr(enrichment, "llm_enabled", lambda: True)
+    monkeypatch.setattr(enrichment, "llm_breaker", CircuitBreaker("test", use_redis=False))
+    monkeypatch.setattr(enrichment, "explain_many", fake_explain)
+
+    assert enrichment.run_enrichment("job-1", ["C1"])["enriched"] == 1
+    db = Session()
+    messages = [e.message for e in db.query(models.ClaimError).order_by(models.ClaimError.id)]
+    assert messages == ["m1 | LLM says: why 1", "m2 | LLM says: why 2"]
+    assert db.get(models.MasterClaim, "C1").error_explanation == messages
+    assert calls[0][0][0]["diagnosis_codes"] == ["E11.9"]
+
+    # a second run finds nothing left to enrich
+    assert enrichment.run_enrichment("job-1", ["C1"])["enriched"] == 0
+    assert len(calls) == 2 and calls[1] == []
+
+
+def test_enrichment_skipped_while_breaker_open(session_factory, make_claim, monkeypatch):
+    Session = _seed(session_factory, make_claim)
+    breaker = CircuitBreaker("test", min_calls=2, use_redis=False)
+    breaker.record(False, 0.1)
+    breaker.record(False, 0.1)
+    monkeypatch.setattr(enrichment, "SessionLocal", Session)
+    monkeypatch.setattr(enrichment, "llm_enabled", lambda: True)
+    monkeypatch.setattr(enrichment, "llm_breaker", breaker)
+
+    assert enrichment.run_enrichment("job-1", ["C1"]) == {"job_id": "job-1", "enriched": 0, "skipped": 1}
+
+
+def test_failed_enrichment_marks_the_job_failed_and_raises(session_factory, make_claim, monkeypatch):
+    Session = _seed(session_factory, make_claim)
+    metas = []
+
+    def broken_explain(items):
+        raise RuntimeError("llm down")
+
+    monkeypatch.setattr(enrichment, "SessionLocal", Session)
+    monkeypatch.setattr(enrichment, "llm_enabled", lambda: True)
+    monkeypatch.setattr(enrichment, "llm_breaker", CircuitBreaker("test", use_redis=False))
+    monkeypatch.setattr(enrichment, "explain_many", broken_explain)
+    monkeypatch.setattr(worker, "_set_meta", lambda job_id=None, **fields: metas.append(fields))
+
+    with pytest.raises(RuntimeError):
+        enrichment.run_enrichment("job-1", ["C1"])
+    assert metas == [{"stage": "failed", "error": "llm down"}]
+
+
+def test_breaker_trips_on_latency_and_half_opens():
+    breaker = CircuitBreaker("test", min_calls=3, latency=1.0, cooldown=0, use_redis=False)
+    for _ in range(3):
+        breaker.record(True, 2.0)
+    assert breaker.trips == 1
+    time.sleep(0.01)
+    assert breaker.allow()
+
+
+def test_worker_commits_static_results_and_queues_failing_claims(session_factory, make_claim, monkeypatch):
+    Session = session_factory()
+    db = Session()
+    db.add(make_claim("OK"))
+    db.add(make_claim("BAD", paid_amount_aed=5000.0, approval_number=None))
+    db.commit()
+
+    queued = []
+    monkeypatch.setattr(worker, "SessionLocal", Session)
+    monkeypatch.setattr(worker, "enqueue_enrichment", lambda job_id, ids: queued.append((job_id, ids)))
+    worker.run_validation("job-1", "default")
+
+    failing = [c.claim_id for c in db.query(models.MasterClaim).filter_by(status="Not validated")
+               .order_by(models.MasterClaim.claim_id)]
+    assert "BAD" in failing
+    assert queued == [("job-1", failing)]
@@ -0,0 +1,52 @@
+import pytest
+
+from app import models
+from app.pipeline import worker
+from app.pipeline.ingest import REQUIRED_COLUMNS, SchemaError, ingest_claims, iter_claim_batches
+
+
+def test_csv_batches_are_bounded(claims_csv):
+    header = [c.upper() for c in REQUIRED_COLUMNS]
+    rows = [[f"C{i}", "OUTPATIENT", "2024-01-02", "A1B2C3D4", "EFGH5678", "OCQUMGDW",
+             "A1B2-GH56-MGDW", "E11.9", "SRV2007", "250.50", ""] for i in range(5)]
+    columns, batches = iter_claim_batches(claims_csv(rows, header), "claims.csv", batch_size=2)
+    assert columns == REQUIRED_COLUMNS
+    batches = list(batches)
+    assert [len(b) for b in batches] == [2, 2, 1]
+    first = batches[0][0]
+    assert first["paid_amount_aed"] == 250.5
+    assert first["approval_number"] is None
+    assert str(first["service_date"]) == "2024-01-02"
+
+
+def test_missing_columns_rejected_before_rows_are_read(claims_csv):
+    with pytest.raises(SchemaError) as exc:
+        iter_claim_batches(claims_csv([["C1", "SRV1"]], ["claim_id", "service_code"]), "claims.csv")
+    assert "paid_amount_aed" in exc.value.missing_columns
+
+
+def test_reupload_only_resets_new_and_modified_claims(session_factory, claims_csv, monkeypatch):
+    Session = session_factory()
+    monkeypatch.setattr(worker, "SessionLocal", Session)
+    rows = [[f"C{i}", "OUTPATIENT", "2024-01-02", "A1B2C3D4", "EFGH5678", "OCQUMGDW",
+             "A1B2-GH56-MGDW", "I10", "SRV2003", "100", ""] for i in range(3)]
+    db = Session()
+    assert ingest_claims(db, claims_csv(rows), "claims.csv", tenant="acme", job_id="job-1") == \
+        {"inserted": 3, "updated": 0, "unchanged": 0}
+    worker.run_validation("job-1", "acme")
+
+    rows[1][9] = "5000"   # corrected amount, now needs approval
+    rows.append(["C3"] + rows[0][1:])
+    counts = ingest_claims(db, claims_csv(rows), "claims.csv", tenant="acme", job_id="job-2")
+    assert counts == {"inserted": 1, "updated": 1, "unchanged": 2}
+
+    db.expire_all()
+    pending = db.query(models.MasterClaim).filter_by(status="Pending").order_by(models.MasterClaim.claim_id)
+    assert [(c.claim_id, c.job_id) for c in pending] == [("C1", "job-2"), ("C3", "job-2")]
+    assert db.get(models.MasterClaim, "C0").status == "Validated"
+    assert db.get(models.MasterClaim, "C0").job_id == "job-1"
+
+    # the same rows under another tenant are new content for that tenant's rules
+    assert ingest_claims(db, claims_csv(rows[:1]), "claims.csv", tenant="other", job_id="job-3") == \
+        {"inserted": 0, "updated": 1, "unchanged": 0}
+    db.close()
@@ -0,0 +1,145 @@
+import asyncio
+import json
+
+import httpx
+
+from app.pipeline import llm_client
+from app.pipeline.breaker import CircuitBreaker
+from app.pipeline.cache import TieredCache
+
+
+def _errors(n=1):
+    return [{"rule_id": f"R{i}", "category": "technical", "message": f"msg {i}", "recommendation": "fix"}
+            for i in range(n)]
+
+
+def _use_transport(monkeypatch, handler, concurrency=2):
+    monkeypatch.setattr(llm_client, "HF_API_KEY", "test-key")
+    monkeypatch.setattr(llm_client, "LLM_BACKOFF", 0.0)
+    monkeypatch.setattr(llm_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(llm_client, "_semaphore", asyncio.Semaphore(concurrency))
+    monkeypatch.setattr(llm_client, "explanation_cache", TieredCache("test_llm", use_redis=False))
+    monkeypatch.setattr(llm_client, "llm_breaker", CircuitBreaker("test_llm", use_redis=False))
+
+
+def test_explain_many_retries_and_bounds_concurrency(monkeypatch):
+    state = {"calls": 0, "in_flight": 0, "peak": 0}
+
+    async def handler(request):
+        state["calls"] += 1
+        if state["calls"] == 1:
+            return httpx.Response(503)
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+        await asyncio.sleep(0.01)
+        state["in_flight"] -= 1
+        return httpx.Response(200, json=[{"generated_text": "- because"}])
+
+    _use_transport(monkeypatch, handler, concurrency=2)
+    results = llm_client.explain_many([({"service_code": f"SRV{i}"}, _errors()) for i in range(6)])
+
+    assert len(results) == 6
+    assert all(r["bullets"] == ["because"] for r in results)
+    assert state["calls"] == 7  # one 503 retried
+    assert state["peak"] <= 2
+
+
+def test_batched_prompt_splits_answers_per_claim(monkeypatch):
+    prompts = []
+
+    def handler(request):
+        prompts.append(json.loads(request.content)["inputs"])
+        answer = [{"bullets": ["first"], "recommendation": "a"}]  # second claim left unanswered
+        return httpx.Response(200, json=[{"generated_text": json.dumps(answer)}])
+
+    _use_transport(monkeypatch, handler)
+    results = llm_client.explain_many([({}, _errors()), ({}, _errors(2))], batch_size=2)
+
+    assert len(prompts) == 1 and "Claim 2:" in prompts[0]
+    assert results[0] == {"bullets": ["first"], "recommendation": "a"}
+    assert results[1]["bullets"] == ["msg 0", "msg 1"]
+
+
+def test_deadline_falls_back_to_rule_text(monkeypatch):
+    async def handler(request):
+        await asyncio.sleep(1)
+        return httpx.Response(200, json=[{"generated_text": "late"}])
+
+    _use_transport(monkeypatch, handler)
+    monkeypatch.setattr(llm_client, "LLM_DEADLINE", 0.05)
+    assert llm_client.explain_with_llm({}, _errors()) == {"bullets": ["msg 0"], "recommendation": "fix"}
+
+
+def test_repeated_error_signatures_hit_the_model_once(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json=[{"generated_text": "- explained"}])
+
+    _use_transport(monkeypatch, handler)
+    claim = {"service_code": "srv1001", "diagnosis_codes": ["E11.9", "R07.9"], "approval_number": "APP1"}
+    same_pattern = {"service_code": "SRV1001 ", "diagnosis_codes": ["r07.9", "e11.9"], "approval_number": "APP2"}
+
+    first = llm_client.explain_many([(claim, _errors(2)), (same_pattern, _errors(2))])
+    assert len(calls) == 1
+    assert first[0] == first[1]
+
+    llm_client.explain_many([(same_pattern, _errors(2))])
+    assert len(calls) == 1
+    assert llm_client.explanation_cache.stats()["hits"] == 1
+
+    # messages embed claim values; the same rules on the same context still share an entry
+    reworded = [dict(e, message=f"{e['message']} (AED 9000.0)") for e in _errors(2)]
+    llm_client.explain_many([(claim, reworded)])
+    assert len(calls) == 1
+
+    # a different error set or a missing approval is a different signature
+    llm_client.explain_many([(dict(claim, approval_number=None), _errors(2)), (claim, _errors(1))])
+    assert len(calls) == 3
+
+
+def test_failed_inference_is_not_cached(monkeypatch):
+    responses = [httpx.Response(500)] * 3 + [httpx.Response(200, json=[{"generated_text": "- ok"}])]
+
+    _use_transport(monkeypatch, lambda request: responses.pop(0))
+    assert llm_client.explain_with_llm({}, _errors()) == {"bullets": ["msg 0"], "recommendation": "fix"}
+    assert llm_client.explain_with_llm({}, _errors())["bullets"] == ["ok"]
+
+
+def test_open_breaker_skips_inference(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    _use_transport(monkeypatch, handler)
+    monkeypatch.setattr(llm_client, "llm_breaker", CircuitBreaker("test_llm", min_calls=3, use_redis=False))
+    items = [({"service_code": f"SRV{i}"}, _errors()) for i in range(4)]
+
+    llm_client.explain_many(items[:1])          # 3 failed attempts trip the breaker
+    assert llm_client.llm_breaker.stats()["open"]
+    results = llm_client.explain_many(items[1:])
+    assert len(calls) == 3
+    assert [r["bullets"] for r in results] == [["msg 0"]] * 3
+
+
+def test_failing_redis_tier_is_skipped_for_a_while(monkeypatch):
+    from app.pipeline import cache
+
+    class DownRedis:
+        calls = 0
+
+        def get(self, key):
+            DownRedis.calls += 1
+            raise ConnectionError("refused")
+
+        set = get
+
+    monkeypatch.setattr(cache, "redis_connection", lambda: DownRedis())
+    shared = TieredCache("test_shared", use_redis=True)
+    assert shared.get("k") is None
+    shared.set("k", {"bullets": []})
+    assert shared.get("k") == {"bullets": []}   # served by the in-process tier
+    assert DownRedis.calls == 1
@@ -0,0 +1,39 @@
+from app.pipeline import metrics, worker
+from app.pipeline.ingest import ingest_claims
+
+
+def _row(claim_id, paid="100", approval="APP1"):
+    return {"claim_id": claim_id, "paid_amount_aed": paid, "approval_number": approval}
+
+
+def _rebuilt(db):
+    metrics.rebuild_metrics(db)
+    out = metrics.read_metrics(db)
+    db.rollback()
+    return out
+
+
+def test_incremental_metrics_match_full_rebuild(session_factory, claims_csv, monkeypatch):
+    Session = session_factory()
+    monkeypatch.setattr(worker, "SessionLocal", Session)
+    db = Session()
+
+    ingest_claims(db, claims_csv([_row(f"C{i}") for i in range(4)] + [_row("BAD", "5000", "")]), "claims.csv",
+                  tenant="default", job_id="job-1")
+    assert metrics.read_metrics(db) == [{"category": "No error", "count": 5, "paid": 5400.0}]
+
+    worker.run_validation("job-1", "default")
+    db.expire_all()
+    after_job = metrics.read_metrics(db)
+    assert after_job == _rebuilt(db)
+    assert sum(m["count"] for m in after_job) == 5
+    assert any(m["category"] != "No error" for m in after_job)
+
+    # re-upload moves validated claims back to Pending with their new amounts
+    ingest_claims(db, claims_csv([_row("BAD", "300", "APP2"), _row("NEW")]), "claims.csv",
+                  tenant="default", job_id="job-2")
+    assert metrics.read_metrics(db) == _rebuilt(db)
+
+    worker.run_validation("job-2", "default")
+    db.expire_all()
+    assert metrics.read_metrics(db) == _rebuilt(db)
@@ -0,0 +1,28 @@
+import re
+
+from app.pipeline import parser
+
+PDF = "app/rules/default_medical.pdf"
+
+
+def test_scan_pages_finds_matches_across_page_breaks_once():
+    pattern = re.compile(r"SRV\d{4}\s+requires\s+approval")
+    pages = ["intro " * 30 + "SRV1001 requires", "approval and SRV1002 requires approval " + "x " * 50]
+    full = "".join(p + "\n" for p in pages)
+
+    (matches,) = parser.scan_pages(pages, [pattern], span=40)
+    assert [m.group(0).split()[0] for m in matches] == ["SRV1001", "SRV1002"]
+    assert [m.group(0) for m in matches] == pattern.findall(full)
+
+
+def test_tech_rules_from_pages_matches_whole_text_parse():
+    pages = ["Claims with paid amount > AED 250 need review.", "Service SRV2008 requires prior approval."]
+    rules = parser.tech_rules_from_pages(pages)
+    assert [r["rule_id"] for r in rules] == ["TECH_PAID_GT_250", "TECH_SRV2008_REQUIRES_APPROVAL"]
+
+
+def test_parallel_extraction_keeps_page_order(monkeypatch):
+    sequential = parser._extract_range(PDF, 0, parser._page_count(PDF))
+    monkeypatch.setattr(parser, "PDF_PARALLEL_MIN_PAGES", 1)
+    assert list(parser.iter_pages(PDF, workers=2)) == sequential
+    assert parser.extract_text(PDF) == "".join(t + "\n" for t in sequential if t)
@@ -0,0 +1,83 @@
+from app.pipeline import worker
+from app.pipeline.progress import JobProgress, progress_key, read_progress
+
+
+class FakeRedis:
+    """Just the hash commands JobProgress uses, with pipelines executed immediately."""
+
+    def __init__(self):
+        self.hashes = {}
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        return []
+
+    def hsetnx(self, key, field, value):
+        self.hashes.setdefault(key, {}).setdefault(field, value)
+
+    def hincrby(self, key, field, n):
+        h = self.hashes.setdefault(key, {})
+        h[field] = int(h.get(field, 0)) + n
+
+    def hincrbyfloat(self, key, field, n):
+        h = self.hashes.setdefault(key, {})
+        h[field] = float(h.get(field, 0)) + n
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    def expire(self, key, ttl):
+        pass
+
+    def hgetall(self, key):
+        return {k.encode(): str(v).encode() for k, v in self.hashes.get(key, {}).items()}
+
+
+def test_progress_aggregates_across_writers():
+    conn = FakeRedis()
+    JobProgress("job-1", conn=conn).set(total=10).flush()
+    for _ in range(2):  # e.g. two shards
+        p = JobProgress("job-1", conn=conn)
+        with p.stage("evaluate"):
+            pass
+        p.incr(processed=5, validated=4, not_validated=1).flush()
+    conn.hashes[progress_key("job-1")]["started_at"] -= 2.0
+
+    out = read_progress("job-1", conn=conn)
+    assert out["total"] == 10
+    assert (out["processed"], out["validated"], out["not_validated"]) == (10, 8, 2)
+    assert out["elapsed_seconds"] >= 2.0
+    assert 0 < out["rows_per_second"] <= 5
+    assert set(out["stages"]) == {"evaluate"}
+    assert read_progress("other", conn=conn) is None
+
+
+def test_progress_disables_itself_on_redis_errors():
+    class Broken:
+        def pipeline(self):
+            raise ConnectionError("down")
+
+    p = JobProgress("job-1", conn=Broken())
+    p.incr(processed=1).flush()
+    p.incr(processed=1).flush()  # no second attempt, no exception
+
+
+def test_validation_reports_stage_timings(session_factory, make_claim, monkeypatch):
+    Session = session_factory()
+    conn = FakeRedis()
+    monkeypatch.setattr(worker, "SessionLocal", Session)
+    monkeypatch.setattr(worker, "JobProgress", lambda job_id: JobProgress(job_id, conn=conn))
+    monkeypatch.setattr(worker, "VALIDATION_CHUNK_SIZE", 2)
+
+    db = Session()
+    db.add_all([make_claim(f"C{i}") for i in range(5)])
+    db.commit()
+
+    worker.run_validation("job-1", "default")
+
+    out = read_progress("job-1", conn=conn)
+    assert out["processed"] == 5
+    assert out["validated"] + out["not_validated"] == 5
+    assert {"load_rules", "fetch", "evaluate", "db_write", "metrics"} <= set(out["stages"])
@@ -0,0 +1,82 @@
+from sqlalchemy import select
+
+from app import models
+from app.pipeline import pushdown, worker
+from app.pipeline.ingest import ingest_claims
+from app.pipeline.progress import JobProgress
+from app.pipeline.static_eval import RulePlan, load_rules
+from benchmarks.generate import generate_claims
+
+# claims the generator does not produce: placeholders, odd casing and spacing, broken unique_ids
+_EDGE_CASES = [
+    {"approval_number": "NA", "paid_amount_aed": "9000"},
+    {"approval_number": " Obtain Approval ", "service_code": " srv1001 ", "encounter_type": "inpatient"},
+    {"unique_id": "", "member_id": "AB", "encounter_type": "-"},
+    {"unique_id": "a1b2-zzzz-mgdw", "facility_id": "oc-q"},
+    {"unique_id": "A1B2GH56MGDW", "national_id": "N/A"},
+    {"diagnosis_codes": "e11.9 ; r07.9|E11.9", "service_code": "SRV2001", "paid_amount_aed": "120.75"},
+    {"diagnosis_codes": "", "service_code": "SRV2001", "approval_number": "APP-1"},
+]
+
+
+def _claims():
+    rows = list(generate_claims(300, seed=7, error_rate=0.8))
+    for i, edge in enumerate(_EDGE_CASES):
+        rows.append(dict(rows[i], claim_id=f"EDGE{i}", **edge))
+    return rows
+
+
+def _ingested(session_factory, claims_csv, name, rows):
+    db = session_factory(name)()
+    ingest_claims(db, claims_csv(rows), "claims.csv", tenant="acme", job_id="job-1")
+    return db
+
+
+def _state(db):
+    claims = {
+        c.claim_id: (c.status, c.error_type, c.error_explanation, sorted(c.recommended_action.split("; ")))
+        for c in db.query(models.MasterClaim)
+    }
+    errors = db.execute(select(models.ClaimError.claim_id, models.ClaimError.rule_id,
+                               models.ClaimError.message, models.ClaimError.recommendation)
+                        .order_by(models.ClaimError.claim_id, models.ClaimError.id)).all()
+    metrics = {m.category: (m.count, round(m.paid, 2)) for m in db.query(models.ClaimMetrics)}
+    return claims, [tuple(e) for e in errors], metrics
+
+
+def _validate_both(session_factory, claims_csv, plan, rows):
+    expected_db = _ingested(session_factory, claims_csv, "python.db", rows)
+    pushed_db = _ingested(session_factory, claims_csv, "pushdown.db", rows)
+    expected = worker._validate_pending(expected_db, plan, [], worker._new_summary("job-1", "acme"),
+                                        JobProgress("job-1"))
+    assert pushdown.supported(pushed_db)
+    pushed = pushdown.validate_job(pushed_db, plan, worker._new_summary("job-1", "acme"), JobProgress("job-1"))
+    return expected_db, pushed_db, expected, pushed
+
+
+def test_pushdown_matches_python_evaluation(session_factory, claims_csv):
+    plan = RulePlan(load_rules("none"))
+    expected_db, pushed_db, expected, pushed = _validate_both(session_factory, claims_csv, plan, _claims())
+
+    assert pushed["processed"] == expected["processed"] == 300 + len(_EDGE_CASES)
+    assert 0 < pushed["not_validated"] == expected["not_validated"] < pushed["processed"]
+    assert pushed["categories"].keys() == expected["categories"].keys()
+    assert _state(pushed_db) == _state(expected_db)
+    expected_db.close()
+    pushed_db.close()
+
+
+def test_declarative_rules_run_in_python_after_pushed_checks(session_factory, claims_csv):
+    rules = load_rules("none")
+    rules["medical"]["rules"] = [{"rule_id": "MED_NO_SRV2003", "field": "service_code", "op": "==",
+                                  "value": "SRV2003", "message": "SRV2003 is not covered.",
+                                  "recommendation": "Bill a covered service."}]
+    plan = RulePlan(rules)
+    assert len(pushdown._declarative_plan(plan).engine) == 1
+    assert not any(r["rule_id"] == "MED_NO_SRV2003" for r in pushdown.compile_rules(plan, "sqlite"))
+
+    expected_db, pushed_db, _, _ = _validate_both(session_factory, claims_csv, plan, _claims())
+    assert _state(pushed_db) == _state(expected_db)
+    assert pushed_db.query(models.ClaimError).filter_by(rule_id="MED_NO_SRV2003").count() > 0
+    expected_db.close()
+    pushed_db.close()
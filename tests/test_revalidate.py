@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from app import models
+from app.pipeline import revalidate, rule_cache, static_eval, worker
+from app.pipeline.static_eval import RulePlan
+
+
+def _rule(rule_id, field, value, op="=="):
+    return {"rule_id": rule_id, "field": field, "op": op, "value": value,
+            "message": f"{rule_id} fired", "recommendation": "fix"}
+
+
+def test_plan_diff_scopes_changes_to_claim_attributes():
+    old = RulePlan({"technical": {"paid_threshold": 250, "rules": [_rule("T1", "service_code", "SRV1")]},
+                    "medical": {}})
+    new = RulePlan({"technical": {"paid_threshold": 400, "approval_services": ["SRV1001", "SRV9"],
+                                  "rules": [_rule("T1", "service_code", "srv2")]},
+                    "medical": {"inpatient_only": ["SRV1001", "SRV1002", "SRV1003"]}})
+    diff = revalidate.plan_diff(old, new)
+
+    assert diff["all"] is False
+    assert diff["paid_range"] == [250.0, 400.0]
+    # edited declarative rule: both the old and the new value; approval + inpatient sets: the difference
+    assert {"SRV1", "SRV2", "SRV9"} <= set(diff["services"])
+    assert revalidate.plan_diff(new, new) == {"all": False, "services": [], "facilities": [], "diagnoses": [],
+                                              "paid_range": None, "facility_services": []}
+    assert revalidate.diff_is_empty(revalidate.plan_diff(new, new))
+
+
+def test_plan_diff_falls_back_to_all_claims_when_unscoped():
+    base = RulePlan({"technical": {}, "medical": {}})
+    amount_rule = RulePlan({"technical": {"rules": [_rule("T2", "paid_amount_aed", 10, op=">")]}, "medical": {}})
+    assert revalidate.plan_diff(base, amount_rule)["all"] is True
+
+    # switching a category from built-in checks to a declarative list changes every claim's checks
+    declarative = RulePlan({"technical": [_rule("T1", "service_code", "SRV1")], "medical": {}})
+    assert revalidate.plan_diff(base, declarative)["all"] is True
+    assert revalidate.affected_where(revalidate.plan_diff(base, declarative)) == []
+
+
+def test_rule_update_revalidates_only_affected_claims(tmp_path, session_factory, make_claim, monkeypatch):
+    monkeypatch.setattr(static_eval, "RULES_DIR", str(tmp_path))
+    rule_cache.invalidate()
+    Session = session_factory()
+    monkeypatch.setattr(worker, "SessionLocal", Session)
+    monkeypatch.setattr(revalidate, "SessionLocal", Session)
+
+    db = Session()
+    db.add_all([make_claim("A", tenant="acme", service_code="SRV2003"),
+                make_claim("B", tenant="acme", service_code="SRV2004"),
+                make_claim("C", tenant="other", service_code="SRV2003")])
+    db.commit()
+    worker.run_validation("job-1", "acme")
+    worker.run_validation("job-1", "other")
+
+    evaluated = []
+    real_validate = revalidate._validate_rows
+    monkeypatch.setattr(revalidate, "_validate_rows",
+                        lambda plan, chunk: (evaluated.extend(r["claim_id"] for r in chunk), real_validate(plan, chunk))[1])
+
+    def stage(job_id):
+        # run_rule_update removes the staging directory when it is done
+        (tmp_path / job_id).mkdir()
+        technical = tmp_path / job_id / "technical.json"
+        technical.write_text(json.dumps({"rules": [_rule("T_SRV2003", "service_code", "SRV2003")]}))
+        return str(technical)
+
+    summary = revalidate.run_rule_update("rules-1", "acme", technical_path=stage("rules-1"))
+
+    assert evaluated == ["A"]
+    assert summary["changed"] == 1
+    assert summary["diff"]["services"] == ["SRV2003"]
+
+    db.expire_all()
+    a = db.get(models.MasterClaim, "A")
+    assert a.status == "Not validated"
+    assert [e.rule_id for e in db.query(models.ClaimError).filter_by(claim_id="A")] == ["T_SRV2003"]
+    assert db.get(models.MasterClaim, "B").status == "Validated"
+    assert db.get(models.MasterClaim, "C").status == "Validated"
+    metrics = {m.category: m.count for m in db.query(models.ClaimMetrics)}
+    assert metrics.get("Technical error") == 1
+
+    # same rules again: nothing to revalidate
+    evaluated.clear()
+    summary = revalidate.run_rule_update("rules-2", "acme", technical_path=stage("rules-2"))
+    assert not (tmp_path / "rules-2").exists()
+    assert evaluated == []
+    assert summary["evaluated"] == 0
+    db.close()
+
+
+def test_failed_rule_update_marks_the_job_failed_and_raises(tmp_path, session_factory, monkeypatch):
+    monkeypatch.setattr(revalidate, "SessionLocal", session_factory())
+    metas = []
+    monkeypatch.setattr(revalidate, "_set_meta", lambda job_id=None, **fields: metas.append(fields))
+
+    def broken_plan(tenant):
+        raise RuntimeError("rules unreadable")
+
+    monkeypatch.setattr(revalidate, "get_plan", broken_plan)
+    (tmp_path / "rules-1").mkdir()
+    technical = tmp_path / "rules-1" / "technical.json"
+    technical.write_text("[]")
+
+    with pytest.raises(RuntimeError):
+        revalidate.run_rule_update("rules-1", "acme", technical_path=str(technical))
+    assert metas[-1] == {"stage": "failed", "error": "rules unreadable"}
+    assert not (tmp_path / "rules-1").exists()
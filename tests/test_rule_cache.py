@@ -0,0 +1,67 @@
+import json
+
+from app.pipeline import rule_cache, static_eval
+
+
+def test_plan_cached_until_rules_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(static_eval, "RULES_DIR", str(tmp_path))
+    rule_cache.invalidate()
+    rules = [{"rule_id": "T1", "field": "service_code", "op": "==", "value": "SRV1",
+              "message": "m", "recommendation": "r"}]
+
+    assert rule_cache.save_rule_upload("acme", "technical", json.dumps(rules).encode()) is True
+    plan = rule_cache.get_plan("acme")
+    assert rule_cache.get_plan("acme") is plan
+
+    # identical re-upload does not touch the file, so the compiled plan is reused
+    assert rule_cache.save_rule_upload("acme", "technical", json.dumps(rules).encode()) is False
+    assert rule_cache.get_plan("acme") is plan
+
+    rules[0]["value"] = "SRV2"
+    assert rule_cache.save_rule_upload("acme", "technical", json.dumps(rules).encode()) is True
+    new_plan = rule_cache.get_plan("acme")
+    assert new_plan is not plan
+    assert [e["rule_id"] for e in new_plan.evaluate({"service_code": "SRV2"})][-1] == "T1"
+
+
+def test_pdf_rules_parsed_once_per_content(tmp_path, monkeypatch):
+    calls = []
+    from app.pipeline import parser
+    monkeypatch.setattr(parser, "tech_pdf_to_rules", lambda path: calls.append(path) or [{"rule_id": "T1"}])
+    monkeypatch.setattr(static_eval, "RULES_DIR", str(tmp_path))
+    rule_cache.pdf_rules_cache.clear()
+    pdf = tmp_path / "policy.pdf"
+    pdf.write_bytes(b"%PDF-1.4 same bytes")
+
+    rule_cache.pdf_rules(str(pdf), "technical")
+    rule_cache.pdf_rules(str(pdf), "technical")
+    assert len(calls) == 1
+
+    # a fresh worker process (empty in-memory cache) reads the parsed rules from disk
+    rule_cache.pdf_rules_cache.clear()
+    assert rule_cache.pdf_rules(str(pdf), "technical") == [{"rule_id": "T1"}]
+    assert len(calls) == 1
+
+
+def test_worker_parent_warms_plans_before_forking(tmp_path, monkeypatch):
+    import redis
+    from rq import Worker
+    from rq.job import Job
+    from app.pipeline import worker
+
+    monkeypatch.setattr(static_eval, "RULES_DIR", str(tmp_path))
+    rule_cache.invalidate()
+    (tmp_path / "acme_technical.json").write_text(json.dumps({"paid_threshold": 500}))
+    assert rule_cache.rule_tenants() == ["acme"]
+
+    forked = []
+    monkeypatch.setattr(Worker, "fork_work_horse", lambda self, job, queue: forked.append(job.func_name))
+    parent = object.__new__(worker.PlanCachingWorker)   # Worker.__init__ would connect to Redis
+    job = Job.create(worker.run_validation, args=("job-1", "other"), connection=redis.Redis())
+    parent.fork_work_horse(job, None)
+
+    assert forked == ["app.pipeline.worker.run_validation"]
+    # the forked job finds both the file tenant and its own tenant compiled
+    assert set(rule_cache._plans) == {"acme", "other"}
+    assert rule_cache.get_plan("acme").paid_threshold == 500.0
+    rule_cache.invalidate()
@@ -1,5 +1,5 @@
 import pytest
-from app.pipeline.static_eval import evaluate_claim, load_rules
+from app.pipeline.static_eval import evaluate_claim, load_rules, RulePlan
 
 def test_paid_amount_rule(tmp_path):
     rules = {
@@ -22,3 +22,67 @@ def test_paid_amount_rule(tmp_path):
     errors = evaluate_claim(claim, rules)
     assert len(errors) == 1
     assert errors[0]["rule_id"] == "T001"
+
+
+def test_declarative_ops_and_index():
+    rules = {
+        "technical": [],
+        "medical": [
+            {"rule_id": "M1", "field": "service_code", "op": "==", "value": "XRAY",
+             "conditions": [{"field": "diagnosis_codes", "op": "not_in", "value": ["R93"]}],
+             "message": "X-Ray missing diagnosis", "recommendation": "Add R93"},
+            {"rule_id": "M2", "field": "diagnosis_codes", "op": "in", "value": ["A01", "B02"],
+             "message": "Needs documentation", "recommendation": "Attach report"},
+            {"rule_id": "M3", "field": "diagnosis_codes", "op": "conflict_pair",
+             "value": {"a": ["E66.9"], "b": ["E66.3"]},
+             "message": "Conflicting diagnoses", "recommendation": "Fix diagnoses"},
+            {"rule_id": "M4", "field": "service_code", "op": "in", "value": ["SRV1"], "enabled": False,
+             "message": "disabled", "recommendation": ""},
+        ],
+    }
+    plan = RulePlan(rules)
+    # only M1 is indexed under XRAY; M2 under its diagnoses; M3 is always scanned
+    assert [r.rule_id for r in plan.engine.candidates({"service_code": "XRAY", "diagnosis_codes": frozenset()})] == ["M1", "M3"]
+
+    claim = {"service_code": "xray", "diagnosis_codes": "a01;E66.9;E66.3"}
+    assert [e["rule_id"] for e in evaluate_claim(claim, plan)] == ["M1", "M2", "M3"]
+    assert evaluate_claim({"service_code": "XRAY", "diagnosis_codes": "R93"}, plan) == []
+
+
+def test_load_rules_keeps_declarative_lists():
+    rules = load_rules("default")
+    assert [r["rule_id"] for r in rules["technical"]["rules"]] == ["TECH001", "TECH002"]
+    assert "approval_services" in rules["technical"]
+
+
+def test_default_tenant_reports_each_violation_once():
+    plan = RulePlan(load_rules("default"))
+    # TECH001 / TECH002 restate the built-in threshold and unique_id checks; MED001 / MED002 are new
+    assert [r["rule_id"] for r in plan.declarative["technical"]] == []
+    assert [r["rule_id"] for r in plan.declarative["medical"]] == ["MED001", "MED002"]
+
+    claim = {"claim_id": "C1", "national_id": "A1B2C3D4", "member_id": "EFGH5678", "facility_id": "OCQUMGDW",
+             "unique_id": None, "diagnosis_codes": "A01", "service_code": "SRV2003", "paid_amount_aed": 900,
+             "approval_number": None, "encounter_type": "OUTPATIENT"}
+    rule_ids = [e["rule_id"] for e in plan.evaluate(claim)]
+    assert rule_ids == ["TECH_UNIQUEID_MISSING", "TECH_PAID_THRESHOLD_APPROVAL", "MED001"]
+
+
+def test_pdf_rules_restating_built_in_checks_are_dropped():
+    pdf_rules = {
+        "technical": {"rules": [
+            {"rule_id": "TECH_PAID_GT_250", "field": "paid_amount_aed", "op": ">", "value": 250},
+            {"rule_id": "TECH_PAID_GT_1000", "field": "paid_amount_aed", "op": ">", "value": 1000},
+            {"rule_id": "TECH_SRV1001_REQUIRES_APPROVAL", "field": "service_code", "op": "==", "value": "SRV1001"},
+        ]},
+        "medical": {"rules": [
+            {"rule_id": "MED_SRV2007_REQUIRES_DX", "field": "service_code", "op": "==", "value": "SRV2007"},
+            {"rule_id": "MED_MUTUAL_E11.9_R73.03", "field": "diagnosis_codes", "op": "conflict_pair",
+             "value": {"a": ["E11.9"], "b": ["R73.03"]}},
+        ]},
+    }
+    plan = RulePlan(pdf_rules)
+    assert [r["rule_id"] for r in plan.declarative["technical"]] == ["TECH_PAID_GT_1000"]
+    assert plan.declarative["medical"] == []
+    # without the built-in checks (a bare list) nothing is dropped
+    assert len(RulePlan({"technical": pdf_rules["technical"]["rules"], "medical": []}).engine) == 3
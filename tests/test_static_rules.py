@@ -1,5 +1,5 @@
 # tests/test_static_rules.py
-from app.pipeline.static_eval import evaluate_claim, load_rules
+from app.pipeline.static_eval import evaluate_claim, evaluate_frame, load_rules, RulePlan
 
 def test_unique_id_mismatch():
     # national/member/facility produce expected unique id parts
@@ -35,3 +35,47 @@ def test_service_requires_diagnosis():
     rules = load_rules("default")
     errors = evaluate_claim(claim, rules)
     assert any("MED_SERVICE_SRV2007_MISSING_REQUIRED_DIAG" == e['rule_id'] for e in errors)
+
+def test_rule_plan_is_reusable():
+    claim = {
+        "claim_id": "C3",
+        "national_id": "A1B2C3D4",
+        "member_id": "EFGH5678",
+        "facility_id": "OCQUMGDW",
+        "unique_id": "A1B2-GH56-MGDW",
+        "diagnosis_codes": "",
+        "service_code": "SRV2007",
+        "paid_amount_aed": 100,
+        "approval_number": None,
+        "encounter_type": "OUTPATIENT"
+    }
+    plan = RulePlan(load_rules("default"))
+    first = plan.evaluate(claim)
+    # mutating returned errors must not leak into later evaluations
+    for e in first:
+        e["message"] += " (edited)"
+    assert plan.evaluate(claim) == evaluate_claim(claim, load_rules("default"))
+
+def test_evaluate_frame_matches_evaluate_claim():
+    import pandas as pd
+    claims = [
+        {"claim_id": "C4", "national_id": "AB12XXXX", "member_id": "12CDEFGH", "facility_id": "9XYZ",
+         "unique_id": "AB12-CDE1-9XYZ", "diagnosis_codes": "R73.03;E11.9", "service_code": "SRV1001",
+         "paid_amount_aed": 300, "approval_number": None, "encounter_type": "OUTPATIENT"},
+        {"claim_id": "c5", "national_id": None, "member_id": "EFGH5678", "facility_id": "2XKSZK4T",
+         "unique_id": None, "diagnosis_codes": "", "service_code": "SRV2001",
+         "paid_amount_aed": 10, "approval_number": "APP001", "encounter_type": None},
+        # integer amount: both paths print it as 9000.0
+        {"claim_id": "C6", "national_id": "A1B2C3D4", "member_id": "EFGH5678", "facility_id": "OCQUMGDW",
+         "unique_id": "A1B2-GH56-MGDW", "diagnosis_codes": "", "service_code": "SRV2003",
+         "paid_amount_aed": 9000, "approval_number": None, "encounter_type": "OUTPATIENT"},
+    ]
+    rules = load_rules("default")
+    expected = [
+        (c["claim_id"], e["rule_id"], e["category"], e["message"], e["recommendation"])
+        for c in claims for e in evaluate_claim(c, rules)
+    ]
+    table = evaluate_frame(pd.DataFrame(claims), rules)
+    assert list(table.itertuples(index=False, name=None)) == expected
+    assert "Paid amount AED 9000.0 exceeds threshold AED 250.0 and no valid approval number present." in \
+        [e[3] for e in expected if e[0] == "C6"]
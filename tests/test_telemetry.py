@@ -0,0 +1,74 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.utils import telemetry
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hash = {}
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        return []
+
+    def hincrbyfloat(self, key, field, value):
+        self.hash[field] = self.hash.get(field, 0.0) + value
+
+    def hgetall(self, key):
+        return {k.encode(): repr(v).encode() for k, v in self.hash.items()}
+
+
+def _lines(text, prefix):
+    return [line for line in text.splitlines() if line.startswith(prefix)]
+
+
+def test_histogram_exposition_is_cumulative():
+    h = telemetry.Histogram("test_latency_seconds", "Test.", ("op",), buckets=(0.1, 1.0))
+    child = h.labels(op="read")
+    for v in (0.05, 0.5, 5.0):
+        child.observe(v)
+
+    text = telemetry.render(include_pushed=False)
+    assert "# TYPE test_latency_seconds histogram" in text
+    assert _lines(text, "test_latency_seconds") == [
+        'test_latency_seconds_bucket{op="read",le="0.1"} 1.0',
+        'test_latency_seconds_bucket{op="read",le="1.0"} 2.0',
+        'test_latency_seconds_bucket{op="read",le="+Inf"} 3.0',
+        'test_latency_seconds_sum{op="read"} 5.55',
+        'test_latency_seconds_count{op="read"} 3.0',
+    ]
+
+
+def test_worker_push_drains_and_render_merges(monkeypatch):
+    monkeypatch.setattr(telemetry, "_push_paused_until", 0.0)  # earlier tests ran without Redis
+    conn = FakeRedis()
+    c = telemetry.Counter("test_failures_total", "Test.", ("reason",))
+    c.labels("timeout").inc(2)
+    telemetry.push(conn)          # a worker
+    c.labels("timeout").inc()     # the API process itself
+
+    assert c.samples(drain=True) == {('reason="timeout"', "", ""): 1.0}
+    c.labels("timeout").inc()
+    text = telemetry.render(conn)
+    assert 'test_failures_total{reason="timeout"} 3.0' in text
+
+
+def test_request_timer_labels_by_route_template():
+    app = FastAPI()
+    app.add_middleware(telemetry.RequestTimer)
+
+    @app.get("/items/{item_id}")
+    def item(item_id: str):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/nope")
+
+    samples = telemetry.HTTP_REQUEST_SECONDS.samples()
+    assert samples[('method="GET",route="/items/{item_id}",status="200"', "_count", "")] == 2
+    assert samples[('method="GET",route="unmatched",status="404"', "_count", "")] == 1
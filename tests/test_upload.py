@@ -0,0 +1,126 @@
+import asyncio
+import io
+import json
+import os
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app import models
+from app.pipeline import rule_cache, static_eval, worker
+from app.pipeline.ingest import REQUIRED_COLUMNS
+from app.routes import upload
+from app.utils.concurrency import run_blocking
+
+
+def test_run_blocking_keeps_event_loop_responsive():
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        result = await run_blocking(lambda s: (time.sleep(s), "done")[1], 0.2)
+        task.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(scenario())
+    assert result == "done"
+    assert ticks >= 5
+
+
+class _RecordingQueue:
+    def __init__(self):
+        self.calls = []
+
+    def enqueue(self, func, *args, **kwargs):
+        self.calls.append((func, args, kwargs))
+
+
+def _files(header):
+    row = ["C1", "OUTPATIENT", "2024-01-02", "A1B2C3D4", "EFGH5678", "OCQUMGDW",
+           "A1B2-GH56-MGDW", "E11.9", "SRV2007", "250.50", ""]
+    csv_bytes = (",".join(header) + "\n" + ",".join(row[:len(header)])).encode()
+    rules = json.dumps([{"rule_id": "T1", "field": "service_code", "op": "==", "value": "SRV9"}]).encode()
+    return {
+        "claims": ("claims.csv", io.BytesIO(csv_bytes)),
+        "technical": ("technical.json", io.BytesIO(rules)),
+        "medical": ("medical.json", io.BytesIO(rules)),
+    }
+
+
+def _accept(monkeypatch, tmp_path, header, tenant="acme"):
+    """POST the upload; returns (response, enqueued run_ingestion args)."""
+    monkeypatch.setattr(upload, "STAGING_DIR", str(tmp_path / "staging"))
+    q = _RecordingQueue()
+    monkeypatch.setattr(upload, "queue", q)
+
+    app = FastAPI()
+    app.include_router(upload.router, prefix="/api")
+    resp = TestClient(app).post("/api/upload", files=_files(header), data={"tenant": tenant})
+    assert len(q.calls) == 1
+    func, args, kwargs = q.calls[0]
+    assert func is worker.run_ingestion
+    assert kwargs["job_id"] == resp.json()["job_id"]
+    return resp, args
+
+
+def _worker_db(monkeypatch, tmp_path, session_factory):
+    Session = session_factory()
+    monkeypatch.setattr(worker, "SessionLocal", Session)
+    monkeypatch.setattr(static_eval, "RULES_DIR", str(tmp_path / "rules"))
+    (tmp_path / "rules").mkdir()
+    rule_cache.invalidate()
+    validations = []
+    monkeypatch.setattr(worker, "enqueue_validation", lambda db, q, job_id, tenant: validations.append(job_id))
+    return Session, validations
+
+
+def test_upload_is_accepted_then_ingested_in_the_job(monkeypatch, tmp_path, session_factory):
+    resp, args = _accept(monkeypatch, tmp_path, REQUIRED_COLUMNS)
+    assert resp.status_code == 202
+    job_id = resp.json()["job_id"]
+    claims_path = args[2]
+    assert claims_path.endswith(".csv") and os.path.exists(claims_path)
+
+    Session, validations = _worker_db(monkeypatch, tmp_path, session_factory)
+    result = worker.run_ingestion(*args)
+    assert result["inserted"] == 1
+    assert validations == [job_id]
+    assert Session().get(models.MasterClaim, "C1").job_id == job_id
+    assert (tmp_path / "rules" / "acme_technical.json").exists()
+    assert not os.path.exists(os.path.dirname(claims_path))  # staging cleaned up
+
+
+def test_schema_error_reported_by_ingestion_job(monkeypatch, tmp_path, session_factory):
+    resp, args = _accept(monkeypatch, tmp_path, REQUIRED_COLUMNS[:3])
+    assert resp.status_code == 202
+
+    Session, validations = _worker_db(monkeypatch, tmp_path, session_factory)
+    result = worker.run_ingestion(*args)
+    assert result["error"] == "schema_missing"
+    assert "paid_amount_aed" in result["missing_columns"]
+    assert validations == []
+    placeholders = Session().query(models.MasterClaim).filter(models.MasterClaim.claim_id.like("UPLOAD_SCHEMA_ERROR_%"))
+    assert placeholders.count() == 1
+
+
+def test_rule_update_is_accepted_with_one_rules_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(upload, "STAGING_DIR", str(tmp_path / "staging"))
+    q = _RecordingQueue()
+    monkeypatch.setattr(upload, "queue", q)
+    app = FastAPI()
+    app.include_router(upload.router, prefix="/api")
+    client = TestClient(app)
+
+    assert client.post("/api/rules", data={"tenant": "acme"}).status_code == 400
+    resp = client.post("/api/rules", files={"medical": _files(REQUIRED_COLUMNS)["medical"]}, data={"tenant": "acme"})
+    assert resp.status_code == 202
+    func, args, kwargs = q.calls[0]
+    assert func.__name__ == "run_rule_update"
+    assert args[:3] == (resp.json()["job_id"], "acme", None)
+    assert os.path.exists(args[3])
@@ -0,0 +1,148 @@
+import pytest
+
+from app import models
+from app.pipeline import worker
+
+
+def test_run_validation_processes_pending_claims_in_chunks(session_factory, make_claim, monkeypatch):
+    Session = session_factory()
+    monkeypatch.setattr(worker, "SessionLocal", Session)
+    monkeypatch.setattr(worker, "VALIDATION_CHUNK_SIZE", 2)
+
+    db = Session()
+    db.add_all([make_claim(f"C{i}") for i in range(4)])
+    db.add(make_claim("BAD", paid_amount_aed=5000.0, approval_number=None))
+    db.add(make_claim("DONE", status="Validated"))
+    db.commit()
+
+    chunks = []
+    real_write = worker._write_chunk
+    monkeypatch.setattr(worker, "_write_chunk", lambda s, u, *rest: (chunks.append(len(u)), real_write(s, u, *rest)))
+
+    summary = worker.run_validation("job-1", "default")
+    assert chunks == [2, 2, 1]
+    assert summary["processed"] == 5
+    assert summary["not_validated"] >= 1
+
+    db.expire_all()
+    bad = db.get(models.MasterClaim, "BAD")
+    assert bad.status == "Not validated"
+    assert bad.error_explanation
+    errors = db.query(models.ClaimError).filter_by(claim_id="BAD").all()
+    assert len(errors) == len(bad.error_explanation)
+    assert db.query(models.MasterClaim).filter_by(status="Pending").count() == 0
+    assert db.query(models.ClaimMetrics).count() > 0
+
+    # re-validating replaces a claim's error rows instead of piling up duplicates
+    bad.status = "Pending"
+    bad.job_id = "job-2"
+    db.commit()
+    worker.run_validation("job-2", "default")
+    assert db.query(models.ClaimError).filter_by(claim_id="BAD").count() == len(errors)
+
+
+def test_shards_cover_pending_claims_and_reducer_merges(session_factory, make_claim, monkeypatch):
+    Session = session_factory()
+    monkeypatch.setattr(worker, "SessionLocal", Session)
+
+    db = Session()
+    db.add_all([make_claim(f"C{i:02d}") for i in range(10)])
+    db.add(make_claim("C99", paid_amount_aed=5000.0, approval_number=None))
+    db.commit()
+
+    bounds = worker.shard_bounds(db, "job-1", "default", shards=3, min_size=2)
+    assert len(bounds) == 3
+    assert bounds[0][0] is None and bounds[-1][1] is None
+    assert all(a[1] == b[0] for a, b in zip(bounds, bounds[1:]))
+
+    results = [worker.run_validation_shard("job-1", "default", lo, hi) for lo, hi in bounds]
+    assert sum(r["processed"] for r in results) == 11
+    assert db.query(models.MasterClaim).filter_by(status="Pending").count() == 0
+
+    metas = []
+    monkeypatch.setattr(worker, "_set_meta", lambda job_id=None, **fields: metas.append((job_id, fields)))
+    monkeypatch.setattr(worker, "_shard_results", lambda ids: results + [None])
+    summary = worker.reduce_validation("job-1", "default", ["a", "b", "c", "d"])
+    assert summary["processed"] == 11
+    assert summary["failed_shards"] == 1
+    assert metas[-1][0] == "job-1" and metas[-1][1]["stage"] == "partial"
+
+    monkeypatch.setattr(worker, "_shard_results", lambda ids: results)
+    worker.reduce_validation("job-1", "default", ["a", "b", "c"])
+    assert metas[-1][1]["stage"] == "complete"
+    monkeypatch.setattr(worker, "_shard_results", lambda ids: [None, None])
+    worker.reduce_validation("job-1", "default", ["a", "b"])
+    assert metas[-1][1]["stage"] == "failed"
+    assert sum(c["count"] for c in summary["categories"].values()) == 11
+    assert db.query(models.ClaimMetrics).count() > 0
+
+
+def test_failed_validation_marks_the_job_failed_and_raises(session_factory, monkeypatch):
+    Session = session_factory()
+    monkeypatch.setattr(worker, "SessionLocal", Session)
+    metas = []
+    monkeypatch.setattr(worker, "_set_meta", lambda job_id=None, **fields: metas.append((job_id, fields)))
+
+    def broken_plan(tenant):
+        raise RuntimeError("rules unreadable")
+
+    monkeypatch.setattr(worker, "get_plan", broken_plan)
+    with pytest.raises(RuntimeError):
+        worker.run_validation("job-1", "default")
+    assert metas == [("job-1", {"stage": "failed", "error": "rules unreadable"})]
+
+    with pytest.raises(RuntimeError):
+        worker.run_validation_shard("job-1", "default", None, "C5")
+    assert metas[-1] == (None, {"stage": "failed", "error": "rules unreadable"})
+
+
+class _RecordingQueue:
+    def __init__(self):
+        self.calls = []
+
+    def enqueue(self, func, *args, **kwargs):
+        self.calls.append((func, args, kwargs))
+        return type("FakeJob", (), {"id": kwargs.get("job_id")})()
+
+
+def test_enqueue_validation_fans_out_with_dependent_reducer(session_factory, make_claim, monkeypatch):
+    Session = session_factory()
+    db = Session()
+    db.add_all([make_claim(f"C{i:02d}", job_id=None) for i in range(6)])
+    db.commit()
+
+    q = _RecordingQueue()
+    job = worker.enqueue_validation(db, q, "job-1", "default")
+    assert job.id == "job-1-validate"
+    assert [c[0] for c in q.calls] == [worker.run_validation]
+    assert q.calls[0][2]["job_timeout"] == worker.VALIDATION_JOB_TIMEOUT
+
+    monkeypatch.setattr(worker, "VALIDATION_SHARDS", 3)
+    monkeypatch.setattr(worker, "VALIDATION_SHARD_MIN", 2)
+    db.query(models.MasterClaim).update({"job_id": "job-2"})
+    db.commit()
+    q = _RecordingQueue()
+    job = worker.enqueue_validation(db, q, "job-2", "default")
+    assert job.id == "job-2-reduce"
+    assert [c[0] for c in q.calls] == [worker.run_validation_shard] * 3 + [worker.reduce_validation]
+    assert all(c[2]["job_timeout"] == worker.VALIDATION_JOB_TIMEOUT for c in q.calls)
+    reducer_kwargs = q.calls[-1][2]
+    assert q.calls[-1][1][0] == "job-2"
+    assert len(reducer_kwargs["depends_on"].dependencies) == 3
+
+
+def test_jobs_only_validate_their_own_claims(session_factory, make_claim, monkeypatch):
+    Session = session_factory()
+    monkeypatch.setattr(worker, "SessionLocal", Session)
+
+    db = Session()
+    db.add(make_claim("MINE", job_id="job-1", tenant="acme"))
+    db.add(make_claim("OTHER_JOB", job_id="job-2", tenant="acme"))
+    db.add(make_claim("OTHER_TENANT", job_id="job-1", tenant="globex"))
+    db.commit()
+
+    assert worker.run_validation("job-1", "acme")["processed"] == 1
+    db.expire_all()
+    assert db.get(models.MasterClaim, "MINE").status != "Pending"
+    assert db.get(models.MasterClaim, "OTHER_JOB").status == "Pending"
+    assert db.get(models.MasterClaim, "OTHER_TENANT").status == "Pending"